@@ -0,0 +1,260 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+import os
+import json
+import time
+import socket
+import threading
+import http.client
+from maps_common import clients
+
+# Refresh the cached API key this many seconds before AppSync expires it
+KEY_EXPIRY_MARGIN = 300
+# Number of times a request is replayed on a fresh connection after a reset
+MAX_RETRIES = 2
+REQUEST_TIMEOUT = 30
+# Connections idle for longer are reopened before sending, as the server may have
+# closed them and a mutation that fails after it was sent is not replayed
+CONNECTION_IDLE_TIMEOUT = 30
+# Items per batch mutation, the limit the batch resolvers accept
+MUTATION_BATCH_SIZE = 25
+
+ASSET_FIELDS = 'bucketObjKey videoCodec audioCodec fileFormat fileLength frameRate frameCount numAudioTracks numVideoTracks fileSize thumbnailLoc proxyLoc fileStatus editUser prefixLoc assetId lastModifiedDate creationDate'
+
+CREATE_ASSET_MUTATION = 'mutation($in:CreateMAPSAssetsInput!){createMAPSAssets(input:$in){bucketObjKey assetId creationDate lastModifiedDate fileSize fileStatus editUser prefixLoc}}'
+UPDATE_ASSET_MUTATION = 'mutation($in:UpdateMAPSAssetsInput!){updateMAPSAssets(input:$in){' + ASSET_FIELDS + '}}'
+BATCH_CREATE_ASSETS_MUTATION = 'mutation($in:[CreateMAPSAssetsInput!]!){batchCreateMAPSAssets(input:$in){' + ASSET_FIELDS + '}}'
+BATCH_UPDATE_ASSETS_MUTATION = 'mutation($in:[UpdateMAPSAssetsInput!]!){batchUpdateMAPSAssets(input:$in){' + ASSET_FIELDS + '}}'
+BATCH_DELETE_ASSETS_MUTATION = 'mutation($in:[DeleteMAPSAssetsInput!]!){batchDeleteMAPSAssets(input:$in){' + ASSET_FIELDS + '}}'
+
+def get_prefix_loc(key):
+    """Folder of an object key as stored in prefixLoc, '/' for the bucket root."""
+    prefixLoc = key.rsplit('/', 1)[0]
+    if key.count('/') == 0:
+        prefixLoc = '/'
+    elif prefixLoc[-1] != '/':
+        prefixLoc += '/'
+    return prefixLoc
+
+_RETRYABLE_ERRORS = (
+    ConnectionError,
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    http.client.ResponseNotReady,
+    http.client.BadStatusLine,
+    socket.timeout
+)
+
+class AppSyncClient:
+    """
+    GraphQL client for the MAPS AppSync API.
+
+    Keeps one keep-alive HTTPS connection per thread so warm invocations
+    reuse the TLS session, and caches the API key until shortly before it
+    expires instead of calling ListApiKeys for every mutation.
+    """
+
+    def __init__(self, api_id, url, appsync_client=None):
+        self.api_id = api_id
+        self.host = url.replace('https://', '').replace('/graphql', '')
+        self.appsync_client = appsync_client or clients.get_client('appsync')
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._api_key = None
+        self._api_key_expires = 0
+        self._stats = {
+            'requests': 0,
+            'errors': 0,
+            'retries': 0,
+            'connections': 0,
+            'keyRefreshes': 0,
+            'totalLatencyMs': 0.0,
+            'maxLatencyMs': 0.0
+        }
+
+    def _incr(self, counter, amount=1):
+        with self._lock:
+            self._stats[counter] += amount
+
+    def get_api_key(self, force_refresh=False):
+        with self._lock:
+            if not force_refresh and self._api_key and time.time() < self._api_key_expires - KEY_EXPIRY_MARGIN:
+                return self._api_key
+
+            # Prefer the key that stays valid the longest
+            best_key = None
+            params = {'apiId': self.api_id, 'maxResults': 25}
+            while True:
+                resp = self.appsync_client.list_api_keys(**params)
+                for key in resp['apiKeys']:
+                    if best_key is None or key.get('expires', 0) > best_key.get('expires', 0):
+                        best_key = key
+                if not resp.get('nextToken'):
+                    break
+                params['nextToken'] = resp['nextToken']
+
+            if best_key is None:
+                raise RuntimeError(f'No API keys found for AppSync API {self.api_id}')
+
+            self._api_key = best_key['id']
+            self._api_key_expires = best_key.get('expires', 0)
+            self._stats['keyRefreshes'] += 1
+            return self._api_key
+
+    def _get_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and time.monotonic() - self._local.lastUsed > CONNECTION_IDLE_TIMEOUT:
+            self._reset_connection()
+            conn = None
+        if conn is None:
+            conn = http.client.HTTPSConnection(self.host, 443, timeout=REQUEST_TIMEOUT)
+            self._local.conn = conn
+            self._local.lastUsed = time.monotonic()
+            self._incr('connections')
+        return conn
+
+    def _reset_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def _post(self, body, api_key, idempotent=True):
+        headers = {
+            'Content-type': 'application/graphql',
+            'x-api-key': api_key,
+            'host': self.host
+        }
+
+        attempt = 0
+        while True:
+            conn = self._get_connection()
+            sent = False
+            try:
+                conn.request('POST', '/graphql', body, headers)
+                sent = True
+                response = conn.getresponse()
+                result = response.status, response.read().decode('utf-8')
+                self._local.lastUsed = time.monotonic()
+                return result
+            except _RETRYABLE_ERRORS as e:
+                # The server closed an idle keep-alive connection, reconnect and replay.
+                # A mutation that was sent may have been applied, so it is not replayed.
+                self._reset_connection()
+                if attempt >= MAX_RETRIES or (sent and not idempotent):
+                    raise e
+                attempt += 1
+                self._incr('retries')
+
+    def execute(self, query, variables=None, idempotent=None):
+        """
+        Run a GraphQL operation and return the decoded response body. Mutations are
+        only replayed when the request never reached the server, unless idempotent is set.
+        """
+        body = json.dumps({'query': query, 'variables': variables or {}})
+        if idempotent is None:
+            idempotent = not query.lstrip().startswith('mutation')
+
+        start = time.perf_counter()
+        try:
+            status, response_string = self._post(body, self.get_api_key(), idempotent)
+            if status == 401:
+                # Key was rotated or deleted before its advertised expiry
+                status, response_string = self._post(body, self.get_api_key(force_refresh=True), idempotent)
+        except Exception:
+            self._incr('errors')
+            raise
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._stats['requests'] += 1
+                self._stats['totalLatencyMs'] += elapsed
+                self._stats['maxLatencyMs'] = max(self._stats['maxLatencyMs'], elapsed)
+
+        result = json.loads(response_string)
+        if result.get('errors'):
+            self._incr('errors')
+        return result
+
+    def execute_batch(self, mutation, inputs, batch_size=MUTATION_BATCH_SIZE):
+        """
+        Run a batch mutation over inputs in chunks of batch_size, retrying the items DynamoDB
+        left unprocessed. Returns a dict of input index -> error message for the items that failed.
+        """
+        failures = {}
+        for start in range(0, len(inputs), batch_size):
+            pending = list(range(start, min(start + batch_size, len(inputs))))
+            attempt = 0
+            while pending:
+                try:
+                    result = self.execute(mutation, { 'in': [inputs[i] for i in pending] })
+                except Exception as e:
+                    for i in pending:
+                        failures[i] = str(e)
+                    break
+
+                # Rejected and unprocessed items are listed by key in the error info
+                byKey = { inputs[i]['bucketObjKey']: i for i in pending }
+                unprocessed = []
+                for error in result.get('errors') or []:
+                    keys = (error.get('errorInfo') or {}).get('bucketObjKeys')
+                    if keys is None:
+                        for i in pending:
+                            failures[i] = error.get('message')
+                        unprocessed = []
+                        break
+                    for key in keys:
+                        if key not in byKey:
+                            continue
+                        if error.get('errorType') == 'UnprocessedItems':
+                            unprocessed.append(byKey[key])
+                        else:
+                            failures[byKey[key]] = error.get('message')
+
+                if unprocessed and attempt >= MAX_RETRIES:
+                    for i in unprocessed:
+                        failures[i] = 'Unprocessed after {} retries'.format(attempt)
+                    break
+                if unprocessed:
+                    attempt += 1
+                    self._incr('retries')
+                    time.sleep(0.1 * (2 ** attempt))
+                pending = unprocessed
+        return failures
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['avgLatencyMs'] = stats['totalLatencyMs'] / stats['requests'] if stats['requests'] else 0.0
+        return stats
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(api_id=None, url=None):
+    """Return the container-wide client for the API, creating it on first use."""
+    api_id = api_id or os.environ['GQL_API_ID']
+    url = url or os.environ['GQL_URL']
+
+    with _clients_lock:
+        client = _clients.get((api_id, url))
+        if client is None:
+            client = AppSyncClient(api_id, url)
+            _clients[(api_id, url)] = client
+        return client
@@ -0,0 +1,154 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+import os
+import threading
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# Connections pooled per client unless the caller asks for more to match its worker count
+DEFAULT_POOL_CONNECTIONS = 10
+# Retries after the first attempt, paced by the adaptive mode's client-side rate limiter
+MAX_RETRIES = 4
+
+# (connect, read) timeouts in seconds. botocore waits 60 seconds for both, which
+# lets one slow call hold a worker for most of a Lambda invocation
+DEFAULT_TIMEOUTS = (5, 60)
+SERVICE_TIMEOUTS = {
+    'dynamodb': (2, 10),
+    'ssm': (3, 15),
+    'cognito-idp': (3, 10),
+    'appsync': (3, 10),
+    'ec2': (3, 15),
+    'lambda': (3, 30),
+    'mediaconvert': (3, 30),
+    's3': (3, 60)
+}
+SERVICE_CONFIG = {
+    's3': Config(signature_version='s3v4')
+}
+
+# SSM parameter the account's MediaConvert endpoint is saved in, so new containers skip DescribeEndpoints
+MEDIACONVERT_ENDPOINT_PARAMETER = 'maps-mediaconvert-endpoint-{}'
+
+_clients = {}
+_clients_lock = threading.Lock()
+# (event name, handler) registered on every client the factory builds
+_event_hooks = []
+_endpoint_lock = threading.Lock()
+
+def client_config(service, max_pool_connections=DEFAULT_POOL_CONNECTIONS):
+    connectTimeout, readTimeout = SERVICE_TIMEOUTS.get(service, DEFAULT_TIMEOUTS)
+    settings = {
+        'max_pool_connections': max_pool_connections,
+        'connect_timeout': connectTimeout,
+        'read_timeout': readTimeout,
+        'retries': { 'mode': 'adaptive', 'max_attempts': MAX_RETRIES }
+    }
+    try:
+        config = Config(tcp_keepalive=True, **settings)
+    except TypeError:
+        # botocore in the python3.7 runtime predates tcp_keepalive
+        config = Config(**settings)
+    if service in SERVICE_CONFIG:
+        config = config.merge(SERVICE_CONFIG[service])
+    return config
+
+def get_client(service, region_name=None, endpoint_url=None, max_pool_connections=None):
+    """
+    Return the container-wide boto3 client for (service, region, endpoint), creating it on first use.
+    A caller that needs more pooled connections than the cached client has gets a larger one.
+    """
+    region_name = region_name or os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION')
+    key = (service, region_name, endpoint_url)
+    poolSize = max_pool_connections or DEFAULT_POOL_CONNECTIONS
+
+    client = _clients.get(key)
+    if client is None or client.meta.config.max_pool_connections < poolSize:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None or client.meta.config.max_pool_connections < poolSize:
+                if client is not None:
+                    poolSize = max(poolSize, client.meta.config.max_pool_connections)
+                client = boto3.client(service, region_name=region_name, endpoint_url=endpoint_url,
+                    config=client_config(service, poolSize))
+                for eventName, handler in _event_hooks:
+                    client.meta.events.register(eventName, handler)
+                _clients[key] = client
+    return client
+
+def register_event_hook(event_name, handler):
+    """Register a botocore event handler on every client the factory has built or will build."""
+    with _clients_lock:
+        _event_hooks.append((event_name, handler))
+        for client in _clients.values():
+            client.meta.events.register(event_name, handler)
+
+def get_mediaconvert_endpoint(region_name=None):
+    """
+    Account endpoint for MediaConvert. It is looked up once per account and region: containers
+    read it from the environment, then from SSM, and only call DescribeEndpoints when neither has it.
+    """
+    endpoint = os.environ.get('MEDIACONVERT_ENDPOINT')
+    if endpoint:
+        return endpoint
+
+    with _endpoint_lock:
+        endpoint = os.environ.get('MEDIACONVERT_ENDPOINT')
+        if endpoint:
+            return endpoint
+
+        parameter = MEDIACONVERT_ENDPOINT_PARAMETER.format(os.environ.get('ENV', 'default'))
+        ssm = get_client('ssm', region_name)
+        try:
+            endpoint = ssm.get_parameter(Name=parameter)['Parameter']['Value']
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ParameterNotFound':
+                print("Unable to read MediaConvert endpoint from {}: {}".format(parameter, e))
+
+        if not endpoint:
+            response = get_client('mediaconvert', region_name).describe_endpoints(MaxResults=1)
+            endpoint = response['Endpoints'][0]['Url']
+            try:
+                ssm.put_parameter(Name=parameter, Value=endpoint, Type='String', Overwrite=True)
+            except ClientError as e:
+                print("Unable to save MediaConvert endpoint to {}: {}".format(parameter, e))
+
+        os.environ['MEDIACONVERT_ENDPOINT'] = endpoint
+        return endpoint
+
+def get_mediaconvert_client(region_name=None, max_pool_connections=None):
+    return get_client('mediaconvert', region_name, get_mediaconvert_endpoint(region_name), max_pool_connections)
+
+class LazyClient:
+    """
+    Stand-in for a boto3 client that is only created when one of its
+    methods is first used. Modules can keep a module-level client without
+    every cold start paying for clients the invoked route never calls.
+    """
+
+    def __init__(self, service, region_name=None, max_pool_connections=None):
+        self.service = service
+        self.region_name = region_name
+        self.max_pool_connections = max_pool_connections
+
+    def __getattr__(self, name):
+        return getattr(get_client(self.service, self.region_name, max_pool_connections=self.max_pool_connections), name)
+
+    def __repr__(self):
+        return '<LazyClient {}>'.format(self.service)
@@ -0,0 +1,298 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+import os
+import time
+import threading
+from maps_common.clients import LazyClient
+from collections import OrderedDict
+
+DEFAULT_TTL = 60
+DEFAULT_MAX_ENTRIES = 10000
+BATCH_GET_LIMIT = 100
+BATCH_GET_MAX_RETRIES = 5
+
+def has_group_access(userGroups, permissionGroups):
+    for group in permissionGroups or []:
+        if group in userGroups:
+            return True
+    return False
+
+class FolderPermissionCache:
+    """
+    Bounded LRU cache of (bucket, folderKey) -> permission groups read from
+    the folder permissions table. Entries expire after ttl seconds. A folder
+    that is not tracked is cached as None so repeated misses stay cheap.
+
+    With snapshot_buckets enabled, the first miss in a bucket loads the whole
+    bucket partition with one paginated Query. While that snapshot is fresh
+    and complete, a key that is not in the cache is known not to exist. A
+    bucket with more rows than the cache holds is remembered as too large for
+    ttl seconds, and its misses are read one key at a time instead.
+
+    Invalidation only reaches the container that made the change. Other
+    containers keep serving the old groups until their entries expire, so
+    ttl bounds how long a revoked group keeps access.
+    """
+
+    def __init__(self, table, ddb_client=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, snapshot_buckets=False):
+        self.table = table
+        self.ddb_client = ddb_client or LazyClient('dynamodb')
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.snapshot_buckets = snapshot_buckets
+
+        self._entries = OrderedDict()
+        # bucket -> expiry time of a complete snapshot of its partition
+        self._snapshots = {}
+        # bucket -> time until which its partition is known not to fit in the cache
+        self._oversized = {}
+        self._lock = threading.RLock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'reads': 0,
+            'snapshotLoads': 0,
+            'oversizedBuckets': 0,
+            'evictions': 0,
+            'invalidations': 0
+        }
+
+    def _store(self, bucket, folderKey, groups, expires):
+        key = (bucket, folderKey)
+        self._entries[key] = (expires, groups)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            (evicted_bucket, _), _ = self._entries.popitem(last=False)
+            # The snapshot can no longer answer negative lookups for this bucket
+            self._snapshots.pop(evicted_bucket, None)
+            self._stats['evictions'] += 1
+
+    def put(self, bucket, folderKey, groups):
+        with self._lock:
+            self._store(bucket, folderKey, groups, time.monotonic() + self.ttl)
+
+    def prime(self, bucket, items):
+        """Cache raw permission table items that the caller already read."""
+        with self._lock:
+            expires = time.monotonic() + self.ttl
+            for item in items:
+                if 'permissionGroups' in item:
+                    groups = [group['S'] for group in item['permissionGroups']['L']]
+                    self._store(bucket, item['folderKey']['S'], groups, expires)
+
+    def _lookup(self, bucket, folderKey, now):
+        key = (bucket, folderKey)
+        cached = self._entries.get(key)
+        if cached is not None:
+            if cached[0] > now:
+                self._entries.move_to_end(key)
+                return True, cached[1]
+            del self._entries[key]
+
+        snapshot_expires = self._snapshots.get(bucket)
+        if snapshot_expires is not None:
+            if snapshot_expires > now:
+                return True, None
+            del self._snapshots[bucket]
+
+        return False, None
+
+    def get(self, bucket, folderKey):
+        """Return the permission groups for a folder, or None if it is not tracked."""
+        with self._lock:
+            found, groups = self._lookup(bucket, folderKey, time.monotonic())
+            if found:
+                self._stats['hits'] += 1
+                return groups
+            self._stats['misses'] += 1
+
+        if self.snapshot_buckets and self._should_snapshot(bucket):
+            self.load_bucket(bucket)
+            with self._lock:
+                found, groups = self._lookup(bucket, folderKey, time.monotonic())
+                if found:
+                    return groups
+
+        return self._read(bucket, folderKey)
+
+    def get_many(self, bucket, folderKeys):
+        """Return folderKey -> permission groups or None, reading every miss with BatchGetItem."""
+        found = {}
+        missing = []
+        with self._lock:
+            now = time.monotonic()
+            for folderKey in dict.fromkeys(folderKeys):
+                hit, groups = self._lookup(bucket, folderKey, now)
+                if hit:
+                    self._stats['hits'] += 1
+                    found[folderKey] = groups
+                else:
+                    self._stats['misses'] += 1
+                    missing.append(folderKey)
+
+        for i in range(0, len(missing), BATCH_GET_LIMIT):
+            found.update(self._read_many(bucket, missing[i:i + BATCH_GET_LIMIT]))
+        return found
+
+    def _read_many(self, bucket, folderKeys):
+        groups = { folderKey: None for folderKey in folderKeys }
+        request = {
+            self.table: {
+                'Keys': [{ 'bucket': { 'S': bucket }, 'folderKey': { 'S': folderKey } } for folderKey in folderKeys],
+                'ProjectionExpression': 'folderKey, permissionGroups'
+            }
+        }
+        retries = 0
+        while request:
+            resp = self.ddb_client.batch_get_item(RequestItems=request)
+            for item in resp['Responses'].get(self.table, []):
+                if 'permissionGroups' in item:
+                    groups[item['folderKey']['S']] = [group['S'] for group in item['permissionGroups']['L']]
+            request = resp.get('UnprocessedKeys')
+            if request:
+                if retries >= BATCH_GET_MAX_RETRIES:
+                    raise Exception('Unable to read folder permissions after {} retries'.format(retries))
+                time.sleep(min(0.05 * (2 ** retries), 1))
+                retries += 1
+
+        with self._lock:
+            self._stats['reads'] += 1
+            expires = time.monotonic() + self.ttl
+            for folderKey, folderGroups in groups.items():
+                self._store(bucket, folderKey, folderGroups, expires)
+        return groups
+
+    def _should_snapshot(self, bucket):
+        with self._lock:
+            expires = self._oversized.get(bucket)
+            if expires is None:
+                return True
+            if expires > time.monotonic():
+                return False
+            del self._oversized[bucket]
+            return True
+
+    def _read(self, bucket, folderKey):
+        resp = self.ddb_client.get_item(
+                TableName=self.table,
+                Key={
+                    "bucket": { 'S': bucket },
+                    "folderKey": { 'S': folderKey }
+                },
+                AttributesToGet=[
+                    'permissionGroups'
+                ]
+            )
+
+        try:
+            groups = [group['S'] for group in resp['Item']['permissionGroups']['L']]
+        except KeyError as e:
+            groups = None
+
+        with self._lock:
+            self._stats['reads'] += 1
+            self._store(bucket, folderKey, groups, time.monotonic() + self.ttl)
+        return groups
+
+    def load_bucket(self, bucket):
+        """
+        Load every permission row of a bucket with one paginated Query. A
+        partition that does not fit in the cache is not cached at all, and the
+        bucket is skipped by later misses until ttl passes.
+        """
+        params = {
+            'TableName': self.table,
+            'KeyConditionExpression': '#buck = :buckval',
+            'ProjectionExpression': 'folderKey, permissionGroups',
+            'ExpressionAttributeNames': { '#buck': 'bucket' },
+            'ExpressionAttributeValues': { ':buckval': { 'S': bucket } }
+        }
+
+        items = []
+        complete = True
+        while True:
+            response = self.ddb_client.query(**params)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            if len(items) >= self.max_entries:
+                complete = False
+                break
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        with self._lock:
+            self._stats['snapshotLoads'] += 1
+            if not complete or len(items) > self.max_entries:
+                # Priming part of the partition would only flush the rest of the cache
+                self._oversized[bucket] = time.monotonic() + self.ttl
+                self._stats['oversizedBuckets'] += 1
+                return len(items)
+            self.prime(bucket, items)
+            self._snapshots[bucket] = time.monotonic() + self.ttl
+        return len(items)
+
+    def has_access(self, userGroups, bucket, folderKey, default=False):
+        """True if any of the user's groups may access the folder, default if it is not tracked."""
+        groups = self.get(bucket, folderKey)
+        if groups is None:
+            return default
+        return has_group_access(userGroups, groups)
+
+    def invalidate(self, bucket=None, folderKey=None):
+        with self._lock:
+            self._stats['invalidations'] += 1
+            if bucket is None:
+                self._entries.clear()
+                self._snapshots.clear()
+                self._oversized.clear()
+            elif folderKey is None:
+                for key in [k for k in self._entries if k[0] == bucket]:
+                    del self._entries[key]
+                self._snapshots.pop(bucket, None)
+                self._oversized.pop(bucket, None)
+            else:
+                self._entries.pop((bucket, folderKey), None)
+                # Without its entry the snapshot would report the folder as untracked
+                self._snapshots.pop(bucket, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hitRate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_cache(table=None, snapshot_buckets=False):
+    """Return the container-wide permission cache for the table, creating it on first use."""
+    table = table or os.environ['PERMISSIONS_DB_TABLE']
+
+    with _caches_lock:
+        cache = _caches.get(table)
+        if cache is None:
+            cache = FolderPermissionCache(
+                table,
+                ttl=int(os.environ.get('PERMISSIONS_CACHE_TTL', DEFAULT_TTL)),
+                max_entries=int(os.environ.get('PERMISSIONS_CACHE_SIZE', DEFAULT_MAX_ENTRIES)),
+                snapshot_buckets=snapshot_buckets
+            )
+            _caches[table] = cache
+        return cache
@@ -0,0 +1,70 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+import os
+import time
+import threading
+from botocore.exceptions import ClientError
+from maps_common import clients
+
+# Asset rows are indexed by "<bucket>:<prefixLoc>" with the object name as the sort key
+INDEX_NAME = 'byPrefixLoc'
+# Folder permission rows are indexed by "<bucket>:<parent folder>" with the folder key as the sort key
+PARENT_INDEX_NAME = 'byParent'
+READY_PARAMETER = 'maps-prefix-index-{}'
+# Bumped whenever the backfill starts covering another index, so older flags do not count
+READY_VALUE = 'ready:2'
+# A missing flag is read again after this many seconds, a set flag is kept for the container
+CHECK_INTERVAL = 300
+
+_lock = threading.Lock()
+_ready = False
+_checked = None
+
+def index_key(bucket, prefixLoc):
+    return '{}:{}'.format(bucket, prefixLoc)
+
+def object_name(key):
+    return key.rsplit('/', 1)[-1]
+
+# "a/b/" is a child of "a/", and "a/" of the bucket root ""
+def parent_key(bucket, folderKey):
+    trimmed = folderKey.rstrip('/')
+    return '{}:{}'.format(bucket, trimmed[:trimmed.rfind('/') + 1])
+
+def ready_parameter(env=None):
+    return READY_PARAMETER.format(env or os.environ.get('ENV', 'default'))
+
+def is_ready():
+    """
+    True once scripts/maps_index_backfill.py has indexed the rows written before the
+    byPrefixLoc and byParent indexes existed. Until then, readers keep the paths that
+    find every row.
+    """
+    global _ready, _checked
+    with _lock:
+        if _ready or (_checked is not None and time.monotonic() - _checked < CHECK_INTERVAL):
+            return _ready
+
+        try:
+            value = clients.get_client('ssm').get_parameter(Name=ready_parameter())['Parameter']['Value']
+            _ready = value == READY_VALUE
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ParameterNotFound':
+                print("Unable to read {}: {}".format(ready_parameter(), e))
+        _checked = time.monotonic()
+        return _ready
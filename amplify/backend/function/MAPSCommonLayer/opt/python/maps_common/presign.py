@@ -0,0 +1,135 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+import math
+import time
+import threading
+from maps_common.clients import LazyClient
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 10000
+# Temporary credentials that do not report their expiry, such as the ones Lambda puts
+# in the environment, are assumed to stay valid this long after a URL is signed
+TEMPORARY_CREDENTIAL_LIFETIME = 3600
+
+class PresignedUrlCache:
+    """
+    Bounded LRU cache of presigned GET URLs keyed by (bucket, key, disposition).
+
+    Expiry times are rounded up to a multiple of window seconds, so every URL
+    signed inside one window expires together, and a cached URL is handed out
+    again while at least min_remaining seconds of it are left. Repeated
+    requests for an object therefore get the same URL, which the browser can
+    serve from its cache instead of downloading the object again.
+
+    A URL stops working when the credentials that signed it expire, whatever
+    its own expiry, so a URL is only taken to be valid until then, and it is
+    reused while min_remaining seconds or half of that lifetime are left.
+    Callers invalidate an object when they let it be written.
+    """
+
+    def __init__(self, expires_in, s3_client=None, window=None, min_remaining=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.expires_in = expires_in
+        self.s3_client = s3_client or LazyClient('s3')
+        self.window = window or max(1, expires_in // 24)
+        self.min_remaining = expires_in // 2 if min_remaining is None else min_remaining
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'signed': 0,
+            'evictions': 0,
+            'invalidations': 0
+        }
+
+    def get_url(self, bucket, key, disposition=None):
+        cacheKey = (bucket, key, disposition)
+        now = time.time()
+        with self._lock:
+            cached = self._entries.get(cacheKey)
+            if cached is not None:
+                validUntil, signedAt, url = cached
+                if validUntil - now >= min(self.min_remaining, (validUntil - signedAt) / 2):
+                    self._entries.move_to_end(cacheKey)
+                    self._stats['hits'] += 1
+                    return url
+                del self._entries[cacheKey]
+
+        expires = math.ceil((now + self.expires_in) / self.window) * self.window
+        params = { 'Bucket': bucket, 'Key': key }
+        if disposition:
+            params['ResponseContentDisposition'] = disposition
+        url = self.s3_client.generate_presigned_url('get_object', Params=params, ExpiresIn=int(expires - now))
+
+        validUntil = expires
+        credentialExpiry = self._credential_expiry(now)
+        if credentialExpiry is not None:
+            validUntil = min(expires, credentialExpiry)
+
+        with self._lock:
+            self._stats['signed'] += 1
+            self._entries[cacheKey] = (validUntil, now, url)
+            self._entries.move_to_end(cacheKey)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return url
+
+    def _credential_expiry(self, now):
+        credentials = self.s3_client._request_signer._credentials
+        if credentials is None:
+            return None
+        expiry = getattr(credentials, '_expiry_time', None)
+        if expiry is not None:
+            return expiry.timestamp()
+        if credentials.token:
+            return now + TEMPORARY_CREDENTIAL_LIFETIME
+        return None
+
+    def invalidate(self, bucket=None, key=None):
+        """Drop cached URLs for an object, everything under a folder key, a bucket, or everything."""
+        with self._lock:
+            self._stats['invalidations'] += 1
+            if bucket is None:
+                self._entries.clear()
+            else:
+                for cacheKey in [k for k in self._entries if k[0] == bucket and (key is None or k[1] == key
+                        or (key.endswith('/') and k[1].startswith(key)))]:
+                    del self._entries[cacheKey]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['signed']
+        stats['lookups'] = lookups
+        stats['hitRate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_cache(expires_in):
+    """Return the container-wide URL cache for a URL lifetime, creating it on first use."""
+    with _caches_lock:
+        cache = _caches.get(expires_in)
+        if cache is None:
+            cache = PresignedUrlCache(expires_in)
+            _caches[expires_in] = cache
+        return cache
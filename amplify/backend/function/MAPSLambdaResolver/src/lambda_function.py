@@ -17,37 +17,15 @@
 '''
 import os
 import json
-import boto3
-from boto3.dynamodb.conditions import Key
+from maps_common import permissions, prefix_index
 
-TRACKING_DB_TABLE = os.environ['TRACKING_DB_TABLE']
-PERMISSIONS_DB_TABLE = os.environ['PERMISSIONS_DB_TABLE']
-
-ddb_client = boto3.client('dynamodb')
+# Folder listings in a bucket come in bursts, so load its whole permission partition at once.
+# Permission changes are not pushed here and show up once the snapshot expires.
+permissions_cache = permissions.get_cache(snapshot_buckets=True)
 
 def validate_permissions(userGroups, bucket, folderKey):
-    resp = ddb_client.get_item(
-            TableName=PERMISSIONS_DB_TABLE,
-            Key={
-                "bucket": { 'S': bucket },
-                "folderKey": { 'S': folderKey }
-            },
-            AttributesToGet=[
-                'permissionGroups'
-            ]
-        )
-
-    try:
-        groups = resp['Item']['permissionGroups']['L']
-        for group in groups:
-            if group['S'] in userGroups:
-                return True
-        return False
-    except KeyError as e:
-        if folderKey == '/':
-            return True
-        else:
-            return False
+    # The bucket root is readable by everyone unless it has its own permission row
+    return permissions_cache.has_access(userGroups, bucket, folderKey, default=(folderKey == '/'))
     
 def lambda_handler(event, context):
     groups = event['identity']['claims']['cognito:groups']
@@ -56,18 +34,8 @@ def lambda_handler(event, context):
     prefix = event['arguments']['filter']['prefixLoc']['eq']
     hasPermissions = validate_permissions(groups, bucket, prefix)
 
-    if hasPermissions:
-        resp = ddb_client.scan(
-                TableName=TRACKING_DB_TABLE,
-                Select='ALL_ATTRIBUTES',
-                FilterExpression="contains (bucketObjKey, :bucket)",
-                ExpressionAttributeValues={
-                    ":bucket": { "S": bucket }
-                }
-            )
-
-        event['arguments']['allow'] = True
-    else:
-        event['arguments']['allow'] = False
+    event['arguments']['allow'] = hasPermissions
+    # Folder listings read the byPrefixLoc index once every row has been indexed
+    event['arguments']['prefixIndexReady'] = hasPermissions and prefix_index.is_ready()
     
     return event
@@ -19,13 +19,14 @@ import logging
 import os
 import json
 import util
+import metrics
 import s3_handler
 import ddb_handler
 
-from chalice import Chalice, BadRequestError, NotFoundError
+from chalice import BadRequestError, NotFoundError
 from chalice import CognitoUserPoolAuthorizer
 
-app = Chalice(app_name='source-of-truth-api')
+app = metrics.InstrumentedChalice(app_name='source-of-truth-api')
 app.debug = True
 
 logging.basicConfig()
@@ -39,6 +40,16 @@ def upload_s3_file():
     request_body = json.loads(app.current_request.raw_body)
     return ddb_handler.handle_upload_file_req(request_body, app.current_request.context)
 
+@app.route('/upload/parts', methods=['POST'], content_types=['application/json'], authorizer=authorizer, cors=True)
+def upload_s3_file_parts():
+    request_body = json.loads(app.current_request.raw_body)
+    return ddb_handler.handle_upload_parts_req(request_body, app.current_request.context)
+
+@app.route('/upload/complete', methods=['POST'], content_types=['application/json'], authorizer=authorizer, cors=True)
+def complete_s3_file_upload():
+    request_body = json.loads(app.current_request.raw_body)
+    return ddb_handler.handle_upload_complete_req(request_body, app.current_request.context)
+
 @app.route('/download', methods=['POST'], content_types=['application/json'], authorizer=authorizer, cors=True)
 def download_s3_file():
     request_body = json.loads(app.current_request.raw_body)
@@ -68,11 +79,20 @@ def get_s3_obj_data():
     queryParams = app.current_request.query_params
     return s3_handler.get_s3_obj(bucket_name=queryParams.get('bucketName'), key=queryParams.get('key'))
     
+@app.route('/objects', methods=['POST'], content_types=['application/json'], authorizer=authorizer, cors=True)
+def get_s3_objs_data():
+    request_body = json.loads(app.current_request.raw_body)
+    return s3_handler.get_s3_objs(request_body, app.current_request.context)
+
 @app.route('/rename', methods=['POST'], content_types=['application/json'], authorizer=authorizer, cors=True)
 def rename_s3_file():
     request_body = json.loads(app.current_request.raw_body)
     return ddb_handler.handle_rename_move_req(request_body, app.current_request.context)
     
+@app.route('/rename/{job_id}', methods=['GET'], authorizer=authorizer, cors=True)
+def get_rename_job(job_id):
+    return ddb_handler.get_move_job(job_id, app.current_request.context)
+
 @app.route('/move', methods=['POST'], content_types=['application/json'], authorizer=authorizer, cors=True)
 def move_s3_files():
     request_body = json.loads(app.current_request.raw_body)
@@ -15,20 +15,29 @@
  * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 '''
-import boto3
 import json
 import os
+import time
+import uuid
 import util
 import s3_handler
 from datetime import datetime, timezone
 from botocore.client import Config
+from botocore.exceptions import ClientError
 from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
 from urllib.parse import quote_plus
-
-s3_client = boto3.client('s3')
-ddb_client = boto3.client('dynamodb')
-ec2_client = boto3.client('ec2')
-ssm_client = boto3.client('ssm')
+from concurrent.futures import ThreadPoolExecutor
+from maps_common import presign, prefix_index
+from maps_common.appsync import get_prefix_loc
+from maps_common.permissions import has_group_access
+from maps_common.clients import LazyClient
+
+# Clients are created on first use, so a route only pays for the services it calls
+s3_client = LazyClient('s3')
+ddb_client = LazyClient('dynamodb')
+ec2_client = LazyClient('ec2')
+ssm_client = LazyClient('ssm')
+lambda_client = LazyClient('lambda')
 
 ENV = os.environ['ENV']
 PERMISSIONS_DB_TABLE = os.environ['PERMISSIONS_DB_TABLE']
@@ -37,6 +46,38 @@ FSX_MOUNT = os.environ['FSX_MOUNT']
 REGION = os.environ['REGION']
 SSM_OUTPUT_BUCKET = os.environ['SSM_OUTPUT_BUCKET']
 SSM_OUTPUT_PREFIX = os.environ['SSM_OUTPUT_PREFIX']
+MOVE_JOBS_DB_TABLE = os.environ['MOVE_JOBS_DB_TABLE']
+MOVE_JOB_FUNCTION = os.environ['MOVE_JOB_FUNCTION']
+
+BATCH_GET_LIMIT = 100
+BATCH_GET_WORKERS = 8
+BATCH_GET_MAX_RETRIES = 5
+
+INSTANCE_CACHE_TTL = 300
+INSTANCE_MISS_CACHE_TTL = 30
+# Keep each SSM command line well under the PowerShell and SSM parameter limits
+FSX_MAX_COMMAND_CHARS = int(os.environ.get('FSX_MAX_COMMAND_CHARS', '4096'))
+# Spread large moves over several commands so the instance copies them in parallel
+FSX_BYTES_PER_COMMAND = int(os.environ.get('FSX_BYTES_PER_COMMAND', str(50 * 1024 ** 3)))
+FSX_COMMAND_WORKERS = 8
+
+# Check-in uploads are split into parts of at least 8 MiB, sized so a file
+# spreads over about UPLOAD_TARGET_PARTS parts the browser sends in parallel
+UPLOAD_MIN_PART_SIZE = 8 * 1024 ** 2
+UPLOAD_MAX_PART_SIZE = 5 * 1024 ** 3
+UPLOAD_TARGET_PARTS = 1000
+# Presigned part URLs handed out per request and how long they stay valid
+UPLOAD_URL_BATCH = 100
+UPLOAD_URL_EXPIRY = 3600
+
+DOWNLOAD_URL_EXPIRY = 300
+download_urls = presign.get_cache(DOWNLOAD_URL_EXPIRY)
+
+# Finished move jobs are kept this many seconds for clients polling their progress
+MOVE_JOB_TTL = 7 * 24 * 3600
+
+# source IP -> (expiry time, instance ID or None)
+instance_cache = {}
 
 ddb_deserialize = TypeDeserializer().deserialize
 ddb_serialize = TypeSerializer().serialize
@@ -57,6 +98,53 @@ def check_for_existing(bucketObjKey):
     
     return response
 
+def _batch_get_chunk(keys, projection):
+    items = {}
+    request = {
+        ACTIVE_DB_TABLE: {
+            'Keys': [{ 'bucketObjKey': { 'S': key } } for key in keys],
+            'ProjectionExpression': projection
+        }
+    }
+
+    retries = 0
+    while request:
+        response = ddb_client.batch_get_item(RequestItems=request)
+        for item in response['Responses'].get(ACTIVE_DB_TABLE, []):
+            items[item['bucketObjKey']['S']] = item
+
+        request = response.get('UnprocessedKeys')
+        if request:
+            if retries >= BATCH_GET_MAX_RETRIES:
+                raise Exception('Unable to read all keys from {} after {} retries'.format(ACTIVE_DB_TABLE, retries))
+            # Exponential backoff before retrying throttled keys
+            time.sleep(0.05 * (2 ** retries))
+            retries += 1
+
+    return items
+
+# Read the tracking rows for many objects at once using chunked BatchGetItem
+# calls. Returns a dict of bucketObjKey -> item for the keys that exist.
+def batch_check_for_existing(bucketObjKeys, projection='bucketObjKey, editUser, fileStatus, fileSize'):
+    unique_keys = list(dict.fromkeys(bucketObjKeys))
+    chunks = [unique_keys[i:i + BATCH_GET_LIMIT] for i in range(0, len(unique_keys), BATCH_GET_LIMIT)]
+
+    items = {}
+    if len(chunks) == 1:
+        items.update(_batch_get_chunk(chunks[0], projection))
+    elif len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=min(BATCH_GET_WORKERS, len(chunks))) as executor:
+            for chunk_items in executor.map(lambda chunk: _batch_get_chunk(chunk, projection), chunks):
+                items.update(chunk_items)
+
+    return items
+
+# URLs signed for the previous version would let browsers show it from cache.
+# A folder key drops the URLs of everything under it.
+def invalidate_object_urls(bucketName, key):
+    s3_handler.object_urls.invalidate(bucketName, key)
+    download_urls.invalidate(bucketName, key)
+
 # Handle Upload Object Request
 # Perform checks to see if object is available for check in
 # by querying DynamoDB
@@ -64,7 +152,20 @@ def handle_upload_file_req(request_body, request_cxt):
     bucketName = request_body['bucketName']
     key = request_body['key']
     user = request_cxt['authorizer']['claims']['cognito:username']
-    
+
+    obj_response_body = check_in_status(bucketName, key, user)
+
+    if obj_response_body['allowCheckIn']:
+        invalidate_object_urls(bucketName, key)
+
+    # Clients that send the file size upload it in parts through presigned URLs
+    if obj_response_body['allowCheckIn'] and 'fileSize' in request_body:
+        obj_response_body.update(start_multipart_upload(bucketName, key, int(request_body['fileSize']),
+            request_body.get('contentType'), request_body.get('uploadId')))
+
+    return util.generate_response_body(200, obj_response_body)
+
+def check_in_status(bucketName, key, user):
     obj_response_body = {}
     response = check_for_existing(bucketObjKey=f"{bucketName}/{key}")
     
@@ -83,11 +184,124 @@ def handle_upload_file_req(request_body, request_cxt):
         try:
             resp = s3_client.get_object_acl(Bucket=bucketName, Key=key)
             obj_response_body = {"allowCheckIn": False, "reason": 'File already exists and is not currently being tracked. Please contact your administrator.'}
-
-            return util.generate_response_body(200, obj_response_body)
         except:
             obj_response_body = {"allowCheckIn": True}
 
+    return obj_response_body
+
+def get_upload_part_size(fileSize):
+    partSize = max(UPLOAD_MIN_PART_SIZE, -(-fileSize // UPLOAD_TARGET_PARTS))
+    # Round up to a whole MiB
+    partSize = -(-partSize // 1024 ** 2) * 1024 ** 2
+    return min(partSize, UPLOAD_MAX_PART_SIZE)
+
+# Create a multipart upload, or pick up the one the client is resuming,
+# and presign the first batch of parts still to be uploaded
+def start_multipart_upload(bucketName, key, fileSize, contentType, uploadId):
+    partSize = get_upload_part_size(fileSize)
+    partCount = max(1, -(-fileSize // partSize))
+
+    uploaded = {}
+    if uploadId:
+        try:
+            uploaded = list_uploaded_parts(bucketName, key, uploadId)
+        except ClientError as e:
+            # Completed, aborted or expired, start over
+            if e.response['Error']['Code'] != 'NoSuchUpload':
+                raise e
+            uploadId = None
+
+    if not uploadId:
+        params = {
+            'Bucket': bucketName,
+            'Key': key,
+            'ContentDisposition': 'attachment; filename="{}"'.format(key.split('/')[-1])
+        }
+        if contentType:
+            params['ContentType'] = contentType
+        uploadId = s3_client.create_multipart_upload(**params)['UploadId']
+
+    # Parts of the wrong size were sent for another file size and are uploaded again
+    uploadedParts = [number for number, part in uploaded.items()
+        if number <= partCount and part['Size'] == (partSize if number < partCount else fileSize - partSize * (partCount - 1))]
+    remaining = [number for number in range(1, partCount + 1) if number not in uploadedParts]
+
+    return {
+        'uploadId': uploadId,
+        'partSize': partSize,
+        'partCount': partCount,
+        'uploadedParts': sorted(uploadedParts),
+        'parts': presign_upload_parts(bucketName, key, uploadId, remaining[:UPLOAD_URL_BATCH])
+    }
+
+def presign_upload_parts(bucketName, key, uploadId, partNumbers):
+    return [{
+        'partNumber': number,
+        'url': s3_client.generate_presigned_url('upload_part',
+            Params={
+                'Bucket': bucketName,
+                'Key': key,
+                'UploadId': uploadId,
+                'PartNumber': number
+            },
+            ExpiresIn=UPLOAD_URL_EXPIRY)
+    } for number in partNumbers]
+
+# Part number -> ListParts entry for the parts S3 already holds
+def list_uploaded_parts(bucketName, key, uploadId):
+    parts = {}
+    params = { 'Bucket': bucketName, 'Key': key, 'UploadId': uploadId }
+    while True:
+        response = s3_client.list_parts(**params)
+        for part in response.get('Parts', []):
+            parts[part['PartNumber']] = part
+        if not response.get('IsTruncated'):
+            return parts
+        params['PartNumberMarker'] = response['NextPartNumberMarker']
+
+# Handle Upload Parts Request
+# Presign the next batch of parts for an upload the user may still check in
+def handle_upload_parts_req(request_body, request_cxt):
+    bucketName = request_body['bucketName']
+    key = request_body['key']
+    user = request_cxt['authorizer']['claims']['cognito:username']
+
+    obj_response_body = check_in_status(bucketName, key, user)
+    if obj_response_body['allowCheckIn']:
+        partNumbers = [int(number) for number in request_body['partNumbers'][:UPLOAD_URL_BATCH]]
+        obj_response_body['parts'] = presign_upload_parts(bucketName, key, request_body['uploadId'], partNumbers)
+
+    return util.generate_response_body(200, obj_response_body)
+
+# Handle Upload Complete Request
+# Complete the upload from the parts S3 holds, so the client never has to
+# collect ETags from the part responses
+def handle_upload_complete_req(request_body, request_cxt):
+    bucketName = request_body['bucketName']
+    key = request_body['key']
+    uploadId = request_body['uploadId']
+    partCount = int(request_body['partCount'])
+    user = request_cxt['authorizer']['claims']['cognito:username']
+
+    obj_response_body = check_in_status(bucketName, key, user)
+    if not obj_response_body['allowCheckIn']:
+        return util.generate_response_body(200, obj_response_body)
+
+    parts = list_uploaded_parts(bucketName, key, uploadId)
+    missing = [number for number in range(1, partCount + 1) if number not in parts]
+    if missing:
+        obj_response_body = { 'complete': False, 'missingParts': missing[:UPLOAD_URL_BATCH] }
+        return util.generate_response_body(200, obj_response_body)
+
+    s3_client.complete_multipart_upload(
+        Bucket=bucketName,
+        Key=key,
+        UploadId=uploadId,
+        MultipartUpload={ 'Parts': [{ 'PartNumber': number, 'ETag': parts[number]['ETag'] } for number in range(1, partCount + 1)] }
+    )
+    invalidate_object_urls(bucketName, key)
+
+    obj_response_body = { 'complete': True }
     return util.generate_response_body(200, obj_response_body)
 
 # Handle Download Object Request
@@ -103,17 +317,11 @@ def handle_download_file_req(request_body, request_cxt):
     obj_response_body = {}
     response = check_for_existing(bucketObjKey=f"{bucketName}/{key}")
 
-    params={
-        'Bucket': bucketName,
-        'Key': key,
-        'ResponseContentDisposition': f'attachment; filename={displayKey};'
-    }
+    disposition = f'attachment; filename={displayKey};'
 
     # Read-Only
     if readOnly == True:
-        s3_resp = s3_client.generate_presigned_url('get_object', 
-            Params=params,
-            ExpiresIn=300)
+        s3_resp = s3_handler.get_presigned_url(download_urls, bucketName, key, disposition)
             
         obj_response_body = {
             'user': user,
@@ -128,9 +336,7 @@ def handle_download_file_req(request_body, request_cxt):
         if fileStatus == 'S3_DOWNLOADED':
             obj_response_body = {'allowCheckOut': False, 'reason': "File is already checked out for edit."}
         else:
-            s3_resp = s3_client.generate_presigned_url('get_object', 
-                Params=params,
-                ExpiresIn=300)
+            s3_resp = s3_handler.get_presigned_url(download_urls, bucketName, key, disposition)
 
             obj_response_body = {
                 'user': user,
@@ -162,6 +368,9 @@ def handle_delete_file_req(request_body, request_cxt):
         else:
             obj_response_body = {'allowDelete': False, 'reason': "Unable to delete file."}
 
+    if obj_response_body.get('allowDelete'):
+        invalidate_object_urls(bucketName, key)
+
     return util.generate_response_body(200, obj_response_body)
 
 # Handle Rename or Move Object Request
@@ -173,14 +382,42 @@ def handle_rename_move_req(request_body, request_cxt):
     newPrefix = request_body['newPrefix']
     user = request_cxt['authorizer']['claims']['cognito:username']
 
+    # The move job runs with the function's own access to the bucket, so the caller
+    # must have access to every folder the move reads from or writes to
+    userGroups = s3_handler.resolve_user_groups(request_cxt['authorizer']['claims'])
+    denied = denied_move_folders(bucketName, userGroups, [key['key'] for key in keys], newPrefix)
+    if denied:
+        return util.generate_response_body(403, {
+            'reason': 'You do not have access to {}.'.format(', '.join(denied)),
+            'deniedFolders': denied
+        })
+
     obj_response_body = {}
     obj_response_body['objects'] = []
 
+    # Resolve every source and destination row up front, folders keep their trailing slash
+    moves = []
+    folders = []
     for key in keys:
         key = key['key']
-        fileName = key.split('/')[-1]
-        response = check_for_existing(bucketObjKey=f"{bucketName}/{key}")
-        newResponse = check_for_existing(bucketObjKey=f"{bucketName}/{newPrefix}{fileName}")
+        if key.endswith('/'):
+            folders.append((key, key.split('/')[-2] + '/'))
+        else:
+            moves.append((key, key.split('/')[-1]))
+
+    lookupKeys = []
+    for key, fileName in moves:
+        lookupKeys.append(f"{bucketName}/{key}")
+        lookupKeys.append(f"{bucketName}/{newPrefix}{fileName}")
+    existing = batch_check_for_existing(lookupKeys)
+
+    for key, fileName in moves:
+        response = {}
+        newResponse = {}
+        if f"{bucketName}/{key}" in existing:
+            response['Item'] = existing[f"{bucketName}/{key}"]
+        if f"{bucketName}/{newPrefix}{fileName}" in existing:
+            newResponse['Item'] = existing[f"{bucketName}/{newPrefix}{fileName}"]
 
         if 'Item' in response:
             fileStatus = response['Item']['fileStatus']['S']
@@ -218,41 +455,238 @@ def handle_rename_move_req(request_body, request_cxt):
                     'allowMove': False,
                     'reason': 'Unknown error occurred and we could not complete your request.' 
                 })
-    
+
+    # Files checked out by other users inside a folder are left in place by the move job
+    for key, folderName in folders:
+        try:
+            s3_client.get_object_acl(Bucket=bucketName, Key=f"{newPrefix}{folderName}")
+            folderExists = True
+        except:
+            folderExists = False
+
+        if newPrefix.startswith(key):
+            obj_response_body['objects'].append({
+                'oldKey': key,
+                'newKey': f"{newPrefix}{folderName}",
+                'allowMove': False,
+                'reason': 'A folder cannot be moved into itself.'
+            })
+        elif not folderExists:
+            obj_response_body['objects'].append({
+                'oldKey': key,
+                'newKey': f"{newPrefix}{folderName}",
+                'allowMove': True
+            })
+        else:
+            obj_response_body['objects'].append({
+                'oldKey': key,
+                'newKey': f"{newPrefix}{folderName}",
+                'allowMove': False,
+                'reason': 'There exists a folder with the same name at the new folder location.'
+            })
+
+    allowed = [obj for obj in obj_response_body['objects'] if obj['allowMove']]
+    if allowed:
+        obj_response_body['jobId'] = start_move_job(bucketName, user, allowed)
+        for obj in allowed:
+            invalidate_object_urls(bucketName, obj['oldKey'])
+
+    return util.generate_response_body(200, obj_response_body)
+
+# Folders of a move the user has no access to. A moved folder takes every folder
+# under it along, and leaves its parent, so all of those are checked too.
+def denied_move_folders(bucketName, userGroups, keys, newPrefix):
+    folders = [newPrefix or '/']
+    trees = []
+    for key in keys:
+        if key.endswith('/'):
+            folders.append(get_prefix_loc(key.rstrip('/')))
+            trees.append(key)
+        else:
+            folders.append(get_prefix_loc(key))
+
+    denied = []
+    for folder, groups in s3_handler.permissions_cache.get_many(bucketName, folders).items():
+        # The bucket root is open to everyone unless it has its own permission row
+        allowed = folder == '/' if groups is None else has_group_access(userGroups, groups)
+        if not allowed:
+            denied.append(folder)
+
+    for folderKey in trees:
+        rows = query_folder_tree(bucketName, folderKey)
+        s3_handler.permissions_cache.prime(bucketName, rows)
+        for item in rows:
+            if 'permissionGroups' not in item:
+                continue
+            if not has_group_access(userGroups, ddb_deserialize(item['permissionGroups'])) and item['folderKey']['S'] not in denied:
+                denied.append(item['folderKey']['S'])
+    return denied
+
+# Every permission row at or under a folder
+def query_folder_tree(bucketName, folderKey):
+    params = {
+        'TableName': PERMISSIONS_DB_TABLE,
+        'KeyConditionExpression': '#buck = :buckval and begins_with(folderKey, :plval)',
+        'ProjectionExpression': 'folderKey, permissionGroups',
+        'ExpressionAttributeNames': { '#buck': 'bucket' },
+        'ExpressionAttributeValues': {
+            ':buckval': { 'S': bucketName },
+            ':plval': { 'S': folderKey }
+        }
+    }
+
+    items = []
+    while True:
+        response = ddb_client.query(**params)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+# Record a move job and hand it to the move job function, which copies the
+# objects and rewrites their rows without the client staying connected
+def start_move_job(bucketName, user, moves):
+    jobId = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+
+    ddb_client.put_item(
+        TableName=MOVE_JOBS_DB_TABLE,
+        Item={
+            'jobId': { 'S': jobId },
+            'bucket': { 'S': bucketName },
+            'user': { 'S': user },
+            'moves': ddb_serialize([{ 'oldKey': move['oldKey'], 'newKey': move['newKey'] } for move in moves]),
+            'jobStatus': { 'S': 'PENDING' },
+            'createdAt': { 'S': str(now) },
+            'expiresAt': { 'N': str(int(now.timestamp()) + MOVE_JOB_TTL) }
+        }
+    )
+
+    lambda_client.invoke(
+        FunctionName=MOVE_JOB_FUNCTION,
+        InvocationType='Event',
+        Payload=json.dumps({ 'jobId': jobId })
+    )
+    return jobId
+
+def get_move_job(job_id, request_cxt):
+    obj_response_body = {}
+    user = request_cxt['authorizer']['claims']['cognito:username']
+    groups = request_cxt['authorizer']['claims']['cognito:groups']
+
+    response = ddb_client.get_item(
+        TableName=MOVE_JOBS_DB_TABLE,
+        Key={ 'jobId': { 'S': job_id } },
+        ConsistentRead=True
+    )
+
+    item = response.get('Item')
+    if item is None or (item['user']['S'] != user and 'admin' not in groups):
+        obj_response_body['reason'] = 'Move job does not exist.'
+        return util.generate_response_body(200, obj_response_body)
+
+    obj_response_body['jobId'] = job_id
+    obj_response_body['status'] = item['jobStatus']['S']
+    for field in ('objectsTotal', 'bytesTotal', 'objectsMoved', 'bytesMoved', 'objectsFailed'):
+        obj_response_body[field] = int(item[field]['N']) if field in item else 0
+    obj_response_body['errors'] = ddb_deserialize(item['jobErrors']) if 'jobErrors' in item else []
+    if 'jobError' in item:
+        obj_response_body['reason'] = item['jobError']['S']
+
     return util.generate_response_body(200, obj_response_body)
 
 # Handle Move to FSX Request
 # Perform checks to see if object is available for moving
 # by querying DynamoDB
+# Look up the EC2 instance behind a source IP, caching hits and misses
+def get_instance_for_ip(sourceIp):
+    now = time.monotonic()
+    cached = instance_cache.get(sourceIp)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    resp = ec2_client.describe_addresses(PublicIps=[sourceIp])
+    if len(resp['Addresses']) > 0:
+        instanceId = resp['Addresses'][0].get('InstanceId')
+    else:
+        instanceId = None
+
+    ttl = INSTANCE_CACHE_TTL if instanceId is not None else INSTANCE_MISS_CACHE_TTL
+    instance_cache[sourceIp] = (now + ttl, instanceId)
+    return instanceId
+
+# Quote a key as a single-quoted PowerShell string array element
+def _ps_quote(key):
+    return "'{}'".format(key.replace("'", "''"))
+
+def _move_command(bucketName, toFsx, keys):
+    files = ','.join(_ps_quote(key) for key in keys)
+    return f'.\\MoveMedia.ps1 -bucket {bucketName} -toFsx {toFsx} -files {files} -fsxmount {FSX_MOUNT}'
+
+# Split the files into the fewest SSM commands that fit the command size limit, with one
+# command per FSX_BYTES_PER_COMMAND up to FSX_COMMAND_WORKERS, balancing bytes between them
+def plan_move_commands(bucketName, toFsx, files):
+    if len(files) == 0:
+        return []
+
+    totalBytes = sum(size for _, size in files)
+    totalChars = len(_move_command(bucketName, toFsx, [key for key, _ in files]))
+    byBytes = min(-(-totalBytes // FSX_BYTES_PER_COMMAND), FSX_COMMAND_WORKERS)
+    numCommands = max(byBytes, -(-totalChars // FSX_MAX_COMMAND_CHARS))
+    numCommands = min(max(numCommands, 1), len(files))
+
+    while True:
+        # Largest files first, each onto the currently lightest command
+        batches = [[0, []] for _ in range(numCommands)]
+        for key, size in sorted(files, key=lambda f: f[1], reverse=True):
+            batch = min(batches, key=lambda b: b[0])
+            batch[0] += size
+            batch[1].append(key)
+
+        commands = [_move_command(bucketName, toFsx, keys) for _, keys in batches if len(keys) > 0]
+        if numCommands == len(files) or all(len(command) <= FSX_MAX_COMMAND_CHARS for command in commands):
+            return commands
+        numCommands += 1
+
+def send_move_command(instanceId, command):
+    return ssm_client.send_command(
+        InstanceIds=[instanceId],
+        DocumentName="AWS-RunPowerShellScript",
+        Parameters={
+            'commands': [command],
+            'workingDirectory': ['C:\\ProgramData\\Amazon\\EC2-Windows\\Launch\\Scripts']
+        },
+        OutputS3Region=REGION,
+        OutputS3BucketName=SSM_OUTPUT_BUCKET,
+        OutputS3KeyPrefix=SSM_OUTPUT_PREFIX
+    )
+
 def handle_fsx_move_req(request_body, request_cxt, curr_req):
     bucketName = request_body['bucketName']
     keys = request_body['keys']
     moveType = request_body['moveType']
     user = request_cxt['authorizer']['claims']['cognito:username']
     sourceIp = request_cxt['identity']['sourceIp']
-    instanceId = None
 
     # Get instance ID from source IP
-    resp = ec2_client.describe_addresses(PublicIps=[sourceIp])
-    if len(resp['Addresses']) > 0:
-        instanceId = resp['Addresses'][0]['InstanceId']
-    else:
+    instanceId = get_instance_for_ip(sourceIp)
+    if instanceId is None:
         return util.generate_response_body(200, {"allowMove": False, "reason": "No EC2 instances are currently associated with your IP address so we are unable to move files to FSx."})
     
     obj_response_body = {}
     obj_response_body['moveStatus'] = []
     
-    toFsx = 1
-    files = ''
-    
+    toFsx = 1 if moveType == 'fsx' else 0
+    files = []
+
+    existing = batch_check_for_existing([f"{bucketName}/{key['key']}" for key in keys])
     for key in keys:
-        response = check_for_existing(bucketObjKey=f"{bucketName}/{key['key']}")
-        displayKey = key['key'].split('/')[-1]
-        if 'Item' in response:
-            status = response['Item']['fileStatus']['S']
+        item = existing.get(f"{bucketName}/{key['key']}")
+        if item is not None:
+            status = item['fileStatus']['S']
+            size = int(float(item['fileSize']['N'])) if 'fileSize' in item else 0
             if status == 'S3' and moveType == 'fsx':
-                files += '{},'.format(key['key'])
-                toFsx = 1
+                files.append((key['key'], size))
                 obj_response_body['moveStatus'].append({
                     'key': key['key'],
                     'status': 'Moving to FSX'
@@ -268,8 +702,7 @@ def handle_fsx_move_req(request_body, request_cxt, curr_req):
                     'status': 'File is not currently in FSX'
                 })
             elif status == 'S3_FSX' and moveType == 'remove_fsx':
-                files += '{},'.format(key['key'])
-                toFsx = 0
+                files.append((key['key'], size))
                 obj_response_body['moveStatus'].append({
                     'key': key['key'],
                     'status': 'Moving from FSX'
@@ -284,20 +717,13 @@ def handle_fsx_move_req(request_body, request_cxt, curr_req):
                     'key': key['key'],
                     'status': 'Asset is not currently being tracked'
                 })
-    
-    command = f'.\MoveMedia.ps1 -bucket {bucketName} -toFsx {toFsx} -files {files[:-1]} -fsxmount {FSX_MOUNT}'
 
-    resp = ssm_client.send_command(
-        InstanceIds=[instanceId],
-        DocumentName="AWS-RunPowerShellScript",
-        Parameters={
-            'commands': [command],
-            'workingDirectory': ['C:\ProgramData\Amazon\EC2-Windows\Launch\Scripts']
-        },
-        OutputS3Region=REGION,
-        OutputS3BucketName=SSM_OUTPUT_BUCKET,
-        OutputS3KeyPrefix=SSM_OUTPUT_PREFIX
-    )
+    commands = plan_move_commands(bucketName, toFsx, list(dict.fromkeys(files)))
+    if len(commands) == 1:
+        send_move_command(instanceId, commands[0])
+    elif len(commands) > 1:
+        with ThreadPoolExecutor(max_workers=min(FSX_COMMAND_WORKERS, len(commands))) as executor:
+            list(executor.map(lambda command: send_move_command(instanceId, command), commands))
 
     return util.generate_response_body(200, obj_response_body)
 
@@ -381,11 +807,14 @@ def update_folder_permissions(request_body, request_cxt):
                 'bucket': { 'S': bucket_name },
                 'folderKey': { 'S': folder_key }
             },
-            UpdateExpression="set permissionGroups=:p",
+            UpdateExpression="set permissionGroups=:p, bucketParent=:parent",
             ExpressionAttributeValues={
-                ':p': ddb_serialize(newPermissionGroup)
+                ':p': ddb_serialize(newPermissionGroup),
+                ':parent': { 'S': prefix_index.parent_key(bucket_name, folder_key) }
             }
         )
+        # Only this container sees the change at once, the others within PERMISSIONS_CACHE_TTL
+        s3_handler.permissions_cache.invalidate(bucket_name, folder_key)
 
         obj_response_body['success'] = True
     else:
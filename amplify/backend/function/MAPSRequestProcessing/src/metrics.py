@@ -0,0 +1,172 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+import os
+import json
+import time
+import random
+import threading
+from chalice import Chalice
+from maps_common import clients
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'MAPS/API')
+# Requests slower than this are logged with every AWS call they made, for a sample of them
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '1000'))
+SLOW_REQUEST_SAMPLE_RATE = float(os.environ.get('SLOW_REQUEST_SAMPLE_RATE', '0.2'))
+SLOW_REQUEST_MAX_CALLS = 100
+# Values one embedded metric format line can carry for a metric
+EMF_MAX_VALUES = 100
+
+class RequestRecorder:
+    """AWS calls made while one API request is handled, from any worker thread."""
+
+    def __init__(self, route, request_id):
+        self.route = route
+        self.requestId = request_id
+        self.start = time.perf_counter()
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def record(self, operation, started, error):
+        now = time.perf_counter()
+        with self._lock:
+            self.calls.append({
+                'operation': operation,
+                'startMs': round((started - self.start) * 1000, 1),
+                'ms': round((now - started) * 1000, 1),
+                'error': error
+            })
+
+# Lambda hands a container one request at a time, so calls from the handler's
+# thread pools all belong to the request being recorded
+_recorder = None
+
+def _before_call(context, **kwargs):
+    if _recorder is not None:
+        context['mapsCallStart'] = time.perf_counter()
+
+def _finish_call(event_name, context, error):
+    recorder = _recorder
+    started = context.get('mapsCallStart')
+    if recorder is None or started is None:
+        return
+    _, service, operation = event_name.split('.', 2)
+    recorder.record(service + '.' + operation, started, error)
+
+def _after_call(event_name, http_response, parsed, context, **kwargs):
+    error = None
+    if http_response.status_code >= 300:
+        error = parsed.get('Error', {}).get('Code') or str(http_response.status_code)
+    _finish_call(event_name, context, error)
+
+def _after_call_error(event_name, exception, context, **kwargs):
+    _finish_call(event_name, context, type(exception).__name__)
+
+def summarize_calls(calls):
+    operations = {}
+    for call in calls:
+        summary = operations.setdefault(call['operation'], { 'count': 0, 'errors': 0, 'totalMs': 0.0, 'maxMs': 0.0, 'latencies': [] })
+        summary['count'] += 1
+        summary['errors'] += 1 if call['error'] else 0
+        summary['totalMs'] += call['ms']
+        summary['maxMs'] = max(summary['maxMs'], call['ms'])
+        summary['latencies'].append(call['ms'])
+    return operations
+
+def emf_line(dimensions, metrics, values):
+    line = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [dimensions],
+                'Metrics': [{ 'Name': name, 'Unit': unit } for name, unit in metrics]
+            }]
+        }
+    }
+    line.update(values)
+    return json.dumps(line)
+
+# One line for the route, then one per AWS operation it called, in CloudWatch embedded metric format
+def emit_request_metrics(recorder, status_code, elapsed_ms):
+    operations = summarize_calls(recorder.calls)
+
+    print(emf_line(['Route'], [('Latency', 'Milliseconds'), ('AwsCalls', 'Count'), ('AwsCallErrors', 'Count'), ('ServerErrors', 'Count')], {
+        'Route': recorder.route,
+        'requestId': recorder.requestId,
+        'statusCode': status_code,
+        'Latency': round(elapsed_ms, 1),
+        'AwsCalls': len(recorder.calls),
+        'AwsCallErrors': sum(summary['errors'] for summary in operations.values()),
+        'ServerErrors': 1 if status_code >= 500 else 0
+    }))
+
+    for operation, summary in operations.items():
+        print(emf_line(['Route', 'Operation'], [('OperationCalls', 'Count'), ('OperationLatency', 'Milliseconds'), ('OperationErrors', 'Count')], {
+            'Route': recorder.route,
+            'Operation': operation,
+            'OperationCalls': summary['count'],
+            'OperationLatency': summary['latencies'][:EMF_MAX_VALUES],
+            'OperationErrors': summary['errors']
+        }))
+
+    if elapsed_ms >= SLOW_REQUEST_MS and random.random() < SLOW_REQUEST_SAMPLE_RATE:
+        for summary in operations.values():
+            del summary['latencies']
+        print(json.dumps({
+            'message': 'Slow request',
+            'route': recorder.route,
+            'requestId': recorder.requestId,
+            'statusCode': status_code,
+            'latencyMs': round(elapsed_ms, 1),
+            'awsCalls': len(recorder.calls),
+            'operations': operations,
+            'calls': recorder.calls[:SLOW_REQUEST_MAX_CALLS],
+            'callsOmitted': max(0, len(recorder.calls) - SLOW_REQUEST_MAX_CALLS)
+        }))
+
+class InstrumentedChalice(Chalice):
+    """
+    Chalice app that times every route and records the AWS calls made while
+    handling it. This vendored Chalice predates app middleware, so requests
+    are wrapped at the Lambda entry point instead.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        clients.register_event_hook('before-call', _before_call)
+        clients.register_event_hook('after-call', _after_call)
+        clients.register_event_hook('after-call-error', _after_call_error)
+
+    def __call__(self, event, context):
+        global _recorder
+
+        requestContext = event.get('requestContext') or {}
+        route = '{} {}'.format(requestContext.get('httpMethod'), requestContext.get('resourcePath'))
+        recorder = RequestRecorder(route, requestContext.get('requestId'))
+        _recorder = recorder
+        statusCode = 500
+        try:
+            response = super().__call__(event, context)
+            statusCode = response.get('statusCode', 200)
+            return response
+        finally:
+            _recorder = None
+            try:
+                emit_request_metrics(recorder, statusCode, (time.perf_counter() - recorder.start) * 1000)
+            except Exception as e:
+                print("Unable to emit request metrics:\n", e)
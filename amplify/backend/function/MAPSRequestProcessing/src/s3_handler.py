@@ -16,7 +16,8 @@
  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 '''
 import os
-import boto3
+import json
+import time
 import util
 import ddb_handler
 import logging
@@ -26,16 +27,40 @@ from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key, Attr
 from boto3.dynamodb.types import TypeDeserializer
 from urllib.parse import quote_plus
+from maps_common import permissions, presign, prefix_index
+from maps_common.permissions import has_group_access
+from maps_common.appsync import get_prefix_loc
+from maps_common.clients import LazyClient
 
-s3_client = boto3.client('s3')
-ddb_client = boto3.client('dynamodb')
-cognito_client = boto3.client('cognito-idp')
+s3_client = LazyClient('s3')
+ddb_client = LazyClient('dynamodb')
+cognito_client = LazyClient('cognito-idp')
 
 COGNITO_USER_POOL = os.environ['COGNITO_USER_POOL']
 PERMISSIONS_DB_TABLE = os.environ['PERMISSIONS_DB_TABLE']
 
 ddb_deserialize = TypeDeserializer().deserialize
 
+permissions_cache = permissions.get_cache()
+
+OBJECT_URL_EXPIRY = 86400
+# Log signing counts every this many URL lookups
+PRESIGN_STATS_INTERVAL = 100
+
+object_urls = presign.get_cache(OBJECT_URL_EXPIRY)
+
+# Assets signed per /objects request and the outputs signed for each of them
+OBJECTS_BATCH_LIMIT = 500
+OBJECT_URL_FIELDS = ('thumbnailLoc', 'proxyLoc')
+
+USER_GROUPS_CACHE_TTL = 60
+POOL_GROUPS_CACHE_TTL = 300
+
+# username -> (expiry time, groups) for tokens without a cognito:groups claim
+user_groups_cache = {}
+# (expiry time, groups) of every group in the user pool
+pool_groups_cache = (0, [])
+
 logging.basicConfig()
 logging.getLogger().setLevel(logging.INFO)
 
@@ -56,26 +81,90 @@ def validate_bucket_CORS(bucketName):
     return False 
  
 def validate_permissions(userGroups, bucket, folderKey):
-    resp = ddb_client.get_item(
-            TableName=PERMISSIONS_DB_TABLE,
-            Key={
-                "bucket": { 'S': bucket },
-                "folderKey": { 'S': folderKey }
-            },
-            AttributesToGet=[
-                'permissionGroups'
-            ]
-        )
+    return permissions_cache.has_access(userGroups, bucket, folderKey)
+
+# Read the folder rows directly under the prefix, or before the byParent index is
+# backfilled, every folder row in the bucket partition that starts with the prefix
+def query_folders(bucket_name, keyPrefix):
+    params = {
+        'TableName': PERMISSIONS_DB_TABLE,
+        'ProjectionExpression': 'folderKey, permissionGroups'
+    }
+
+    # Key conditions cannot compare against an empty string, so without the index
+    # the bucket root reads the whole partition
+    if prefix_index.is_ready():
+        params['IndexName'] = prefix_index.PARENT_INDEX_NAME
+        params['KeyConditionExpression'] = 'bucketParent = :parent'
+        params['ExpressionAttributeValues'] = { ':parent': { 'S': prefix_index.index_key(bucket_name, keyPrefix) } }
+    else:
+        params['ExpressionAttributeNames'] = { '#buck': 'bucket' }
+        params['ExpressionAttributeValues'] = { ':buckval': { 'S': bucket_name } }
+        if keyPrefix:
+            params['KeyConditionExpression'] = '#buck = :buckval and begins_with(folderKey, :plval)'
+            params['ExpressionAttributeValues'][':plval'] = { 'S': keyPrefix }
+        else:
+            params['KeyConditionExpression'] = '#buck = :buckval'
+
+    items = []
+    while True:
+        response = ddb_client.query(**params)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            break
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    return items
+
+# Parse the cognito:groups claim, which API Gateway passes as a string
+# such as "admin,editors" or "[admin editors]"
+def parse_group_claim(claim):
+    if isinstance(claim, list):
+        return claim
+    return [group for group in claim.strip('[]').replace(',', ' ').split() if group]
+
+def list_groups_for_user(user):
+    now = time.monotonic()
+    cached = user_groups_cache.get(user)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    userGroups = []
+    params = {'Username': user, 'UserPoolId': COGNITO_USER_POOL}
+    while True:
+        resp = cognito_client.admin_list_groups_for_user(**params)
+        userGroups.extend(group['GroupName'] for group in resp['Groups'])
+        if not resp.get('NextToken'):
+            break
+        params['NextToken'] = resp['NextToken']
+
+    user_groups_cache[user] = (now + USER_GROUPS_CACHE_TTL, userGroups)
+    return userGroups
+
+# Groups of the calling user, taken from the token claims when present
+def resolve_user_groups(claims):
+    if claims.get('cognito:groups'):
+        return parse_group_claim(claims['cognito:groups'])
+    return list_groups_for_user(claims['cognito:username'])
+
+def list_pool_groups():
+    global pool_groups_cache
+    now = time.monotonic()
+    if pool_groups_cache[0] > now:
+        return pool_groups_cache[1]
+
+    poolGroups = []
+    params = {'UserPoolId': COGNITO_USER_POOL}
+    while True:
+        resp = cognito_client.list_groups(**params)
+        poolGroups.extend(group['GroupName'] for group in resp['Groups'])
+        if not resp.get('NextToken'):
+            break
+        params['NextToken'] = resp['NextToken']
+
+    pool_groups_cache = (now + POOL_GROUPS_CACHE_TTL, poolGroups)
+    return poolGroups
 
-    try:
-        groups = resp['Item']['permissionGroups']['L']
-        for group in groups:
-            if group['S'] in userGroups:
-                return True
-        return False
-    except KeyError as e:
-        return False 
- 
 def get_s3_buckets(bucket_name):
     response = s3_client.list_buckets()
     resp_body = {}
@@ -96,61 +185,88 @@ def get_s3_ddb_data(bucket_name, next_token, keyPrefix, req_cxt):
     resp_body = {}
     resp_body['Folders'] = []
 
-    user = req_cxt['authorizer']['claims']['cognito:username']
-    resp = cognito_client.admin_list_groups_for_user(
-        Username=user,
-        UserPoolId=COGNITO_USER_POOL
-    )
-    
-    userGroups = []
-    for group in resp['Groups']:
-        userGroups.append(group['GroupName'])
-
-    response = ddb_client.scan(
-            TableName=PERMISSIONS_DB_TABLE,
-            FilterExpression='(#buck = :buckval) and contains(#pl, :plval)', 
-            ExpressionAttributeNames={
-                '#buck': 'bucket',
-                '#pl': 'folderKey'
-            },
-            ExpressionAttributeValues={
-                ':buckval': { 'S': bucket_name },
-                ':plval': { 'S': keyPrefix }
-            },
-        )
-    
-    if 'Items' in response:
-        res_items = response['Items']
-        for item in res_items:
-            permissionGroups = ddb_deserialize(item['permissionGroups'])
-            hasPermissions = validate_permissions(userGroups, bucket_name, item['folderKey']['S'])
-            displayKey = item['folderKey']['S'].replace(keyPrefix, '')
-            if hasPermissions and displayKey != '' and displayKey.count('/') == 1 and displayKey != '/':
-                folder_resp = {}
-                folder_resp['displayName'] = displayKey
-                folder_resp['objKey'] = item['folderKey']['S']
-                folder_resp['permissions'] = permissionGroups
-                resp_body['Folders'].append(folder_resp)
+    userGroups = resolve_user_groups(req_cxt['authorizer']['claims'])
+
+    keyPrefix = keyPrefix or ''
+    folders = query_folders(bucket_name, keyPrefix)
+    permissions_cache.prime(bucket_name, folders)
+
+    for item in folders:
+        if 'permissionGroups' not in item:
+            continue
+        permissionGroups = ddb_deserialize(item['permissionGroups'])
+        hasPermissions = has_group_access(userGroups, permissionGroups)
+        displayKey = item['folderKey']['S'][len(keyPrefix):]
+        if hasPermissions and displayKey != '' and displayKey.count('/') == 1 and displayKey != '/':
+            folder_resp = {}
+            folder_resp['displayName'] = displayKey
+            folder_resp['objKey'] = item['folderKey']['S']
+            folder_resp['permissions'] = permissionGroups
+            resp_body['Folders'].append(folder_resp)
         
     return util.generate_response_body(resp_code=200, body=resp_body)
     
 def get_s3_obj(bucket_name, key):
     obj_resp = {}
     displayKey = quote_plus(key.split('/')[-1])
-    params={
-        'Bucket': bucket_name,
-        'Key': key,
-        'ResponseContentDisposition': f'attachment; filename={displayKey};'
-    }
     
-    s3_resp = s3_client.generate_presigned_url('get_object', 
-                                                Params=params,
-                                                ExpiresIn=86400)
+    s3_resp = get_presigned_url(object_urls, bucket_name, key, f'attachment; filename={displayKey};')
     
     obj_resp['objUrl'] = s3_resp
 
     return util.generate_response_body(resp_code=200, body=obj_resp)
 
+# Sign the thumbnail and proxy of many assets in one request. Folder permissions
+# are checked once per folder rather than once per asset.
+def get_s3_objs(request_body, req_cxt):
+    bucketName = request_body['bucketName']
+    keys = list(dict.fromkeys(request_body['keys']))
+    # Refuse oversized requests rather than leave the keys past the limit unsigned
+    if len(keys) > OBJECTS_BATCH_LIMIT:
+        return util.generate_response_body(400, {
+            'reason': 'At most {} keys can be signed per request, {} were sent.'.format(OBJECTS_BATCH_LIMIT, len(keys)),
+            'limit': OBJECTS_BATCH_LIMIT
+        })
+    fields = [field for field in request_body.get('fields', OBJECT_URL_FIELDS) if field in OBJECT_URL_FIELDS]
+    userGroups = resolve_user_groups(req_cxt['authorizer']['claims'])
+
+    allowedFolders = {}
+    for key in keys:
+        prefixLoc = get_prefix_loc(key)
+        if prefixLoc not in allowedFolders:
+            # The bucket root is readable by everyone unless it has its own permission row
+            allowedFolders[prefixLoc] = permissions_cache.has_access(userGroups, bucketName, prefixLoc, default=(prefixLoc == '/'))
+
+    allowedKeys = [key for key in keys if allowedFolders[get_prefix_loc(key)]]
+    assets = ddb_handler.batch_check_for_existing([f"{bucketName}/{key}" for key in allowedKeys],
+        projection='bucketObjKey, ' + ', '.join(fields))
+
+    resp_body = {}
+    resp_body['objects'] = {}
+    resp_body['denied'] = [key for key in keys if not allowedFolders[get_prefix_loc(key)]]
+    for key in allowedKeys:
+        item = assets.get(f"{bucketName}/{key}")
+        if item is None:
+            continue
+        urls = {}
+        for field in fields:
+            if item.get(field, {}).get('S'):
+                objBucket, objKey = item[field]['S'].split('/', 1)
+                displayKey = quote_plus(objKey.split('/')[-1])
+                urls[field] = get_presigned_url(object_urls, objBucket, objKey, f'attachment; filename={displayKey};')
+        resp_body['objects'][key] = urls
+
+    return util.generate_response_body(resp_code=200, body=resp_body)
+
+# Reuse a signed URL while enough of it is valid, so the browser cache keeps working
+def get_presigned_url(cache, bucket_name, key, disposition):
+    url = cache.get_url(bucket_name, key, disposition)
+
+    stats = cache.stats()
+    if stats['lookups'] % PRESIGN_STATS_INTERVAL == 0:
+        logging.info(json.dumps({ 'presignedUrls': stats, 'expiresIn': cache.expires_in }))
+    return url
+
 def check_folder_exists(request_body):
     bucketName = request_body['bucketName']
     folder = request_body['key']
@@ -172,12 +288,7 @@ def get_user_groups(request_cxt):
     groups = request_cxt['authorizer']['claims']['cognito:groups']
 
     if 'admin' in groups:
-        allGroups = cognito_client.list_groups(
-            UserPoolId=COGNITO_USER_POOL
-        )
-
-        returnGroups = [group['GroupName'] for group in allGroups['Groups']]
-        obj_response_body['groups'] = returnGroups
+        obj_response_body['groups'] = list_pool_groups()
     
     else:
         obj_response_body['groups'] = []
@@ -17,27 +17,145 @@
 '''
 import os
 import json
-import boto3
+import time
+from urllib.parse import unquote_plus
+from concurrent.futures import ThreadPoolExecutor
+from maps_common import clients, prefix_index
 
 PERMISSIONS_DB_TABLE = os.environ['PERMISSIONS_DB_TABLE']
+TRACKING_DB_TABLE = os.environ['TRACKING_DB_TABLE']
+DELETE_WORKERS = int(os.environ.get('DELETE_WORKERS', '16'))
 
-ddb_client = boto3.client('dynamodb')
+BATCH_WRITE_LIMIT = 25
+BATCH_WRITE_MAX_RETRIES = 8
+# Hand the remaining folders to a fresh invocation once less time than this is left
+CONTINUATION_MARGIN_MS = 30000
+
+ddb_client = clients.get_client('dynamodb', max_pool_connections=DELETE_WORKERS)
+lambda_client = clients.get_client('lambda')
 
 def lambda_handler(event, context):
-    for record in event['Records']:
-        bucket = record['s3']['bucket']['name']
-        key = record['s3']['object']['key']
-        
-        try:
-            res = ddb_client.delete_item(
-                    TableName=PERMISSIONS_DB_TABLE,
-                    Key={
-                        'bucket': { 'S': bucket },
-                        'folderKey': { 'S': key }
-                    }
-                )
+    # S3 delete events, or the folders an earlier invocation did not get to
+    if 'continuation' in event:
+        folders = [(folder['bucket'], folder['folderKey']) for folder in event['continuation']]
+    else:
+        folders = [(record['s3']['bucket']['name'], unquote_plus(record['s3']['object']['key'])) for record in event['Records']]
+    folders = list(dict.fromkeys(folders))
 
-            return True
-        except KeyError as e:
-            print('Something bad happened', e)
+    counts = { 'folders': 0, 'assets': 0 }
+    with ThreadPoolExecutor(max_workers=DELETE_WORKERS) as executor:
+        for i, (bucket, folderKey) in enumerate(folders):
+            finished = delete_folder_tree(executor, bucket, folderKey, context, counts)
+            if not finished:
+                continue_later(folders[i:], context)
+                break
+
+    print(json.dumps(counts))
+    return counts
+
+# Remove the permission rows of a folder and every sub-folder, together with the
+# asset rows inside them. Rows are deleted as the work completes, so repeating the
+# call after an interruption picks up where it stopped.
+def delete_folder_tree(executor, bucket, folderKey, context, counts):
+    # Rows written before the byPrefixLoc index existed can only be found by scanning
+    indexed = prefix_index.is_ready()
+    if not indexed:
+        deleted, finished = scan_folder_assets(executor, bucket, folderKey, context)
+        counts['assets'] += deleted
+        if not finished:
+            return False
+
+    params = {
+        'TableName': PERMISSIONS_DB_TABLE,
+        'KeyConditionExpression': '#buck = :buckval and begins_with(folderKey, :plval)',
+        'ProjectionExpression': 'folderKey',
+        'ExpressionAttributeNames': { '#buck': 'bucket' },
+        'ExpressionAttributeValues': {
+            ':buckval': { 'S': bucket },
+            ':plval': { 'S': folderKey }
+        }
+    }
+
+    while True:
+        if context.get_remaining_time_in_millis() < CONTINUATION_MARGIN_MS:
             return False
+
+        response = ddb_client.query(**params)
+        folderKeys = [item['folderKey']['S'] for item in response['Items']]
+        if indexed:
+            for descendant in folderKeys:
+                deleted, finished = delete_folder_assets(executor, bucket, descendant, context)
+                counts['assets'] += deleted
+                if not finished:
+                    return False
+
+        # Folder rows go last so an interrupted run finds them again
+        delete_keys(executor, PERMISSIONS_DB_TABLE, [{ 'bucket': { 'S': bucket }, 'folderKey': { 'S': key } } for key in folderKeys])
+        counts['folders'] += len(folderKeys)
+
+        if 'LastEvaluatedKey' not in response:
+            return True
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def delete_folder_assets(executor, bucket, folderKey, context):
+    params = {
+        'TableName': TRACKING_DB_TABLE,
+        'IndexName': prefix_index.INDEX_NAME,
+        'KeyConditionExpression': 'bucketPrefixLoc = :loc',
+        'ProjectionExpression': 'bucketObjKey',
+        'ExpressionAttributeValues': { ':loc': { 'S': prefix_index.index_key(bucket, folderKey) } }
+    }
+    return delete_matching_assets(executor, ddb_client.query, params, context)
+
+# Delete every asset under the folder and its sub-folders with one filtered Scan
+def scan_folder_assets(executor, bucket, folderKey, context):
+    params = {
+        'TableName': TRACKING_DB_TABLE,
+        'FilterExpression': 'begins_with(bucketObjKey, :key)',
+        'ProjectionExpression': 'bucketObjKey',
+        'ExpressionAttributeValues': { ':key': { 'S': '{}/{}'.format(bucket, folderKey) } }
+    }
+    return delete_matching_assets(executor, ddb_client.scan, params, context)
+
+def delete_matching_assets(executor, read, params, context):
+    deleted = 0
+    while True:
+        if context.get_remaining_time_in_millis() < CONTINUATION_MARGIN_MS:
+            return deleted, False
+
+        response = read(**params)
+        keys = [{ 'bucketObjKey': item['bucketObjKey'] } for item in response['Items']]
+        delete_keys(executor, TRACKING_DB_TABLE, keys)
+        deleted += len(keys)
+
+        if 'LastEvaluatedKey' not in response:
+            return deleted, True
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+# Delete keys with BatchWriteItem, 25 per request and the requests in parallel
+def delete_keys(executor, table, keys):
+    chunks = [keys[i:i + BATCH_WRITE_LIMIT] for i in range(0, len(keys), BATCH_WRITE_LIMIT)]
+    for _ in executor.map(lambda chunk: delete_chunk(table, chunk), chunks):
+        pass
+
+def delete_chunk(table, keys):
+    request = { table: [{ 'DeleteRequest': { 'Key': key } } for key in keys] }
+
+    retries = 0
+    while request:
+        response = ddb_client.batch_write_item(RequestItems=request)
+        request = response.get('UnprocessedItems')
+        if request:
+            if retries >= BATCH_WRITE_MAX_RETRIES:
+                raise Exception('Unable to delete all keys from {} after {} retries'.format(table, retries))
+            # Exponential backoff before retrying throttled deletes
+            time.sleep(min(0.05 * (2 ** retries), 5))
+            retries += 1
+
+def continue_later(folders, context):
+    print("Continuing {} folders in a new invocation".format(len(folders)))
+    lambda_client.invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType='Event',
+        Payload=json.dumps({ 'continuation': [{ 'bucket': bucket, 'folderKey': folderKey } for bucket, folderKey in folders] })
+    )
@@ -18,67 +18,79 @@
 import json
 import os
 import re
-import boto3
-import http.client
+from botocore.exceptions import ClientError
+from maps_common import appsync, clients
 
-s3_client = boto3.client('s3')
-appsync_client = boto3.client('appsync')
+s3_client = clients.get_client('s3')
 
-GQL_API_ID = os.environ['GQL_API_ID']
-GQL_URL = os.environ['GQL_URL']
 SSM_OUTPUT_BUCKET = os.environ['SSM_OUTPUT_BUCKET']
 SSM_OUTPUT_PREFIX = os.environ['SSM_OUTPUT_PREFIX']
 
-def lambda_handler(event, context):
-    if event['detail']['status'] == 'Success':
-        commandId = event['detail']['command-id']
-        instanceId = event['resources'][0].split('/')[-1]
+DOWNLOAD_PATTERN = re.compile(r'\W*(download)\W*(s3:\/\/.*?\/.*)')
+UPLOAD_PATTERN = re.compile(r'\W*(upload)\W*(s3:\/\/.*?\/.*)')
 
-        try:
-            output = s3_client.get_object(Bucket=SSM_OUTPUT_BUCKET, Key=f"{SSM_OUTPUT_PREFIX}/{commandId}/{instanceId}/awsrunPowerShellScript/0.awsrunPowerShellScript/stdout")
-            cmd_output = output['Body'].read().decode('utf-8')
+def lambda_handler(event, context):
+    counts = { 'processed': 0, 'failed': 0, 'skipped': 0 }
+    if event['detail']['status'] != 'Success':
+        print(json.dumps(counts))
+        return counts
 
-            match_output = re.findall('\W*(download)\W*(s3:\/\/.*?\/.*)', cmd_output)
-            if len(match_output) > 0:
-                for match in match_output:
-                    bucketObjKey = match[1].split(' ')[0]
-                    bucket, objKey = bucketObjKey[5:].split('/', 1)
-                    update_status(bucket, objKey, 'S3_FSX')
-        
-            match_output = re.findall('\W*(upload)\W*(s3:\/\/.*?\/.*)', cmd_output)
-            if len(match_output) > 0:
-                for match in match_output:
-                    bucketObjKey = match[1].strip()
-                    bucket, objKey = bucketObjKey[5:].split('/', 1)
-                    update_status(bucket, objKey, 'S3')
+    commandId = event['detail']['command-id']
+    instanceId = event['resources'][0].split('/')[-1]
+    outputKey = f"{SSM_OUTPUT_PREFIX}/{commandId}/{instanceId}/awsrunPowerShellScript/0.awsrunPowerShellScript/stdout"
 
-        except:
-            pass
+    try:
+        output = s3_client.get_object(Bucket=SSM_OUTPUT_BUCKET, Key=outputKey)
+    except ClientError as e:
+        # Commands that print nothing leave no stdout object
+        if e.response['Error']['Code'] == 'NoSuchKey':
+            print("No output found at {}".format(outputKey))
+            print(json.dumps(counts))
+            return counts
+        raise e
 
-def update_status(bucket, key, fileStatus):
-    apiKeyRes = appsync_client.list_api_keys(apiId=GQL_API_ID, maxResults=10)
+    # Later lines for the same object win
+    statuses = {}
+    for line in output['Body'].iter_lines():
+        parsed = parse_output_line(line.decode('utf-8', errors='replace'))
+        if parsed is None:
+            continue
+        bucketObjKey, fileStatus = parsed
+        if bucketObjKey is None:
+            counts['skipped'] += 1
+            continue
+        if bucketObjKey in statuses:
+            counts['skipped'] += 1
+        statuses[bucketObjKey] = fileStatus
 
-    API_KEY = apiKeyRes['apiKeys'][0]['id']
-    
-    HOST = GQL_URL.replace('https://','').replace('/graphql','')
-    conn = http.client.HTTPSConnection(HOST, 443)
-    headers = {
-        'Content-type': 'application/graphql', 
-        'x-api-key': API_KEY,
-        'host': HOST
-    }
-    bucketObjKey = '{}/{}'.format(bucket, key)
+    counts['processed'], counts['failed'] = update_statuses(statuses)
+    print(json.dumps(counts))
+    if counts['failed'] > 0:
+        raise RuntimeError("{} of {} status updates failed for command {}".format(counts['failed'], len(statuses), commandId))
+    return counts
 
-    graphql_mutation = {
-        'query': 'mutation($in:UpdateMAPSAssetsInput!){updateMAPSAssets(input:$in){bucketObjKey videoCodec audioCodec fileFormat fileLength frameRate frameCount numAudioTracks numVideoTracks fileSize thumbnailLoc proxyLoc fileStatus editUser prefixLoc assetId lastModifiedDate creationDate}}',
-        'variables': '{ "in": {"bucketObjKey":"'+bucketObjKey+'", "fileStatus":"'+fileStatus+'"} }'
-    }
-    mutation_data = json.dumps(graphql_mutation)
+# Returns (bucketObjKey, fileStatus) for a MoveMedia.ps1 transfer line, with a
+# None key when the line names an unusable S3 URL, or None for any other line
+def parse_output_line(line):
+    match = DOWNLOAD_PATTERN.search(line)
+    if match is not None:
+        fileStatus = 'S3_FSX'
+        s3Url = match.group(2).rsplit(' to ', 1)[0]
+    else:
+        match = UPLOAD_PATTERN.search(line)
+        if match is None:
+            return None
+        fileStatus = 'S3'
+        s3Url = match.group(2).strip()
 
-    # Now Perform the Mutation
-    conn.request('POST', '/graphql', mutation_data, headers)
-    response = conn.getresponse()
+    bucketObjKey = s3Url[5:]
+    if '/' not in bucketObjKey or bucketObjKey.endswith('/'):
+        return None, fileStatus
+    return bucketObjKey, fileStatus
 
-    response_string = response.read().decode('utf-8')
-    print(response_string)
-    
\ No newline at end of file
+def update_statuses(statuses):
+    inputs = [{ 'bucketObjKey': bucketObjKey, 'fileStatus': fileStatus } for bucketObjKey, fileStatus in statuses.items()]
+    failures = appsync.get_client().execute_batch(appsync.BATCH_UPDATE_ASSETS_MUTATION, inputs)
+    for index, message in failures.items():
+        print("Unable to update {}: {}".format(inputs[index]['bucketObjKey'], message))
+    return len(inputs) - len(failures), len(failures)
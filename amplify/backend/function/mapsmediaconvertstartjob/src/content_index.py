@@ -0,0 +1,108 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+
+CONTENT_HASH_INDEX = 'byContentHash'
+
+FINGERPRINT_ETAG = 'etag'
+FINGERPRINT_SHA256 = 'sha256'
+
+HASH_PART_SIZE = 8 * 1024 * 1024
+HASH_WORKERS = 4
+
+# Asset fields copied onto an asset whose content was already transcoded
+REUSED_FIELDS = ['thumbnailLoc', 'proxyLoc', 'videoCodec', 'audioCodec', 'fileFormat', 'fileLength',
+    'frameRate', 'frameCount', 'numAudioTracks', 'numVideoTracks']
+
+def fingerprint(s3_client, bucket, key, eTag, fileSize, mode=FINGERPRINT_ETAG):
+    """
+    Content fingerprint of an object. The ETag plus size costs nothing but only matches
+    copies uploaded with the same part size; sha256 reads the whole object.
+    """
+    if mode == FINGERPRINT_SHA256:
+        return 'sha256:' + sha256_ranged(s3_client, bucket, key, fileSize)
+    return 'etag:{}:{}'.format(eTag.strip('"'), fileSize)
+
+def sha256_ranged(s3_client, bucket, key, fileSize, part_size=HASH_PART_SIZE, workers=HASH_WORKERS):
+    """Hash an object with parallel ranged GETs, feeding parts to the digest in order."""
+    def get_part(start):
+        end = min(start + part_size, fileSize) - 1
+        res = s3_client.get_object(Bucket=bucket, Key=key, Range='bytes={}-{}'.format(start, end))
+        return res['Body'].read()
+
+    digest = hashlib.sha256()
+    offsets = iter(range(0, fileSize, part_size))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Keep at most one part per worker in flight so memory stays bounded
+        pending = deque()
+        for start in offsets:
+            pending.append(executor.submit(get_part, start))
+            if len(pending) >= workers:
+                break
+        while pending:
+            digest.update(pending.popleft().result())
+            start = next(offsets, None)
+            if start is not None:
+                pending.append(executor.submit(get_part, start))
+    return digest.hexdigest()
+
+def _value(attribute):
+    return attribute.get('S', attribute.get('N'))
+
+def find_outputs(ddb_client, table, contentHash, bucketObjKey, profile):
+    """
+    Return the reusable fields of another transcoded asset with the same content and profile.
+    Until the byContentHash index is deployed (see README) nothing is reused.
+    """
+    kwargs = {
+        'TableName': table,
+        'IndexName': CONTENT_HASH_INDEX,
+        'KeyConditionExpression': 'contentHash = :contentHash',
+        'FilterExpression': 'bucketObjKey <> :self AND ingestProfile = :profile AND attribute_exists(proxyLoc) AND proxyLoc <> :empty',
+        'ExpressionAttributeValues': {
+            ':contentHash': { 'S': contentHash },
+            ':self': { 'S': bucketObjKey },
+            ':profile': { 'S': profile },
+            ':empty': { 'S': '' }
+        }
+    }
+    while True:
+        try:
+            resp = ddb_client.query(**kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ValidationException':
+                raise e
+            print("Unable to query {}, transcoding instead: {}".format(CONTENT_HASH_INDEX, e))
+            return None
+        if len(resp['Items']) > 0:
+            item = resp['Items'][0]
+            return { field: _value(item[field]) for field in REUSED_FIELDS if field in item }
+        if 'LastEvaluatedKey' not in resp:
+            return None
+        kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+def record(ddb_client, table, bucketObjKey, contentHash):
+    ddb_client.update_item(
+            TableName=table,
+            Key={ 'bucketObjKey': { 'S': bucketObjKey } },
+            UpdateExpression='SET contentHash = :contentHash',
+            ExpressionAttributeValues={ ':contentHash': { 'S': contentHash } }
+        )
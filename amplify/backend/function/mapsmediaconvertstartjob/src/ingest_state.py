@@ -0,0 +1,95 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+from botocore.exceptions import ClientError
+
+# S3 sequencers are hex strings of varying length, only comparable once padded to the same width
+SEQUENCER_WIDTH = 32
+
+CLAIMED = 'claimed'
+DUPLICATE = 'duplicate'
+STALE = 'stale'
+
+def pad_sequencer(sequencer):
+    return sequencer.rjust(SEQUENCER_WIDTH, '0')
+
+def _is_conditional_failure(e):
+    return e.response['Error']['Code'] == 'ConditionalCheckFailedException'
+
+def claim(ddb_client, table, bucketObjKey, eTag, fileSize, sequencer, profile):
+    """
+    Record the object version being ingested on its asset row with a conditional write.
+    Returns CLAIMED when a job should be created, DUPLICATE when the row already holds
+    the same content and profile, and STALE when a newer or identical event was processed.
+    """
+    values = {
+        ':eTag': { 'S': eTag },
+        ':size': { 'N': str(fileSize) },
+        ':profile': { 'S': profile }
+    }
+    update = 'SET ingestETag = :eTag, ingestSize = :size, ingestProfile = :profile'
+
+    if sequencer:
+        values[':sequencer'] = { 'S': pad_sequencer(sequencer) }
+        update += ', ingestSequencer = :sequencer'
+        condition = 'attribute_not_exists(ingestSequencer) OR ingestSequencer < :sequencer'
+    else:
+        # Events replayed without a sequencer can only be compared on content
+        condition = 'attribute_not_exists(ingestETag) OR ingestETag <> :eTag OR ingestSize <> :size OR ingestProfile <> :profile'
+
+    try:
+        resp = ddb_client.update_item(
+                TableName=table,
+                Key={ 'bucketObjKey': { 'S': bucketObjKey } },
+                UpdateExpression=update,
+                ConditionExpression=condition,
+                ExpressionAttributeValues=values,
+                ReturnValues='ALL_OLD'
+            )
+    except ClientError as e:
+        if _is_conditional_failure(e):
+            return STALE if sequencer else DUPLICATE
+        raise e
+
+    # A newer event for unchanged content still advances the sequencer but needs no new job
+    old = resp.get('Attributes', {})
+    if old.get('ingestETag') == values[':eTag'] and old.get('ingestSize') == values[':size'] \
+     and old.get('ingestProfile') == values[':profile']:
+        return DUPLICATE
+    return CLAIMED
+
+def release(ddb_client, table, bucketObjKey, eTag, sequencer):
+    """Drop a claim whose job could not be created so the redelivered event is processed again."""
+    if sequencer:
+        condition = 'ingestSequencer = :version'
+        values = { ':version': { 'S': pad_sequencer(sequencer) } }
+    else:
+        condition = 'ingestETag = :version'
+        values = { ':version': { 'S': eTag } }
+
+    try:
+        ddb_client.update_item(
+                TableName=table,
+                Key={ 'bucketObjKey': { 'S': bucketObjKey } },
+                UpdateExpression='REMOVE ingestETag, ingestSize, ingestProfile, ingestSequencer',
+                ConditionExpression=condition,
+                ExpressionAttributeValues=values
+            )
+    except ClientError as e:
+        # A newer event already replaced the claim
+        if not _is_conditional_failure(e):
+            raise e
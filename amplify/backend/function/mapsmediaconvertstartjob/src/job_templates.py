@@ -0,0 +1,129 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+import os
+import re
+import json
+import glob
+import threading
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+TEMPLATE_FILE_PATTERN = re.compile(r'^(?P<name>[A-Za-z0-9_\-]+)\.v(?P<version>\d+)\.json$')
+# Profiles with this prefix name a MediaConvert JobTemplate instead of a local file
+JOB_TEMPLATE_PREFIX = 'mediaconvert:'
+
+class TemplateError(Exception):
+    pass
+
+class JobTemplate:
+    """
+    MediaConvert job settings validated once and kept as serialized JSON.
+    Each asset only fills in the input file and the output destinations.
+    """
+
+    def __init__(self, name, version, settings, description=''):
+        validate_settings(name, settings)
+        self.name = name
+        self.version = version
+        self.description = description
+        self._settings_json = json.dumps(settings)
+        self._num_inputs = len(settings['Inputs'])
+        self._num_output_groups = len(settings['OutputGroups'])
+
+    def build_settings(self, file_input, destination):
+        settings = json.loads(self._settings_json)
+        for i in range(self._num_inputs):
+            settings['Inputs'][i]['FileInput'] = file_input
+        for i in range(self._num_output_groups):
+            settings['OutputGroups'][i]['OutputGroupSettings']['FileGroupSettings']['Destination'] = destination
+        return settings
+
+def validate_settings(name, settings):
+    if not isinstance(settings.get('Inputs'), list) or len(settings['Inputs']) == 0:
+        raise TemplateError(f'Template {name} must define at least one input')
+    if not isinstance(settings.get('OutputGroups'), list) or len(settings['OutputGroups']) == 0:
+        raise TemplateError(f'Template {name} must define at least one output group')
+
+    for group in settings['OutputGroups']:
+        groupSettings = group.get('OutputGroupSettings', {})
+        if groupSettings.get('Type') != 'FILE_GROUP_SETTINGS' or 'FileGroupSettings' not in groupSettings:
+            raise TemplateError(f'Template {name} output group {group.get("CustomName")} must be a file group')
+        if len(group.get('Outputs', [])) == 0:
+            raise TemplateError(f'Template {name} output group {group.get("CustomName")} has no outputs')
+
+class TemplateRegistry:
+    """Named MediaConvert profiles, loaded from versioned JSON files once per container."""
+
+    def __init__(self, template_dir=TEMPLATE_DIR, mediaconvert_client_factory=None):
+        self.template_dir = template_dir
+        self.mediaconvert_client_factory = mediaconvert_client_factory
+        self._templates = {}
+        self._lock = threading.Lock()
+        self._load_files()
+
+    def _load_files(self):
+        for path in sorted(glob.glob(os.path.join(self.template_dir, '*.json'))):
+            match = TEMPLATE_FILE_PATTERN.match(os.path.basename(path))
+            if match is None:
+                raise TemplateError(f'Unexpected template file name {os.path.basename(path)}, expected <name>.v<version>.json')
+
+            with open(path) as f:
+                doc = json.load(f)
+
+            name = match.group('name')
+            version = int(match.group('version'))
+            if doc.get('name') != name or doc.get('version') != version:
+                raise TemplateError(f'Template {path} declares {doc.get("name")} v{doc.get("version")}')
+
+            template = JobTemplate(name, version, doc['settings'], doc.get('description', ''))
+            self._templates.setdefault(name, {})[version] = template
+
+    def profiles(self):
+        return {name: max(versions) for name, versions in self._templates.items()}
+
+    def get(self, profile, version=None):
+        """Return the template for a profile, the latest version unless one is given."""
+        if profile.startswith(JOB_TEMPLATE_PREFIX):
+            return self._get_job_template(profile[len(JOB_TEMPLATE_PREFIX):])
+
+        versions = self._templates.get(profile)
+        if not versions:
+            raise TemplateError(f'Unknown MediaConvert profile {profile}')
+        if version is None:
+            version = max(versions)
+        if version not in versions:
+            raise TemplateError(f'Unknown version {version} of MediaConvert profile {profile}')
+        return versions[version]
+
+    def _get_job_template(self, templateName):
+        profile = JOB_TEMPLATE_PREFIX + templateName
+        with self._lock:
+            if profile in self._templates:
+                return self._templates[profile][0]
+
+            if self.mediaconvert_client_factory is None:
+                raise TemplateError(f'No MediaConvert client available to load {templateName}')
+            resp = self.mediaconvert_client_factory().get_job_template(Name=templateName)
+
+            jobTemplate = resp['JobTemplate']
+            settings = dict(jobTemplate['Settings'])
+            # Job templates carry input options without the Inputs list itself
+            if 'Inputs' not in settings:
+                settings['Inputs'] = [{}]
+            template = JobTemplate(profile, 0, settings, jobTemplate.get('Description', ''))
+            self._templates[profile] = {0: template}
+            return template
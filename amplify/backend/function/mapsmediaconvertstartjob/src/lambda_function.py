@@ -16,11 +16,19 @@
  * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 '''
 import os
-import boto3
 import json
 import uuid
-import http.client
+import time
+import job_templates
+import ingest_state
+import content_index
 from urllib.parse import unquote_plus
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from maps_common import appsync
+from maps_common import permissions
+from maps_common import prefix_index
+from maps_common import clients
 
 MEDIA_CONVERT_ROLE = os.environ['MEDIA_CONVERT_ROLE']
 OUTPUT_BUCKET = os.environ['OUTPUT_BUCKET']
@@ -28,14 +36,31 @@ TRACKING_DB_TABLE = os.environ['TRACKING_DB_TABLE']
 PERMISSIONS_DB_TABLE = os.environ['PERMISSIONS_DB_TABLE']
 COGNITO_USER_POOL = os.environ['COGNITO_USER_POOL']
 REGION = os.environ['AWS_REGION']
-GQL_API_ID = os.environ['GQL_API_ID']
-GQL_URL = os.environ['GQL_URL']
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '10'))
+DEFAULT_PROFILE = os.environ.get('MEDIACONVERT_PROFILE', 'proxy_thumbnail')
+FINGERPRINT_MODE = os.environ.get('FINGERPRINT_MODE', content_index.FINGERPRINT_ETAG)
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'MAPS/Ingest')
 
-s3_client = boto3.client('s3')
-cognito_client = boto3.client('cognito-idp')
-ddb_client = boto3.client('dynamodb')
-appsync_client = boto3.client('appsync')
-mediaconvert = boto3.client("mediaconvert", region_name=REGION)
+# Outcomes of process_s3_record, reported as metrics per invocation
+JOB_CREATED = 'JobsCreated'
+OUTPUTS_REUSED = 'OutputsReused'
+SKIPPED_DUPLICATE = 'JobsSkippedDuplicate'
+SKIPPED_STALE = 'JobsSkippedStale'
+FOLDER_REGISTERED = 'FoldersRegistered'
+
+# Each record worker may hash its object with several ranged reads at once
+s3_client = clients.get_client('s3', max_pool_connections=MAX_WORKERS * content_index.HASH_WORKERS)
+cognito_client = clients.get_client('cognito-idp', max_pool_connections=MAX_WORKERS)
+ddb_client = clients.get_client('dynamodb', max_pool_connections=MAX_WORKERS)
+
+permissions_cache = permissions.get_cache(PERMISSIONS_DB_TABLE)
+
+# Record workers live as long as the container. The AppSync client keeps one
+# keep-alive connection per thread, so reusing the threads reuses the connections.
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+# Job settings are loaded and validated once per container
+template_registry = job_templates.TemplateRegistry(mediaconvert_client_factory=lambda: get_mediaconvert_client())
 
 def asset_exists(bucketObjKey):
     resp = ddb_client.get_item(
@@ -56,314 +81,233 @@ def asset_exists(bucketObjKey):
     except KeyError as e:
         return False, ''
 
-def get_folder_permissions(bucket, folderKey):
-    resp = ddb_client.get_item(
-            TableName=PERMISSIONS_DB_TABLE,
-            Key={
-                "bucket": { 'S': bucket },
-                "folderKey": { 'S': folderKey }
-            },
-            AttributesToGet=[
-                'permissionGroups'
-            ]
-        )
-    
-    try:
-        groups = resp['Item']['permissionGroups']['L']
-        return True, groups
-    except KeyError as e:
-        return False, ''
-
-def create_asset(bucket, key, assetId, eventTime, fileSize, api_key):
-    appsync_create(bucket, key, assetId, eventTime, fileSize, api_key)
+# Asset writes stay one mutation per record. Each record's create must land before its
+# claim and its update after it, and records run on separate workers, so a batch would
+# hold every record back for the slowest one and share its failures across messages.
+def create_asset(bucket, key, assetId, eventTime, fileSize):
+    appsync_create(bucket, key, assetId, eventTime, fileSize)
 
-def update_asset(bucket, key, eventTime, fileSize, api_key):
-    appsync_update(bucket, key, eventTime, fileSize, api_key)
+def update_asset(bucket, key, eventTime, fileSize):
+    appsync_update(bucket, key, eventTime, fileSize)
 
-def appsync_update(bucket, key, eventTime, fileSize, api_key):
+def appsync_update(bucket, key, eventTime, fileSize):
     bucketObjKey = "{}/{}".format(bucket, key)
-    
-    HOST = GQL_URL.replace('https://','').replace('/graphql','')
-    conn = http.client.HTTPSConnection(HOST, 443)
-    headers = {
-        'Content-type': 'application/graphql', 
-        'x-api-key': api_key,
-        'host': HOST
-    }
 
-    graphql_mutation = {
-        'query': 'mutation($in:UpdateMAPSAssetsInput!){updateMAPSAssets(input:$in){bucketObjKey videoCodec audioCodec fileFormat fileLength frameRate frameCount numAudioTracks numVideoTracks fileSize thumbnailLoc proxyLoc fileStatus editUser prefixLoc assetId lastModifiedDate creationDate}}',
-        'variables': '{ "in": {"bucketObjKey":"'+bucketObjKey+'", "lastModifiedDate":"'+eventTime+'", "fileStatus":"'+'S3'+'", "fileSize":"'+str(fileSize)+'"} }'
+    variables = {
+        'in': {
+            'bucketObjKey': bucketObjKey,
+            'prefixLoc': appsync.get_prefix_loc(key),
+            'lastModifiedDate': eventTime,
+            'fileStatus': 'S3',
+            'fileSize': str(fileSize)
+        }
     }
-    mutation_data = json.dumps(graphql_mutation)
-
-    # Now Perform the Mutation
-    conn.request('POST', '/graphql', mutation_data, headers)
-    response = conn.getresponse()
 
-    response_string = response.read().decode('utf-8')
-    print(response_string)
+    response = appsync.get_client().execute(appsync.UPDATE_ASSET_MUTATION, variables)
+    print(response)
+    # The caller holds a claim that must be released when the update does not land
+    if response.get('errors'):
+        raise Exception("Unable to update asset {}: {}".format(bucketObjKey, response['errors']))
 
-def appsync_create(bucket, key, assetId, eventTime, fileSize, api_key):
+def appsync_create(bucket, key, assetId, eventTime, fileSize):
     bucketObjKey = "{}/{}".format(bucket, key)
-    prefixLoc = key.rsplit('/', 1)[0]
-    if key.count('/') == 0:
-        prefixLoc = '/'
-    elif prefixLoc[-1] != '/':
-        prefixLoc += '/'
-
-    HOST = GQL_URL.replace('https://','').replace('/graphql','')
-    conn = http.client.HTTPSConnection(HOST, 443)
-    headers = {
-        'Content-type': 'application/graphql', 
-        'x-api-key': api_key,
-        'host': HOST
+    prefixLoc = appsync.get_prefix_loc(key)
+
+    variables = {
+        'in': {
+            'bucketObjKey': bucketObjKey,
+            'assetId': assetId,
+            'creationDate': eventTime,
+            'lastModifiedDate': eventTime,
+            'fileSize': str(fileSize),
+            'fileStatus': 'S3',
+            'editUser': '',
+            'prefixLoc': prefixLoc
+        }
     }
 
-    graphql_mutation = {
-        'query': 'mutation($in:CreateMAPSAssetsInput!){createMAPSAssets(input:$in){bucketObjKey assetId creationDate lastModifiedDate fileSize fileStatus editUser prefixLoc}}',
-        'variables': '{ "in": {"bucketObjKey":"'+bucketObjKey+'", "assetId":"'+assetId+'", "creationDate":"'+eventTime+'", "lastModifiedDate":"'+eventTime+'", "fileSize":"'+str(fileSize)+'", "fileStatus":"'+'S3'+'", "editUser":"'+''+'", "prefixLoc":"'+prefixLoc+'"} }'
+    response = appsync.get_client().execute(appsync.CREATE_ASSET_MUTATION, variables)
+    print(response)
+
+def reuse_outputs(bucket, key, outputs):
+    variables = {
+        'in': {
+            'bucketObjKey': "{}/{}".format(bucket, key),
+            'prefixLoc': appsync.get_prefix_loc(key),
+            'fileStatus': 'S3',
+            **outputs
+        }
     }
-    mutation_data = json.dumps(graphql_mutation)
 
-    # Now Perform the Mutation
-    conn.request('POST', '/graphql', mutation_data, headers)
-    response = conn.getresponse()
+    response = appsync.get_client().execute(appsync.UPDATE_ASSET_MUTATION, variables)
+    print(response)
+
+# The account endpoint is resolved once and kept in SSM for new containers
+def get_mediaconvert_client():
+    return clients.get_mediaconvert_client(REGION, max_pool_connections=MAX_WORKERS)
 
-    response_string = response.read().decode('utf-8')
-    print(response_string)
+# Write counters in CloudWatch embedded metric format so no PutMetricData call is needed
+def emit_metrics(counts):
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [[]],
+                'Metrics': [{ 'Name': name, 'Unit': 'Count' } for name in counts]
+            }]
+        },
+        **counts
+    }))
 
 def lambda_handler(event, context):
     print(event)
+
+    # Fan out every S3 record of every SQS message onto one bounded pool
+    futures = {}
+    failed_messages = set()
+    outcomes = { JOB_CREATED: 0, OUTPUTS_REUSED: 0, SKIPPED_DUPLICATE: 0, SKIPPED_STALE: 0, FOLDER_REGISTERED: 0 }
     for record in event['Records']:
-        parsed_record = json.loads(record['body'])
-        bucket = parsed_record['Records'][0]['s3']['bucket']['name']
-        key = unquote_plus(parsed_record['Records'][0]['s3']['object']['key'])
-        eventTime = parsed_record['Records'][0]['eventTime']
-        fileSize = parsed_record['Records'][0]['s3']['object']['size']
-        
-        # Restrict calls on folders
-        if key[-1] != '/':
-            objExists, assetId = asset_exists("{}/{}".format(bucket, key))
-            folderExists, permissionGroups = get_folder_permissions(bucket, key.rsplit('/', 1)[0])
-            
-            apiKeyRes = appsync_client.list_api_keys(apiId=GQL_API_ID, maxResults=10)
-
-            API_KEY = apiKeyRes['apiKeys'][0]['id']
-
-            if not objExists:
-                assetId = str(uuid.uuid4())
-                create_asset(bucket, key, assetId, eventTime, fileSize, API_KEY)
-            else:
-                update_asset(bucket, key, eventTime, fileSize, API_KEY)
-                
-            file_input = "s3://" + bucket + "/" + key
-            thumbnail_destination = "s3://" + OUTPUT_BUCKET + "/" + 'private/assets/' + assetId + "/"
-            proxy_destination = "s3://" + OUTPUT_BUCKET + "/" + 'private/assets/' + assetId + "/"
-        
-            # Get user-defined location for generic data file
-            thumbnail_position = 7
-        
-            # Get mediaconvert endpoint from cache if available
-            if ("MEDIACONVERT_ENDPOINT" in os.environ):
-                mediaconvert_endpoint = os.environ["MEDIACONVERT_ENDPOINT"]
-                customer_mediaconvert = boto3.client("mediaconvert", region_name=REGION, endpoint_url=mediaconvert_endpoint)
-            else:
-                try:
-                    response = mediaconvert.describe_endpoints()
-                except Exception as e:
-                    print("Exception:\n", e)
-                    raise e
-                else:
-                    mediaconvert_endpoint = response["Endpoints"][0]["Url"]
-                    # Cache the mediaconvert endpoint in order to avoid getting throttled on
-                    # the DescribeEndpoints API.
-                    os.environ["MEDIACONVERT_ENDPOINT"] = mediaconvert_endpoint
-                    customer_mediaconvert = boto3.client("mediaconvert", region_name=REGION, endpoint_url=mediaconvert_endpoint)
-        
+        messageId = record['messageId']
+        try:
+            parsed_record = json.loads(record['body'])
+        except Exception as e:
+            print("Unable to parse message {}: {}".format(messageId, e))
+            failed_messages.add(messageId)
+            continue
+
+        # Producers other than S3 can pick a MediaConvert profile per message
+        profile = DEFAULT_PROFILE
+        if 'profile' in record.get('messageAttributes', {}):
+            profile = record['messageAttributes']['profile']['stringValue']
+
+        # S3 sends an s3:TestEvent without Records when notifications are configured
+        for s3_record in parsed_record.get('Records', []):
+            futures[executor.submit(process_s3_record, s3_record, profile)] = messageId
+
+    for future in as_completed(futures):
+        try:
+            outcomes[future.result()] += 1
+        except Exception as e:
+            print("Exception:\n", e)
+            failed_messages.add(futures[future])
+
+    print("Processed {} S3 records, {} messages failed".format(len(futures), len(failed_messages)))
+    transcoded = outcomes[JOB_CREATED] + outcomes[OUTPUTS_REUSED]
+    if transcoded > 0:
+        print("Reused existing outputs for {} of {} assets".format(outcomes[OUTPUTS_REUSED], transcoded))
+    emit_metrics(outcomes)
+
+    # Only the failed messages return to the queue
+    return {
+        'batchItemFailures': [{ 'itemIdentifier': messageId } for messageId in failed_messages]
+    }
+
+def process_s3_record(s3_record, profile=DEFAULT_PROFILE):
+    bucket = s3_record['s3']['bucket']['name']
+    key = unquote_plus(s3_record['s3']['object']['key'])
+    eventTime = s3_record['eventTime']
+    fileSize = s3_record['s3']['object']['size']
+    
+    # Restrict calls on folders
+    if key[-1] != '/':
+        bucketObjKey = "{}/{}".format(bucket, key)
+        eTag = s3_record['s3']['object'].get('eTag', '')
+        sequencer = s3_record['s3']['object'].get('sequencer', '')
+        objExists, assetId = asset_exists(bucketObjKey)
+
+        # The asset row must exist before it can hold a claim, and an older or
+        # redelivered event must not overwrite the metadata of a newer one
+        if not objExists:
+            assetId = str(uuid.uuid4())
+            create_asset(bucket, key, assetId, eventTime, fileSize)
+            claim = ingest_state.claim(ddb_client, TRACKING_DB_TABLE, bucketObjKey, eTag, fileSize, sequencer, profile)
+        else:
+            claim = ingest_state.claim(ddb_client, TRACKING_DB_TABLE, bucketObjKey, eTag, fileSize, sequencer, profile)
+            if claim == ingest_state.STALE:
+                print("Skipping stale event for {} ({})".format(bucketObjKey, sequencer))
+                return SKIPPED_STALE
             try:
-                response = customer_mediaconvert.create_job(
-                    Role=MEDIA_CONVERT_ROLE,
-                    Settings={
-                        "OutputGroups": [
-                            {
-                                "CustomName": "thumbnail",
-                                "Name": "File Group",
-                                "Outputs": [
-                                    {
-                                        "ContainerSettings": {
-                                            "Container": "RAW"
-                                        },
-                                        "VideoDescription": {
-                                            "ScalingBehavior": "DEFAULT",
-                                            "TimecodeInsertion": "DISABLED",
-                                            "AntiAlias": "ENABLED",
-                                            "Sharpness": 50,
-                                            "CodecSettings": {
-                                                "Codec": "FRAME_CAPTURE",
-                                                "FrameCaptureSettings": {
-                                                    "FramerateNumerator": 1,
-                                                    "FramerateDenominator": thumbnail_position,
-                                                    "MaxCaptures": 2,
-                                                    "Quality": 80
-                                                }
-                                            },
-                                            "DropFrameTimecode": "ENABLED",
-                                            "ColorMetadata": "INSERT"
-                                        },
-                                        "Extension": "jpg",
-                                        "NameModifier": "_thumbnail"
-                                    }
-                                ],
-                                "OutputGroupSettings": {
-                                    "Type": "FILE_GROUP_SETTINGS",
-                                    "FileGroupSettings": {
-                                        "Destination": thumbnail_destination
-                                    }
-                                }
-                            },
-                            {
-                                "CustomName": "proxy",
-                                "Name": "File Group",
-                                "Outputs": [
-                                    {
-                                        "VideoDescription": {
-                                            "ScalingBehavior": "DEFAULT",
-                                            "TimecodeInsertion": "DISABLED",
-                                            "AntiAlias": "ENABLED",
-                                            "Sharpness": 50,
-                                            "CodecSettings": {
-                                                "Codec": "H_264",
-                                                "H264Settings": {
-                                                    "InterlaceMode": "PROGRESSIVE",
-                                                    "NumberReferenceFrames": 3,
-                                                    "Syntax": "DEFAULT",
-                                                    "Softness": 0,
-                                                    "GopClosedCadence": 1,
-                                                    "GopSize": 90,
-                                                    "Slices": 1,
-                                                    "GopBReference": "DISABLED",
-                                                    "SlowPal": "DISABLED",
-                                                    "SpatialAdaptiveQuantization": "ENABLED",
-                                                    "TemporalAdaptiveQuantization": "ENABLED",
-                                                    "FlickerAdaptiveQuantization": "DISABLED",
-                                                    "EntropyEncoding": "CABAC",
-                                                    "Bitrate": 5000000,
-                                                    "FramerateControl": "SPECIFIED",
-                                                    "RateControlMode": "CBR",
-                                                    "CodecProfile": "MAIN",
-                                                    "Telecine": "NONE",
-                                                    "MinIInterval": 0,
-                                                    "AdaptiveQuantization": "HIGH",
-                                                    "CodecLevel": "AUTO",
-                                                    "FieldEncoding": "PAFF",
-                                                    "SceneChangeDetect": "ENABLED",
-                                                    "QualityTuningLevel": "SINGLE_PASS",
-                                                    "FramerateConversionAlgorithm": "DUPLICATE_DROP",
-                                                    "UnregisteredSeiTimecode": "DISABLED",
-                                                    "GopSizeUnits": "FRAMES",
-                                                    "ParControl": "SPECIFIED",
-                                                    "NumberBFramesBetweenReferenceFrames": 2,
-                                                    "RepeatPps": "DISABLED",
-                                                    "FramerateNumerator": 30,
-                                                    "FramerateDenominator": 1,
-                                                    "ParNumerator": 1,
-                                                    "ParDenominator": 1
-                                                }
-                                            },
-                                            "AfdSignaling": "NONE",
-                                            "DropFrameTimecode": "ENABLED",
-                                            "RespondToAfd": "NONE",
-                                            "ColorMetadata": "INSERT"
-                                        },
-                                        "AudioDescriptions": [
-                                            {
-                                                "AudioTypeControl": "FOLLOW_INPUT",
-                                                "CodecSettings": {
-                                                    "Codec": "AAC",
-                                                    "AacSettings": {
-                                                        "AudioDescriptionBroadcasterMix": "NORMAL",
-                                                        "RateControlMode": "CBR",
-                                                        "CodecProfile": "LC",
-                                                        "CodingMode": "CODING_MODE_2_0",
-                                                        "RawFormat": "NONE",
-                                                        "SampleRate": 48000,
-                                                        "Specification": "MPEG4",
-                                                        "Bitrate": 64000
-                                                    }
-                                                },
-                                                "LanguageCodeControl": "FOLLOW_INPUT",
-                                                "AudioSourceName": "Audio Selector 1"
-                                            }
-                                        ],
-                                        "ContainerSettings": {
-                                            "Container": "MP4",
-                                            "Mp4Settings": {
-                                                "CslgAtom": "INCLUDE",
-                                                "FreeSpaceBox": "EXCLUDE",
-                                                "MoovPlacement": "PROGRESSIVE_DOWNLOAD"
-                                            }
-                                        },
-                                        "Extension": "mp4",
-                                        "NameModifier": "_proxy"
-                                    }
-                                ],
-                                "OutputGroupSettings": {
-                                    "Type": "FILE_GROUP_SETTINGS",
-                                    "FileGroupSettings": {
-                                        "Destination": proxy_destination
-                                    }
-                                }
-                            }
-                            ],
-                        "Inputs": [{
-                            "AudioSelectors": {
-                                "Audio Selector 1": {
-                                    "Offset": 0,
-                                    "DefaultSelection": "DEFAULT",
-                                    "ProgramSelection": 1
-                                }
-                            },
-                            "VideoSelector": {
-                                "ColorSpace": "FOLLOW"
-                            },
-                            "FileInput": file_input
-                        }]
-                    }
-                )
-        
-            # TODO: Add support for boto client error handling
+                update_asset(bucket, key, eventTime, fileSize)
             except Exception as e:
                 print("Exception:\n", e)
+                # A sequenced event advanced the row even for unchanged content, and its
+                # redelivery would be skipped as stale unless the claim is dropped
+                if claim == ingest_state.CLAIMED or sequencer:
+                    ingest_state.release(ddb_client, TRACKING_DB_TABLE, bucketObjKey, eTag, sequencer)
                 raise e
-            else:
-                job_id = response['Job']['Id']
-        
+
+        if claim != ingest_state.CLAIMED:
+            print("Skipping unchanged content for {} ({})".format(bucketObjKey, eTag))
+            return SKIPPED_DUPLICATE
+
+        file_input = "s3://" + bucket + "/" + key
+        destination = "s3://" + OUTPUT_BUCKET + "/" + 'private/assets/' + assetId + "/"
+
+        try:
+            # Copies of content that was already transcoded with this profile share its outputs
+            contentHash = content_index.fingerprint(s3_client, bucket, key, eTag, fileSize, FINGERPRINT_MODE)
+            content_index.record(ddb_client, TRACKING_DB_TABLE, bucketObjKey, contentHash)
+            outputs = content_index.find_outputs(ddb_client, TRACKING_DB_TABLE, contentHash, bucketObjKey, profile)
+            if outputs is not None:
+                print("Reusing outputs {} for {}".format(outputs['proxyLoc'], bucketObjKey))
+                reuse_outputs(bucket, key, outputs)
+                return OUTPUTS_REUSED
+
+            template = template_registry.get(profile)
+            customer_mediaconvert = get_mediaconvert_client()
+            response = customer_mediaconvert.create_job(
+                Role=MEDIA_CONVERT_ROLE,
+                Settings=template.build_settings(file_input, destination),
+                UserMetadata={ 'profile': template.name, 'profileVersion': str(template.version) }
+            )
+
+        # TODO: Add support for boto client error handling
+        except Exception as e:
+            print("Exception:\n", e)
+            ingest_state.release(ddb_client, TRACKING_DB_TABLE, bucketObjKey, eTag, sequencer)
+            raise e
         else:
-            res = s3_client.head_object(Bucket=bucket, Key=key)
-            owner = res['Metadata']['owner']
-            
-            # Structure permission group
-            permissionGroup = { 'L': [] }
-            
-            res = cognito_client.admin_list_groups_for_user(
-                    Username=owner,
-                    UserPoolId=COGNITO_USER_POOL
-                )
-            groups = res['Groups']
-            if len(groups) > 0:
-                groupName = groups[0]['GroupName']
-                if groupName != 'admin':
-                    permissionGroup['L'].append({'S': 'admin'})
-                permissionGroup['L'].append({'S': groups[0]['GroupName']})
-            else:
+            job_id = response['Job']['Id']
+            return JOB_CREATED
+
+    else:
+        res = s3_client.head_object(Bucket=bucket, Key=key)
+        owner = res['Metadata']['owner']
+
+        # Structure permission group
+        permissionGroup = { 'L': [] }
+
+        res = cognito_client.admin_list_groups_for_user(
+                Username=owner,
+                UserPoolId=COGNITO_USER_POOL
+            )
+        groups = res['Groups']
+        if len(groups) > 0:
+            groupName = groups[0]['GroupName']
+            if groupName != 'admin':
                 permissionGroup['L'].append({'S': 'admin'})
-            
+            permissionGroup['L'].append({'S': groups[0]['GroupName']})
+        else:
+            permissionGroup['L'].append({'S': 'admin'})
+
+        # Folders that already have permissions keep them. Move jobs copy folder markers
+        # before writing the moved permission rows, and this event can land either side.
+        try:
             res = ddb_client.put_item(
                     TableName=PERMISSIONS_DB_TABLE,
                     Item={
                         'bucket': { 'S': bucket },
                         'folderKey': { 'S': key },
+                        'bucketParent': { 'S': prefix_index.parent_key(bucket, key) },
                         'permissionGroups': permissionGroup
-                    }
+                    },
+                    ConditionExpression='attribute_not_exists(folderKey)'
                 )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise e
+            print("Keeping existing permissions of {}/{}".format(bucket, key))
+            return FOLDER_REGISTERED
+        permissions_cache.put(bucket, key, [group['S'] for group in permissionGroup['L']])
+        return FOLDER_REGISTERED
\ No newline at end of file
@@ -0,0 +1,634 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+import os
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from maps_common import clients
+from maps_common import prefix_index
+from maps_common.appsync import get_prefix_loc
+
+PERMISSIONS_DB_TABLE = os.environ['PERMISSIONS_DB_TABLE']
+TRACKING_DB_TABLE = os.environ['TRACKING_DB_TABLE']
+MOVE_JOBS_DB_TABLE = os.environ['MOVE_JOBS_DB_TABLE']
+MOVE_WORKERS = int(os.environ.get('MOVE_WORKERS', '16'))
+
+# CopyObject handles objects up to 5 GB, larger ones are copied part by part
+MAX_COPY_OBJECT_SIZE = 5 * 1024 ** 3
+COPY_PART_SIZE = int(os.environ.get('COPY_PART_SIZE', str(512 * 1024 ** 2)))
+MAX_COPY_PARTS = 10000
+# Objects moved between progress updates, and the bytes they may add up to
+MOVE_CHUNK_SIZE = 50
+MOVE_CHUNK_BYTES = int(os.environ.get('MOVE_CHUNK_BYTES', str(32 * 1024 ** 3)))
+
+BATCH_GET_LIMIT = 100
+TRANSACT_WRITE_LIMIT = 100
+TRANSACT_MAX_RETRIES = 5
+DELETE_OBJECTS_LIMIT = 1000
+MAX_JOB_ERRORS = 50
+# Hand the rest of the job to a fresh invocation once less time than this is left
+CONTINUATION_MARGIN_MS = 120000
+
+PENDING = 'PENDING'
+RUNNING = 'RUNNING'
+COMPLETE = 'COMPLETE'
+COMPLETE_WITH_ERRORS = 'COMPLETE_WITH_ERRORS'
+FAILED = 'FAILED'
+
+RETRYABLE_ERRORS = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'TransactionInProgressException', 'InternalServerError')
+
+s3_client = clients.get_client('s3', max_pool_connections=MOVE_WORKERS)
+ddb_client = clients.get_client('dynamodb', max_pool_connections=MOVE_WORKERS)
+lambda_client = clients.get_client('lambda')
+
+def lambda_handler(event, context):
+    jobId = event['jobId']
+    response = ddb_client.get_item(TableName=MOVE_JOBS_DB_TABLE, Key={ 'jobId': { 'S': jobId } }, ConsistentRead=True)
+    item = response.get('Item')
+    if item is None or item['jobStatus']['S'] not in (PENDING, RUNNING):
+        print("Move job {} is not active".format(jobId))
+        return
+
+    # Retried or duplicated events must not run the job next to the invocation that owns it
+    leaseOwner = str(uuid.uuid4())
+    if not acquire_lease(jobId, leaseOwner, event.get('leaseOwner'), context):
+        print("Move job {} is running in another invocation".format(jobId))
+        return
+
+    with ThreadPoolExecutor(max_workers=MOVE_WORKERS) as executor:
+        job = MoveJob(item, event, executor, context, leaseOwner)
+        try:
+            if 'objectsTotal' not in item and not job.plan():
+                job.continue_later()
+                return
+            if not job.run():
+                job.continue_later()
+                return
+            job.finish()
+        except Exception as e:
+            print("Exception:\n", e)
+            job.set_status(FAILED, str(e))
+            raise e
+
+class MoveJob:
+    """
+    Moves files and folder trees to a new prefix inside one bucket. Objects are
+    copied server side, their asset rows rewritten in transactions and only then
+    removed from the old location, so an interrupted job can be resumed from the
+    listing position recorded in the continuation event.
+    """
+
+    def __init__(self, item, event, executor, context, leaseOwner):
+        self.jobId = item['jobId']['S']
+        self.bucket = item['bucket']['S']
+        self.user = item['user']['S']
+        self.moves = [(move['M']['oldKey']['S'], move['M']['newKey']['S']) for move in item['moves']['L']]
+        self.executor = executor
+        self.context = context
+        self.leaseOwner = leaseOwner
+
+        # Listing position and any multipart copy left unfinished by the last invocation
+        self.position = event.get('position', { 'move': 0, 'startAfter': '' })
+        self.upload = event.get('upload')
+        # Counts and listing position of a plan left unfinished by the last invocation
+        self.planned = event.get('plan')
+
+    def out_of_time(self):
+        return self.context.get_remaining_time_in_millis() < CONTINUATION_MARGIN_MS
+
+    # Count what the job has to move so clients can report progress. Large trees
+    # can take longer to list than one invocation has, so counting resumes too.
+    def plan(self):
+        planned = self.planned or { 'move': 0, 'startAfter': '', 'objects': 0, 'bytes': 0 }
+        for index in range(planned['move'], len(self.moves)):
+            oldKey, newKey = self.moves[index]
+            if index != planned['move']:
+                planned.update({ 'move': index, 'startAfter': '' })
+
+            for page in self.list_sources(oldKey, planned['startAfter']):
+                for obj in page:
+                    if not obj['Key'].endswith('/'):
+                        planned['objects'] += 1
+                        planned['bytes'] += obj['Size']
+                if page:
+                    planned['startAfter'] = page[-1]['Key']
+                if self.out_of_time():
+                    self.planned = planned
+                    return False
+        objects = planned['objects']
+        size = planned['bytes']
+        self.planned = None
+
+        ddb_client.update_item(
+            TableName=MOVE_JOBS_DB_TABLE,
+            Key={ 'jobId': { 'S': self.jobId } },
+            UpdateExpression='SET jobStatus = :status, objectsTotal = :objects, bytesTotal = :size, objectsMoved = :zero, bytesMoved = :zero, objectsFailed = :zero, updatedAt = :now',
+            ExpressionAttributeValues={
+                ':status': { 'S': RUNNING },
+                ':objects': { 'N': str(objects) },
+                ':size': { 'N': str(size) },
+                ':zero': { 'N': '0' },
+                ':now': { 'S': str(datetime.now(timezone.utc)) }
+            }
+        )
+        return True
+
+    def run(self):
+        for index in range(self.position['move'], len(self.moves)):
+            oldKey, newKey = self.moves[index]
+            if index != self.position['move']:
+                self.position = { 'move': index, 'startAfter': '' }
+
+            for page in self.list_sources(oldKey, self.position['startAfter']):
+                for chunk in self.chunk_objects(page):
+                    if self.out_of_time():
+                        return False
+                    handled = self.move_chunk(oldKey, newKey, chunk)
+                    if handled:
+                        self.position['startAfter'] = chunk[handled - 1]['Key']
+                    if handled < len(chunk):
+                        return False
+        return True
+
+    # A single file, or every object under a folder in pages of up to 1000
+    def list_sources(self, oldKey, startAfter):
+        if not oldKey.endswith('/'):
+            if startAfter:
+                return
+            try:
+                head = s3_client.head_object(Bucket=self.bucket, Key=oldKey)
+            except ClientError as e:
+                # Already moved by an earlier invocation
+                if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                    return
+                raise e
+            yield [{ 'Key': oldKey, 'Size': head['ContentLength'] }]
+            return
+
+        params = { 'Bucket': self.bucket, 'Prefix': oldKey }
+        if startAfter:
+            params['StartAfter'] = startAfter
+        while True:
+            response = s3_client.list_objects_v2(**params)
+            yield response.get('Contents', [])
+            if not response.get('IsTruncated'):
+                return
+            params['ContinuationToken'] = response['NextContinuationToken']
+
+    # Objects over the CopyObject limit always get a chunk of their own
+    def chunk_objects(self, objects):
+        chunk = []
+        chunkBytes = 0
+        for obj in objects:
+            large = obj['Size'] > MAX_COPY_OBJECT_SIZE
+            if chunk and (large or len(chunk) >= MOVE_CHUNK_SIZE or chunkBytes + obj['Size'] > MOVE_CHUNK_BYTES):
+                yield chunk
+                chunk = []
+                chunkBytes = 0
+            chunk.append(obj)
+            chunkBytes += obj['Size']
+            if large:
+                yield chunk
+                chunk = []
+                chunkBytes = 0
+        if chunk:
+            yield chunk
+
+    # Returns how many of the objects were handled, always a leading run of them.
+    # Fewer than all means the invocation ran short of time part way through.
+    def move_chunk(self, oldKey, newKey, objects):
+        targets = [(obj['Key'], newKey + obj['Key'][len(oldKey):], obj['Size']) for obj in objects]
+        errors = {}
+
+        if len(targets) == 1 and targets[0][2] > MAX_COPY_OBJECT_SIZE:
+            source, dest, size = targets[0]
+            error = self.copy_multipart(source, dest, size)
+            if error is INTERRUPTED:
+                return 0
+            if error:
+                errors[source] = error
+        else:
+            targets, errors = self.copy_objects(targets)
+
+        # Folder markers stay until the whole tree has moved, see finish()
+        copied = [target for target in targets if target[0] not in errors and not target[0].endswith('/')]
+        errors.update(self.move_asset_rows(copied))
+
+        moved = [target for target in copied if target[0] not in errors]
+        rejected = [target for target in copied if target[0] in errors]
+        self.delete_objects([source for source, dest, size in moved])
+        # Drop the copies of objects whose rows could not be moved
+        self.delete_objects([dest for source, dest, size in rejected])
+
+        failed = [source for source, dest, size in targets if source in errors]
+        if moved or failed:
+            self.record_progress(len(moved), sum(size for source, dest, size in moved), failed, errors)
+        return len(targets)
+
+    # Copy with at most MOVE_WORKERS copies in flight, and stop starting new ones once
+    # time runs short so the rows of every started copy are still written. Returns the
+    # targets that were copied or failed and the errors among them.
+    def copy_objects(self, targets):
+        started = []
+        inFlight = deque()
+        errors = {}
+        for target in targets:
+            if len(inFlight) >= MOVE_WORKERS:
+                self.wait_copy(inFlight.popleft(), errors)
+            # Start at least one copy per invocation so a resumed job always advances
+            if started and self.out_of_time():
+                break
+            inFlight.append((target[0], self.executor.submit(self.copy_object, target[0], target[1])))
+            started.append(target)
+        while inFlight:
+            self.wait_copy(inFlight.popleft(), errors)
+        return started, errors
+
+    def wait_copy(self, copy, errors):
+        source, future = copy
+        error = future.result()
+        if error:
+            errors[source] = error
+
+    def copy_object(self, source, dest):
+        try:
+            s3_client.copy_object(Bucket=self.bucket, Key=dest, CopySource={ 'Bucket': self.bucket, 'Key': source })
+        except Exception as e:
+            return str(e)
+        return None
+
+    # Copy an object over 5 GB with UploadPartCopy, the parts in parallel. Parts are
+    # submitted in waves so the job can stop between them and resume the upload later.
+    def copy_multipart(self, source, dest, size):
+        if self.upload and self.upload['sourceKey'] == source and self.upload['destKey'] == dest:
+            uploadId = self.upload['uploadId']
+            done = self.list_copied_parts(dest, uploadId)
+        else:
+            head = s3_client.head_object(Bucket=self.bucket, Key=source)
+            params = { 'Bucket': self.bucket, 'Key': dest, 'Metadata': head.get('Metadata', {}) }
+            for field in ('ContentType', 'ContentDisposition', 'ContentEncoding', 'ContentLanguage', 'CacheControl', 'StorageClass'):
+                if head.get(field):
+                    params[field] = head[field]
+            uploadId = s3_client.create_multipart_upload(**params)['UploadId']
+            done = {}
+
+        partSize = max(COPY_PART_SIZE, -(-size // MAX_COPY_PARTS))
+        parts = [(number, start, min(start + partSize, size) - 1) for number, start in enumerate(range(0, size, partSize), 1)]
+        pending = [part for part in parts if part[0] not in done]
+
+        try:
+            for i in range(0, len(pending), MOVE_WORKERS):
+                # Copy at least one wave per invocation so a resumed upload always advances
+                if i and self.out_of_time():
+                    self.upload = { 'sourceKey': source, 'destKey': dest, 'uploadId': uploadId }
+                    return INTERRUPTED
+                for number, eTag in self.executor.map(lambda part: self.copy_part(source, dest, uploadId, part), pending[i:i + MOVE_WORKERS]):
+                    done[number] = eTag
+
+            s3_client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=dest,
+                UploadId=uploadId,
+                MultipartUpload={ 'Parts': [{ 'PartNumber': number, 'ETag': done[number] } for number in sorted(done)] }
+            )
+        except Exception as e:
+            print("Exception:\n", e)
+            s3_client.abort_multipart_upload(Bucket=self.bucket, Key=dest, UploadId=uploadId)
+            self.upload = None
+            return str(e)
+
+        self.upload = None
+        return None
+
+    def copy_part(self, source, dest, uploadId, part):
+        number, first, last = part
+        response = s3_client.upload_part_copy(
+            Bucket=self.bucket,
+            Key=dest,
+            UploadId=uploadId,
+            PartNumber=number,
+            CopySource={ 'Bucket': self.bucket, 'Key': source },
+            CopySourceRange='bytes={}-{}'.format(first, last)
+        )
+        return number, response['CopyPartResult']['ETag']
+
+    def list_copied_parts(self, dest, uploadId):
+        done = {}
+        params = { 'Bucket': self.bucket, 'Key': dest, 'UploadId': uploadId }
+        while True:
+            response = s3_client.list_parts(**params)
+            for part in response.get('Parts', []):
+                done[part['PartNumber']] = part['ETag']
+            if not response.get('IsTruncated'):
+                return done
+            params['PartNumberMarker'] = response['NextPartNumberMarker']
+
+    # Rewrite the asset rows of copied objects under their new keys. Returns a dict
+    # of source key -> error for the objects whose rows could not be moved.
+    def move_asset_rows(self, copied):
+        rows = self.get_asset_rows([f"{self.bucket}/{source}" for source, dest, size in copied])
+
+        writes = []
+        for source, dest, size in copied:
+            item = rows.get(f"{self.bucket}/{source}")
+            if item is None:
+                continue
+            writes.append((source, [
+                { 'Put': { 'TableName': TRACKING_DB_TABLE, 'Item': moved_asset_row(item, self.bucket, dest) } },
+                {
+                    'Delete': {
+                        'TableName': TRACKING_DB_TABLE,
+                        'Key': { 'bucketObjKey': item['bucketObjKey'] },
+                        # Files checked out by someone else stay where they are
+                        'ConditionExpression': 'fileStatus <> :out OR editUser = :user',
+                        'ExpressionAttributeValues': {
+                            ':out': { 'S': 'S3_DOWNLOADED' },
+                            ':user': { 'S': self.user }
+                        }
+                    }
+                }
+            ]))
+        return self.transact(writes, 'File is checked out by another user.')
+
+    def get_asset_rows(self, bucketObjKeys):
+        rows = {}
+        for i in range(0, len(bucketObjKeys), BATCH_GET_LIMIT):
+            request = {
+                TRACKING_DB_TABLE: {
+                    'Keys': [{ 'bucketObjKey': { 'S': key } } for key in bucketObjKeys[i:i + BATCH_GET_LIMIT]],
+                    'ConsistentRead': True
+                }
+            }
+            retries = 0
+            while request:
+                response = ddb_client.batch_get_item(RequestItems=request)
+                for item in response['Responses'].get(TRACKING_DB_TABLE, []):
+                    rows[item['bucketObjKey']['S']] = item
+                request = response.get('UnprocessedKeys')
+                if request:
+                    if retries >= TRANSACT_MAX_RETRIES:
+                        raise Exception('Unable to read all asset rows after {} retries'.format(retries))
+                    time.sleep(min(0.05 * (2 ** retries), 5))
+                    retries += 1
+        return rows
+
+    # Run (key, operations) pairs as TransactWriteItems, packing whole pairs into
+    # transactions of up to 100 operations and running the transactions in parallel
+    def transact(self, writes, conditionMessage):
+        groups = []
+        group = []
+        count = 0
+        for key, operations in writes:
+            if group and count + len(operations) > TRANSACT_WRITE_LIMIT:
+                groups.append(group)
+                group = []
+                count = 0
+            group.append((key, operations))
+            count += len(operations)
+        if group:
+            groups.append(group)
+
+        errors = {}
+        for groupErrors in self.executor.map(lambda group: transact_group(group, conditionMessage), groups):
+            errors.update(groupErrors)
+        return errors
+
+    def delete_objects(self, keys):
+        for i in range(0, len(keys), DELETE_OBJECTS_LIMIT):
+            response = s3_client.delete_objects(
+                Bucket=self.bucket,
+                Delete={ 'Objects': [{ 'Key': key } for key in keys[i:i + DELETE_OBJECTS_LIMIT]], 'Quiet': True }
+            )
+            for error in response.get('Errors', []):
+                print("Unable to delete {}: {}".format(error['Key'], error.get('Message')))
+
+    def record_progress(self, moved, movedBytes, failed, errors):
+        ddb_client.update_item(
+            TableName=MOVE_JOBS_DB_TABLE,
+            Key={ 'jobId': { 'S': self.jobId } },
+            UpdateExpression='SET updatedAt = :now ADD objectsMoved :moved, bytesMoved :bytes, objectsFailed :failed',
+            ExpressionAttributeValues={
+                ':now': { 'S': str(datetime.now(timezone.utc)) },
+                ':moved': { 'N': str(moved) },
+                ':bytes': { 'N': str(movedBytes) },
+                ':failed': { 'N': str(len(failed)) }
+            }
+        )
+        if failed:
+            self.record_errors(['{}: {}'.format(key, errors[key]) for key in failed])
+
+    # Keep the first few errors on the job row for the client to show
+    def record_errors(self, messages):
+        try:
+            ddb_client.update_item(
+                TableName=MOVE_JOBS_DB_TABLE,
+                Key={ 'jobId': { 'S': self.jobId } },
+                UpdateExpression='SET jobErrors = list_append(if_not_exists(jobErrors, :empty), :errors)',
+                ConditionExpression='attribute_not_exists(jobErrors) OR size(jobErrors) < :max',
+                ExpressionAttributeValues={
+                    ':empty': { 'L': [] },
+                    ':errors': { 'L': [{ 'S': message } for message in messages[:MAX_JOB_ERRORS]] },
+                    ':max': { 'N': str(MAX_JOB_ERRORS) }
+                }
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise e
+
+    # Move the permission rows and folder markers once every object has been moved
+    def finish(self):
+        for oldKey, newKey in self.moves:
+            if oldKey.endswith('/'):
+                self.move_folder(oldKey, newKey)
+
+        response = ddb_client.get_item(
+            TableName=MOVE_JOBS_DB_TABLE,
+            Key={ 'jobId': { 'S': self.jobId } },
+            ProjectionExpression='objectsFailed',
+            ConsistentRead=True
+        )
+        failed = int(response.get('Item', {}).get('objectsFailed', { 'N': '0' })['N'])
+        self.set_status(COMPLETE_WITH_ERRORS if failed else COMPLETE)
+
+    def move_folder(self, oldKey, newKey):
+        # Folders still holding objects that could not be moved stay at the old location too
+        markers = []
+        keep = set()
+        for page in self.list_sources(oldKey, ''):
+            for obj in page:
+                if obj['Key'].endswith('/'):
+                    markers.append(obj['Key'])
+                    continue
+                parts = obj['Key'][len(oldKey):].split('/')[:-1]
+                keep.add(oldKey)
+                for depth in range(1, len(parts) + 1):
+                    keep.add(oldKey + '/'.join(parts[:depth]) + '/')
+
+        writes = []
+        for item in self.get_folder_rows(oldKey):
+            folderKey = item['folderKey']['S']
+            row = dict(item)
+            row['folderKey'] = { 'S': newKey + folderKey[len(oldKey):] }
+            row['bucketParent'] = { 'S': prefix_index.parent_key(self.bucket, row['folderKey']['S']) }
+            operations = [{ 'Put': { 'TableName': PERMISSIONS_DB_TABLE, 'Item': row } }]
+            if folderKey not in keep:
+                operations.append({ 'Delete': { 'TableName': PERMISSIONS_DB_TABLE, 'Key': { 'bucket': item['bucket'], 'folderKey': item['folderKey'] } } })
+            writes.append((folderKey, operations))
+
+        errors = self.transact(writes, 'Folder permissions changed during the move.')
+        for folderKey, error in errors.items():
+            print("Unable to move permissions of {}: {}".format(folderKey, error))
+
+        # Removing a folder marker clears the rows under the old folder, so it goes last
+        self.delete_objects([marker for marker in markers if marker not in keep and marker not in errors])
+
+    def get_folder_rows(self, folderKey):
+        params = {
+            'TableName': PERMISSIONS_DB_TABLE,
+            'KeyConditionExpression': '#buck = :buckval and begins_with(folderKey, :plval)',
+            'ExpressionAttributeNames': { '#buck': 'bucket' },
+            'ExpressionAttributeValues': {
+                ':buckval': { 'S': self.bucket },
+                ':plval': { 'S': folderKey }
+            },
+            'ConsistentRead': True
+        }
+
+        rows = []
+        while True:
+            response = ddb_client.query(**params)
+            rows.extend(response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                return rows
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def set_status(self, status, error=None):
+        update = 'SET jobStatus = :status, updatedAt = :now'
+        values = {
+            ':status': { 'S': status },
+            ':now': { 'S': str(datetime.now(timezone.utc)) }
+        }
+        if error:
+            update += ', jobError = :error'
+            values[':error'] = { 'S': error }
+
+        ddb_client.update_item(
+            TableName=MOVE_JOBS_DB_TABLE,
+            Key={ 'jobId': { 'S': self.jobId } },
+            UpdateExpression=update,
+            ExpressionAttributeValues=values
+        )
+
+    def continue_later(self):
+        print("Continuing move job {} in a new invocation".format(self.jobId))
+        # The next invocation takes over this invocation's lease
+        payload = { 'jobId': self.jobId, 'position': self.position, 'leaseOwner': self.leaseOwner }
+        if self.upload:
+            payload['upload'] = self.upload
+        if self.planned:
+            payload['plan'] = self.planned
+        lambda_client.invoke(
+            FunctionName=self.context.invoked_function_arn,
+            InvocationType='Event',
+            Payload=json.dumps(payload)
+        )
+
+# Returned by copy_multipart when the invocation ran out of time mid-copy
+INTERRUPTED = object()
+
+# Take the job for this invocation until its deadline. A free or expired lease can be
+# taken, and a held one only by the continuation its owner handed it to.
+def acquire_lease(jobId, leaseOwner, handoff, context):
+    now = time.time()
+    condition = 'attribute_not_exists(leaseOwner) OR leaseExpiresAt < :now'
+    values = {
+        ':owner': { 'S': leaseOwner },
+        ':expires': { 'N': str(int(now + context.get_remaining_time_in_millis() / 1000) + 1) },
+        ':now': { 'N': str(int(now)) }
+    }
+    if handoff:
+        condition += ' OR leaseOwner = :handoff'
+        values[':handoff'] = { 'S': handoff }
+
+    try:
+        ddb_client.update_item(
+            TableName=MOVE_JOBS_DB_TABLE,
+            Key={ 'jobId': { 'S': jobId } },
+            UpdateExpression='SET leaseOwner = :owner, leaseExpiresAt = :expires',
+            ConditionExpression=condition,
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise e
+        return False
+    return True
+
+def moved_asset_row(item, bucket, dest):
+    prefixLoc = get_prefix_loc(dest)
+    row = dict(item)
+    row['bucketObjKey'] = { 'S': f"{bucket}/{dest}" }
+    row['objName'] = { 'S': dest.split('/')[-1] }
+    row['prefixLoc'] = { 'S': prefixLoc }
+    row['bucketPrefixLoc'] = { 'S': f"{bucket}:{prefixLoc}" }
+    # Sequencers only order events for the same key
+    row.pop('ingestSequencer', None)
+    return row
+
+# Commit one transaction, dropping the pairs whose conditions failed and retrying
+# the rest. Returns a dict of key -> error for the pairs that were not written.
+def transact_group(group, conditionMessage):
+    errors = {}
+    retries = 0
+    while group:
+        try:
+            ddb_client.transact_write_items(TransactItems=[operation for key, operations in group for operation in operations])
+            return errors
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code == 'TransactionCanceledException':
+                reasons = e.response.get('CancellationReasons', [])
+                rejected = set()
+                index = 0
+                for key, operations in group:
+                    for operation in operations:
+                        if index < len(reasons) and reasons[index].get('Code') == 'ConditionalCheckFailed':
+                            rejected.add(key)
+                        index += 1
+                if rejected:
+                    for key in rejected:
+                        errors[key] = conditionMessage
+                    group = [(key, operations) for key, operations in group if key not in rejected]
+                    continue
+            elif code not in RETRYABLE_ERRORS:
+                for key, operations in group:
+                    errors[key] = str(e)
+                return errors
+
+            # Conflicts with concurrent writes and throttling clear up on retry
+            if retries >= TRANSACT_MAX_RETRIES:
+                for key, operations in group:
+                    errors[key] = str(e)
+                return errors
+            time.sleep(min(0.05 * (2 ** retries), 5))
+            retries += 1
+    return errors
@@ -17,22 +17,17 @@
 '''
 import os
 import json
-import boto3
+import media_probe
 from pymediainfo import MediaInfo
-
-from botocore.client import Config
-
-import http.client
+from maps_common import appsync, clients
 
 TRACKING_DB_TABLE = os.environ['TRACKING_DB_TABLE']
 REGION = os.environ['AWS_REGION']
-GQL_API_ID = os.environ['GQL_API_ID']
-GQL_URL = os.environ['GQL_URL']
+PROBE_BLOCK_SIZE = int(os.environ.get('PROBE_BLOCK_SIZE', media_probe.BLOCK_SIZE))
+PROBE_MAX_BYTES = int(os.environ.get('PROBE_MAX_BYTES', media_probe.MAX_PROBE_BYTES))
 
-s3_client = boto3.client('s3', config=Config(signature_version='s3v4', s3={'addressing_style': 'virtual'}))
-ddb_client = boto3.client('dynamodb')
-mediaconvert = boto3.client("mediaconvert", region_name=REGION)
-appsync_client = boto3.client('appsync')
+s3_client = clients.get_client('s3')
+ddb_client = clients.get_client('dynamodb')
 
 def lambda_handler(event, context):
     thumbnail_loc = ""
@@ -43,22 +38,8 @@ def lambda_handler(event, context):
     if jobStatus == 'COMPLETE':
         jobId = event['detail']['jobId']
         
-        # Get mediaconvert endpoint from cache if available
-        if ("MEDIACONVERT_ENDPOINT" in os.environ):
-            mediaconvert_endpoint = os.environ["MEDIACONVERT_ENDPOINT"]
-            customer_mediaconvert = boto3.client("mediaconvert", region_name=REGION, endpoint_url=mediaconvert_endpoint)
-        else:
-            try:
-                response = mediaconvert.describe_endpoints()
-            except Exception as e:
-                print("Exception:\n", e)
-                raise e
-            else:
-                mediaconvert_endpoint = response["Endpoints"][0]["Url"]
-                # Cache the mediaconvert endpoint in order to avoid getting throttled on
-                # the DescribeEndpoints API.
-                os.environ["MEDIACONVERT_ENDPOINT"] = mediaconvert_endpoint
-                customer_mediaconvert = boto3.client("mediaconvert", region_name=REGION, endpoint_url=mediaconvert_endpoint)
+        # Reuses the container's client, the endpoint is looked up once and kept in SSM
+        customer_mediaconvert = clients.get_mediaconvert_client(REGION)
         
         response = customer_mediaconvert.get_job(Id=jobId)
         inputs = response['Job']['Settings']['Inputs']
@@ -85,12 +66,14 @@ def lambda_handler(event, context):
 def extract_tech_metadata(bucket, key):
     ddb_item = {}
     metadata_json = {}
-    # The number of seconds that the Signed URL is valid:
-    signed_url_expiration = 300
-    # Generate a signed URL for reading a file from S3 via HTTPS
-    signed_url = s3_client.generate_presigned_url('get_object', Params={'Bucket': bucket, 'Key': key}, ExpiresIn=signed_url_expiration)
-    # Launch MediaInfo
-    media_info = MediaInfo.parse(signed_url)
+    # Read only the container header and index regions MediaInfo asks for
+    reader = media_probe.RangedS3Reader(s3_client, bucket, key, block_size=PROBE_BLOCK_SIZE)
+    try:
+        media_info = media_probe.probe(reader, max_bytes=PROBE_MAX_BYTES)
+    except Exception as e:
+        print("Ranged probe failed, falling back to a full read:\n", e)
+        media_info = parse_signed_url(bucket, key)
+    print(json.dumps({ 'probe': 's3://{}/{}'.format(bucket, key), **reader.stats() }))
     # Save the result
     metadata_json = json.loads(media_info.to_json())
     
@@ -120,38 +103,37 @@ def extract_tech_metadata(bucket, key):
     
     return ddb_item
 
+def parse_signed_url(bucket, key):
+    # The number of seconds that the Signed URL is valid:
+    signed_url_expiration = 300
+    # Generate a signed URL for reading a file from S3 via HTTPS
+    signed_url = s3_client.generate_presigned_url('get_object', Params={'Bucket': bucket, 'Key': key}, ExpiresIn=signed_url_expiration)
+    # Launch MediaInfo
+    return MediaInfo.parse(signed_url)
+
 def update_asset(bucket, key, ddb_item):
     appsync_update(bucket, key, ddb_item)
 
 def appsync_update(bucket, key, ddb_item):
-    apiKeyRes = appsync_client.list_api_keys(apiId=GQL_API_ID, maxResults=10)
-    
-    API_KEY = apiKeyRes['apiKeys'][0]['id']
-    
-    HOST = GQL_URL.replace('https://','').replace('/graphql','')
-    conn = http.client.HTTPSConnection(HOST, 443)
-    headers = {
-        'Content-type': 'application/graphql', 
-        'x-api-key': API_KEY,
-        'host': HOST
-    }
     bucketObjKey = '{}/{}'.format(bucket, key)
-    prefixLoc = key.rsplit('/', 1)[0]
-    if key.count('/') == 0:
-        prefixLoc = '/'
-    elif prefixLoc[-1] != '/':
-        prefixLoc += '/'
+    prefixLoc = appsync.get_prefix_loc(key)
 
-    graphql_mutation = {
-        'query': 'mutation($in:UpdateMAPSAssetsInput!){updateMAPSAssets(input:$in){bucketObjKey videoCodec audioCodec fileFormat fileLength frameRate frameCount numAudioTracks numVideoTracks fileSize thumbnailLoc proxyLoc fileStatus editUser prefixLoc assetId lastModifiedDate creationDate}}',
-        'variables': '{ "in": {"bucketObjKey":"'+bucketObjKey+'", "prefixLoc":"'+prefixLoc+'", "videoCodec":"'+ddb_item['videoCodec']+'", "audioCodec":"'+ddb_item['audioCodec']+'", "fileFormat":"'+ddb_item['fileFormat']+'", "fileLength":"'+ddb_item['fileLength']+'", "frameRate":"'+ddb_item['frameRate']+'", "frameCount":"'+ddb_item['frameCount']+'", "numAudioTracks":"'+ddb_item['numAudioTracks']+'", "numVideoTracks":"'+ddb_item['numVideoTracks']+'", "thumbnailLoc":"'+ddb_item['thumbnailLoc']+'", "proxyLoc":"'+ddb_item['proxyLoc']+'"} }'
+    variables = {
+        'in': {
+            'bucketObjKey': bucketObjKey,
+            'prefixLoc': prefixLoc,
+            'videoCodec': ddb_item['videoCodec'],
+            'audioCodec': ddb_item['audioCodec'],
+            'fileFormat': ddb_item['fileFormat'],
+            'fileLength': ddb_item['fileLength'],
+            'frameRate': ddb_item['frameRate'],
+            'frameCount': ddb_item['frameCount'],
+            'numAudioTracks': ddb_item['numAudioTracks'],
+            'numVideoTracks': ddb_item['numVideoTracks'],
+            'thumbnailLoc': ddb_item['thumbnailLoc'],
+            'proxyLoc': ddb_item['proxyLoc']
+        }
     }
-    mutation_data = json.dumps(graphql_mutation)
-
-    # Now Perform the Mutation
-    conn.request('POST', '/graphql', mutation_data, headers)
-    response = conn.getresponse()
 
-    response_string = response.read().decode('utf-8')
-    print(response_string)
-    
\ No newline at end of file
+    response = appsync.get_client().execute(appsync.UPDATE_ASSET_MUTATION, variables)
+    print(response)
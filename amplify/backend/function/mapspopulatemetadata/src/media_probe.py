@@ -0,0 +1,218 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+import re
+import ctypes
+import threading
+from collections import OrderedDict
+from pymediainfo import MediaInfo
+
+BLOCK_SIZE = 1024 * 1024
+HEAD_BLOCKS = 2
+TAIL_BLOCKS = 2
+MAX_CACHED_BLOCKS = 64
+# Stop feeding MediaInfo past this many bytes so a file that needs a full scan stays bounded
+MAX_PROBE_BYTES = 64 * 1024 * 1024
+# Feed size per MediaInfo_Open_Buffer_Continue call
+FEED_SIZE = 256 * 1024
+
+# Bit set in the Open_Buffer_Continue status once MediaInfo has everything it needs
+STATUS_FINISHED = 0x08
+NO_SEEK = ctypes.c_uint64(-1).value
+CONTENT_RANGE_PATTERN = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+class RangedS3Reader:
+    """
+    Seekable view of an S3 object backed by ranged GETs.
+    Blocks are fetched on demand, adjacent missing blocks share one request and
+    fetched blocks stay in a small LRU cache.
+    """
+
+    def __init__(self, s3_client, bucket, key, block_size=BLOCK_SIZE, max_blocks=MAX_CACHED_BLOCKS):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.size = None
+        self.position = 0
+        self.bytesRead = 0
+        self.requests = 0
+        self.cacheHits = 0
+        self._blocks = OrderedDict()
+
+    def _get_range(self, start, end):
+        res = self.s3_client.get_object(Bucket=self.bucket, Key=self.key, Range='bytes={}-{}'.format(start, end))
+        body = res['Body'].read()
+        self.requests += 1
+        self.bytesRead += len(body)
+
+        match = CONTENT_RANGE_PATTERN.match(res.get('ContentRange', ''))
+        if match is not None:
+            self.size = int(match.group(3))
+        elif self.size is None:
+            # Objects smaller than the range come back whole
+            self.size = len(body)
+        return body
+
+    def _store(self, index, data):
+        self._blocks[index] = data
+        self._blocks.move_to_end(index)
+        while len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+
+    def fetch_blocks(self, first, last):
+        """Make sure blocks first..last (inclusive) are cached, one GET per run of missing blocks."""
+        if self.size is not None:
+            last = min(last, (self.size - 1) // self.block_size)
+
+        index = first
+        while index <= last:
+            if index in self._blocks:
+                self._blocks.move_to_end(index)
+                self.cacheHits += 1
+                index += 1
+                continue
+
+            runEnd = index
+            while runEnd + 1 <= last and (runEnd + 1) not in self._blocks:
+                runEnd += 1
+
+            data = self._get_range(index * self.block_size, (runEnd + 1) * self.block_size - 1)
+            for offset in range(0, len(data), self.block_size):
+                self._store(index + offset // self.block_size, data[offset:offset + self.block_size])
+
+            if self.size is not None:
+                last = min(last, (self.size - 1) // self.block_size)
+            index = runEnd + 1
+
+    def prefetch(self, headBlocks=HEAD_BLOCKS, tailBlocks=TAIL_BLOCKS):
+        """Fetch the head (which also reveals the object size) and then the tail of the object."""
+        self.fetch_blocks(0, headBlocks - 1)
+        lastBlock = (self.size - 1) // self.block_size if self.size else 0
+        if lastBlock >= headBlocks:
+            self.fetch_blocks(max(headBlocks, lastBlock - tailBlocks + 1), lastBlock)
+
+    def seek(self, offset):
+        self.position = offset
+
+    def tell(self):
+        return self.position
+
+    def read(self, length):
+        if self.size is None:
+            self.prefetch()
+        end = min(self.position + length, self.size)
+        if self.position >= end:
+            return b''
+
+        first = self.position // self.block_size
+        last = (end - 1) // self.block_size
+        self.fetch_blocks(first, last)
+
+        chunks = []
+        for index in range(first, last + 1):
+            block = self._blocks.get(index)
+            if block is None:
+                # Evicted while the run was being assembled, re-fetch just this block
+                self.fetch_blocks(index, index)
+                block = self._blocks[index]
+            chunks.append(block)
+
+        data = b''.join(chunks)
+        start = self.position - first * self.block_size
+        data = data[start:start + (end - self.position)]
+        self.position = end
+        return data
+
+    def stats(self):
+        return {
+            'objectSize': self.size,
+            'bytesRead': self.bytesRead,
+            'requests': self.requests,
+            'cacheHits': self.cacheHits,
+            'readRatio': round(self.bytesRead / self.size, 4) if self.size else 0
+        }
+
+_library = None
+_library_lock = threading.Lock()
+
+# Load libmediainfo through pymediainfo and declare the buffer API it does not expose
+def get_library():
+    global _library
+    with _library_lock:
+        if _library is None:
+            lib, handle, lib_version_str, lib_version = MediaInfo._get_library()
+            lib.MediaInfo_Close(handle)
+            lib.MediaInfo_Delete(handle)
+
+            lib.MediaInfo_Open_Buffer_Init.argtypes = [ctypes.c_void_p, ctypes.c_uint64, ctypes.c_uint64]
+            lib.MediaInfo_Open_Buffer_Init.restype = ctypes.c_size_t
+            lib.MediaInfo_Open_Buffer_Continue.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t]
+            lib.MediaInfo_Open_Buffer_Continue.restype = ctypes.c_size_t
+            lib.MediaInfo_Open_Buffer_Continue_GoTo_Get.argtypes = [ctypes.c_void_p]
+            lib.MediaInfo_Open_Buffer_Continue_GoTo_Get.restype = ctypes.c_uint64
+            lib.MediaInfo_Open_Buffer_Finalize.argtypes = [ctypes.c_void_p]
+            lib.MediaInfo_Open_Buffer_Finalize.restype = ctypes.c_size_t
+            _library = (lib, lib_version)
+        return _library
+
+def probe(reader, max_bytes=MAX_PROBE_BYTES, feed_size=FEED_SIZE, parse_speed=0.5):
+    """
+    Run MediaInfo over a RangedS3Reader, following the seeks MediaInfo asks for
+    instead of streaming the whole object. Returns a pymediainfo MediaInfo.
+    """
+    lib, lib_version = get_library()
+    reader.prefetch()
+
+    handle = lib.MediaInfo_New()
+    try:
+        # Same output options MediaInfo.parse uses by default
+        lib.MediaInfo_Option(handle, "Inform", "OLDXML" if lib_version >= (17, 10) else "XML")
+        if lib_version >= (18, 3):
+            lib.MediaInfo_Option(handle, "Cover_Data", "")
+        lib.MediaInfo_Option(handle, "CharSet", "UTF-8")
+        lib.MediaInfo_Option(handle, "Complete", "1")
+        lib.MediaInfo_Option(handle, "ParseSpeed", str(parse_speed))
+
+        reader.seek(0)
+        lib.MediaInfo_Open_Buffer_Init(handle, reader.size, 0)
+        fed = 0
+        while fed < max_bytes:
+            data = reader.read(feed_size)
+            if not data:
+                break
+            fed += len(data)
+
+            status = lib.MediaInfo_Open_Buffer_Continue(handle, data, len(data))
+            if status & STATUS_FINISHED:
+                break
+
+            seek = lib.MediaInfo_Open_Buffer_Continue_GoTo_Get(handle)
+            if seek != NO_SEEK:
+                reader.seek(seek)
+                lib.MediaInfo_Open_Buffer_Init(handle, reader.size, seek)
+        else:
+            print("Probe of s3://{}/{} stopped after {} bytes".format(reader.bucket, reader.key, fed))
+
+        lib.MediaInfo_Open_Buffer_Finalize(handle)
+        info = lib.MediaInfo_Inform(handle, 0)
+    finally:
+        lib.MediaInfo_Close(handle)
+        lib.MediaInfo_Delete(handle)
+
+    return MediaInfo(info)
@@ -0,0 +1,230 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+# Cold-start benchmark for the MAPSRequestProcessing API.
+#
+#   python3 benchmarks/cold_start.py [--runs 5] [--route "GET /config"] [--json cold-start.json]
+#
+# Every run starts a fresh interpreter, imports the Chalice app and sends one request to one
+# route, so the numbers match a Lambda cold start followed by its first invocation. AWS is
+# stubbed below botocore: clients, request signing and response parsing are real, but no
+# request leaves the process. Needs boto3 installed; no credentials or network are used.
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+APP_DIR = os.path.join(ROOT, 'amplify', 'backend', 'function', 'MAPSRequestProcessing', 'src')
+LAYER_DIR = os.path.join(ROOT, 'amplify', 'backend', 'function', 'MAPSCommonLayer', 'opt', 'python')
+
+BUCKET = 'maps-bench-media'
+USER = 'bench-user'
+
+ENVIRONMENT = {
+    'ENV': 'bench',
+    'REGION': 'us-east-1',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'AKIABENCHMARK',
+    'AWS_SECRET_ACCESS_KEY': 'benchmark',
+    'AWS_EC2_METADATA_DISABLED': 'true',
+    'PERMISSIONS_DB_TABLE': 'MAPSFolderPermissions-bench',
+    'ACTIVE_DB_TABLE': 'MAPSAssetDetails-bench',
+    'MOVE_JOBS_DB_TABLE': 'MAPSMoveJobs-bench',
+    'MOVE_JOB_FUNCTION': 'mapsmovejobhandler-bench',
+    'FSX_MOUNT': 'Z:',
+    'SSM_OUTPUT_BUCKET': 'maps-bench-ssm',
+    'SSM_OUTPUT_PREFIX': 'ssm/',
+    'COGNITO_USER_POOL': 'arn:aws:cognito-idp:us-east-1:111111111111:userpool/us-east-1_bench'
+}
+
+# route -> (query parameters, path parameters, JSON body)
+ROUTES = {
+    'GET /': ({'bucketName': BUCKET, 'prefix': 'projects/'}, None, None),
+    'GET /bucket': ({'bucketName': BUCKET}, None, None),
+    'GET /config': (None, None, None),
+    'POST /config': (None, None, {'bucket_name': BUCKET}),
+    'GET /object': ({'bucketName': BUCKET, 'key': 'projects/clip.mp4'}, None, None),
+    'POST /objects': (None, None, {'bucketName': BUCKET, 'keys': ['projects/clip.mp4', 'projects/other.mp4']}),
+    'GET /user/groups': (None, None, None),
+    'GET /folder/permissions': ({'bucketName': BUCKET, 'folderKey': 'projects/'}, None, None),
+    'POST /folder': (None, None, {'bucketName': BUCKET, 'key': 'projects/new/'}),
+    'POST /upload': (None, None, {'bucketName': BUCKET, 'key': 'projects/clip.mp4', 'fileSize': 64 * 1024 ** 2, 'contentType': 'video/mp4'}),
+    'POST /download': (None, None, {'bucketName': BUCKET, 'key': 'projects/clip.mp4', 'readOnly': True}),
+    'POST /delete': (None, None, {'bucketName': BUCKET, 'key': 'projects/clip.mp4'}),
+    'POST /rename': (None, None, {'bucketName': BUCKET, 'keys': [{'key': 'projects/clip.mp4'}], 'newPrefix': 'archive/'}),
+    'GET /rename/{job_id}': (None, {'job_id': 'bench-job'}, None)
+}
+
+# Minimal successful responses for operations whose callers need more than an empty body
+JSON_RESPONSES = {
+    'ssm.GetParameter': {'Parameter': {'Name': 'maps-bucket-bench', 'Type': 'String', 'Value': BUCKET}},
+    'dynamodb.Query': {'Items': [], 'Count': 0, 'ScannedCount': 0},
+    'dynamodb.BatchGetItem': {'Responses': {}, 'UnprocessedKeys': {}},
+    'cognito-identity-provider.AdminListGroupsForUser': {'Groups': [{'GroupName': 'admin'}]},
+    'cognito-identity-provider.ListGroups': {'Groups': [{'GroupName': 'admin'}]}
+}
+S3_RESPONSES = {
+    'ListObjectsV2': '<ListBucketResult><Name>{}</Name><KeyCount>0</KeyCount><IsTruncated>false</IsTruncated></ListBucketResult>'.format(BUCKET),
+    'ListBuckets': '<ListAllMyBucketsResult><Buckets><Bucket><Name>{}</Name></Bucket></Buckets></ListAllMyBucketsResult>'.format(BUCKET),
+    'GetObjectAcl': '<AccessControlPolicy><AccessControlList></AccessControlList></AccessControlPolicy>',
+    'GetBucketCors': '<CORSConfiguration><CORSRule><AllowedHeader>*</AllowedHeader><AllowedMethod>PUT</AllowedMethod><AllowedMethod>HEAD</AllowedMethod><AllowedOrigin>*</AllowedOrigin></CORSRule></CORSConfiguration>',
+    'CreateMultipartUpload': '<InitiateMultipartUploadResult><Bucket>{}</Bucket><UploadId>bench-upload</UploadId></InitiateMultipartUploadResult>'.format(BUCKET),
+    'ListParts': '<ListPartsResult><IsTruncated>false</IsTruncated></ListPartsResult>'
+}
+
+class _Body:
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+    def read(self, *args, **kwargs):
+        body, self.body = self.body, b''
+        return body
+
+def stub_aws(calls, clients):
+    """Answer every AWS request in process and record the calls and the clients created."""
+    import boto3
+    from botocore.awsrequest import AWSResponse
+
+    def respond(request, event_name, **kwargs):
+        service, operation = event_name.split('.')[1:3]
+        calls.append('{}.{}'.format(service, operation))
+        status = 200
+        if service == 's3':
+            body = S3_RESPONSES.get(operation, '')
+        elif service == 'ec2':
+            body = '<{0}Response xmlns="http://ec2.amazonaws.com/doc/2016-11-15/"></{0}Response>'.format(operation)
+        elif service == 'lambda' and operation == 'Invoke':
+            status, body = 202, ''
+        else:
+            body = json.dumps(JSON_RESPONSES.get('{}.{}'.format(service, operation), {}))
+        return AWSResponse(request.url, status, {}, _Body(body.encode('utf-8')))
+
+    def created(event_name, **kwargs):
+        clients.append(event_name.split('.', 1)[1])
+
+    boto3.setup_default_session()
+    boto3.DEFAULT_SESSION.events.register('before-send', respond)
+    boto3.DEFAULT_SESSION.events.register('creating-client-class', created)
+
+def api_event(route):
+    method, path = route.split(' ', 1)
+    query, path_params, body = ROUTES[route]
+    return {
+        'resource': path,
+        'path': path,
+        'httpMethod': method,
+        'headers': {'content-type': 'application/json'},
+        'multiValueQueryStringParameters': {k: [v] for k, v in query.items()} if query else None,
+        'pathParameters': path_params,
+        'stageVariables': None,
+        'requestContext': {
+            'resourcePath': path,
+            'httpMethod': method,
+            'requestId': 'bench',
+            'identity': {'sourceIp': '127.0.0.1'},
+            'authorizer': {'claims': {'cognito:username': USER, 'cognito:groups': 'admin'}}
+        },
+        'body': json.dumps(body) if body is not None else None,
+        'isBase64Encoded': False
+    }
+
+def run_child(route):
+    """Time one cold start in this interpreter and print the result as JSON."""
+    start = time.perf_counter()
+    calls = []
+    clients = []
+    stub_aws(calls, clients)
+    boto3_ms = (time.perf_counter() - start) * 1000
+
+    sys.path[:0] = [APP_DIR, LAYER_DIR]
+    start = time.perf_counter()
+    import app
+    import_ms = (time.perf_counter() - start) * 1000
+    import_clients = list(clients)
+
+    event = api_event(route)
+    start = time.perf_counter()
+    response = app.app(event, None)
+    first_ms = (time.perf_counter() - start) * 1000
+    first_calls = len(calls)
+
+    start = time.perf_counter()
+    app.app(api_event(route), None)
+    warm_ms = (time.perf_counter() - start) * 1000
+
+    print(json.dumps({
+        'route': route,
+        'boto3Ms': boto3_ms,
+        'importMs': import_ms,
+        'firstRequestMs': first_ms,
+        'warmRequestMs': warm_ms,
+        'statusCode': response['statusCode'],
+        'importClients': import_clients,
+        'clients': clients,
+        'awsCalls': calls[:first_calls]
+    }))
+
+def measure(route, runs):
+    env = dict(os.environ, **ENVIRONMENT)
+    results = []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', route],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if proc.returncode != 0:
+            raise RuntimeError('{} failed:\n{}'.format(route, proc.stderr))
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    summary = {'route': route, 'runs': runs}
+    for field in ('boto3Ms', 'importMs', 'firstRequestMs', 'warmRequestMs'):
+        summary[field] = statistics.median(result[field] for result in results)
+    summary['initMs'] = summary['boto3Ms'] + summary['importMs']
+    for field in ('statusCode', 'importClients', 'clients', 'awsCalls'):
+        summary[field] = results[-1][field]
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure MAPSRequestProcessing cold starts per route with stubbed AWS')
+    parser.add_argument('--runs', type=int, default=5, help='cold starts per route, the median is reported')
+    parser.add_argument('--route', action='append', choices=sorted(ROUTES), help='route to measure, repeatable (default: all)')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    results = [measure(route, args.runs) for route in args.route or ROUTES]
+
+    print('{:<24} {:>9} {:>9} {:>9} {:>9} {:>7}  {}'.format('route', 'init ms', 'first ms', 'total ms', 'warm ms', 'status', 'clients'))
+    for result in results:
+        print('{:<24} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>7}  {}'.format(result['route'], result['initMs'], result['firstRequestMs'],
+            result['initMs'] + result['firstRequestMs'], result['warmRequestMs'], result['statusCode'], ','.join(result['clients'])))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'runs': args.runs, 'routes': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+# Seeded synthetic MAPS data for the benchmark suite: a bucket of show and episode
+# folders with their permission rows, and transcoded assets spread across the episodes.
+import random
+from datetime import datetime, timedelta, timezone
+
+BUCKET = 'maps-bench-media'
+ROOT_PREFIX = 'projects/'
+PROFILE = 'proxy_thumbnail'
+GROUPS = ['editors', 'producers', 'vfx', 'colorists']
+USERS = ['bench-user', 'editor-1', 'editor-2', 'producer-1']
+
+# fileStatus of the generated assets and how often each occurs
+FILE_STATUSES = [('S3', 0.7), ('S3_FSX', 0.2), ('S3_DOWNLOADED', 0.1)]
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+class Asset:
+    __slots__ = ('key', 'assetId', 'eTag', 'size', 'status', 'editUser')
+
+    def __init__(self, key, assetId, eTag, size, status, editUser):
+        self.key = key
+        self.assetId = assetId
+        self.eTag = eTag
+        self.size = size
+        self.status = status
+        self.editUser = editUser
+
+    @property
+    def bucketObjKey(self):
+        return '{}/{}'.format(BUCKET, self.key)
+
+class Dataset:
+    """
+    size folders and size assets. There is one show per 100 folders under ROOT_PREFIX,
+    and the remaining folders are episodes of those shows. Assets are spread evenly over
+    the episodes, so a show listing returns about 100 episodes at every size.
+    """
+
+    def __init__(self, size, seed=7):
+        self.size = size
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        showCount = max(1, size // 100)
+        self.shows = ['{}show{:05d}/'.format(ROOT_PREFIX, i) for i in range(showCount)]
+        episodeCount = max(1, size - showCount - 1)
+        self.episodes = ['{}ep{:05d}/'.format(self.shows[i % showCount], i // showCount) for i in range(episodeCount)]
+        self.folders = [ROOT_PREFIX] + self.shows + self.episodes
+        self.permissions = { folder: self._groups() for folder in self.folders }
+        self.permissions[ROOT_PREFIX] = ['admin'] + GROUPS
+
+        self.assets = []
+        for i in range(size):
+            status = self._status()
+            self.assets.append(Asset(
+                key='{}clip{:06d}.mov'.format(self.episodes[i % episodeCount], i),
+                assetId=self.hex(32),
+                eTag=self.hex(32),
+                size=self.rng.randint(50, 4000) * 1024 ** 2,
+                status=status,
+                editUser=self.rng.choice(USERS) if status == 'S3_DOWNLOADED' else ''
+            ))
+
+    def hex(self, digits):
+        return '{:0{}x}'.format(self.rng.getrandbits(digits * 4), digits)
+
+    def _groups(self):
+        return ['admin'] + self.rng.sample(GROUPS, self.rng.randint(1, 2))
+
+    def _status(self):
+        roll = self.rng.random()
+        for status, share in FILE_STATUSES:
+            if roll < share:
+                return status
+            roll -= share
+        return FILE_STATUSES[-1][0]
+
+    def folder_items(self):
+        for folder in self.folders:
+            parent = folder.rstrip('/')
+            yield {
+                'bucket': { 'S': BUCKET },
+                'folderKey': { 'S': folder },
+                'bucketParent': { 'S': '{}:{}'.format(BUCKET, parent[:parent.rfind('/') + 1]) },
+                'permissionGroups': { 'L': [{ 'S': group } for group in self.permissions[folder]] }
+            }
+
+    def asset_items(self):
+        for i, asset in enumerate(self.assets):
+            created = (EPOCH + timedelta(minutes=i)).isoformat()
+            output = 'private/assets/{}/'.format(asset.assetId)
+            yield {
+                'bucketObjKey': { 'S': asset.bucketObjKey },
+                'assetId': { 'S': asset.assetId },
+                'prefixLoc': { 'S': asset.key.rsplit('/', 1)[0] + '/' },
+                'creationDate': { 'S': created },
+                'lastModifiedDate': { 'S': created },
+                'fileSize': { 'N': str(asset.size) },
+                'fileStatus': { 'S': asset.status },
+                'editUser': { 'S': asset.editUser },
+                'thumbnailLoc': { 'S': output + 'thumbnail.0000000.jpg' },
+                'proxyLoc': { 'S': output + 'proxy.mp4' },
+                'videoCodec': { 'S': 'AVC' },
+                'audioCodec': { 'S': 'AAC' },
+                'fileFormat': { 'S': 'MPEG-4' },
+                'fileLength': { 'S': str(10 + i * 37 % 3590) },
+                'frameRate': { 'S': '23.976' },
+                'contentHash': { 'S': 'etag:{}:{}'.format(asset.eTag, asset.size) },
+                'ingestETag': { 'S': asset.eTag },
+                'ingestSize': { 'N': str(asset.size) },
+                'ingestProfile': { 'S': PROFILE },
+                'ingestSequencer': { 'S': '{:032X}'.format(i + 1) }
+            }
@@ -0,0 +1,487 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+# In-memory stand-in for the AWS services the MAPS handlers call.
+#
+# Requests are answered from the before-call botocore event, the same hook botocore's
+# Stubber uses, so clients, parameter validation and request serialization stay real while
+# nothing leaves the process. DynamoDB keeps items in sorted partitions, evaluates key,
+# filter and condition expressions and pages Query results at 1 MB like the service does.
+import io
+import re
+import json
+import time
+import uuid
+import bisect
+import threading
+from collections import Counter
+
+import boto3
+from botocore.awsrequest import AWSResponse
+from botocore.response import StreamingBody
+
+QUERY_PAGE_BYTES = 1024 * 1024
+ITEM_MAX_BYTES = 400 * 1024
+BATCH_GET_LIMIT = 100
+
+class StandInError(Exception):
+    """An AWS error response, raised by the service handlers and returned to botocore."""
+
+    def __init__(self, code, message='', status=400):
+        super().__init__(message or code)
+        self.code = code
+        self.status = status
+
+def scalar(value):
+    """Python value of a DynamoDB attribute value, numbers as floats."""
+    if value is None:
+        return None
+    kind, inner = next(iter(value.items()))
+    if kind == 'N':
+        return float(inner)
+    if kind in ('S', 'B', 'BOOL'):
+        return inner
+    return json.dumps(inner, sort_keys=True)
+
+def item_size(item):
+    return len(json.dumps(item))
+
+def _split(expression, keyword):
+    return [part.strip() for part in re.split(r'\s+{}\s+'.format(keyword), expression, flags=re.IGNORECASE)]
+
+def _name(token, names):
+    return names.get(token, token) if token.startswith('#') else token
+
+def _operand(token, item, names, values):
+    token = token.strip()
+    if token.startswith(':'):
+        return values[token]
+    return item.get(_name(token, names))
+
+def _compare(left, op, right):
+    # A missing attribute only satisfies <>
+    if left is None or right is None:
+        return op == '<>'
+    left, right = scalar(left), scalar(right)
+    return {
+        '=': left == right,
+        '<>': left != right,
+        '<': left < right,
+        '<=': left <= right,
+        '>': left > right,
+        '>=': left >= right
+    }[op]
+
+def evaluate(expression, item, names=None, values=None):
+    """Evaluate a DynamoDB condition without parentheses, AND binding tighter than OR."""
+    names = names or {}
+    values = values or {}
+    return any(all(_term(term, item, names, values) for term in _split(part, 'AND')) for part in _split(expression, 'OR'))
+
+def _term(term, item, names, values):
+    match = re.fullmatch(r'(attribute_exists|attribute_not_exists)\(\s*(\S+?)\s*\)', term)
+    if match:
+        exists = _name(match.group(2), names) in item
+        return exists if match.group(1) == 'attribute_exists' else not exists
+    match = re.fullmatch(r'begins_with\(\s*(\S+?)\s*,\s*(\S+?)\s*\)', term)
+    if match:
+        value = _operand(match.group(1), item, names, values)
+        prefix = _operand(match.group(2), item, names, values)
+        return value is not None and str(scalar(value)).startswith(str(scalar(prefix)))
+    match = re.fullmatch(r'(\S+?)\s*(<>|<=|>=|=|<|>)\s*(\S+)', term)
+    if match:
+        return _compare(_operand(match.group(1), item, names, values), match.group(2), _operand(match.group(3), item, names, values))
+    raise StandInError('ValidationException', 'Unsupported expression: {}'.format(term))
+
+def projection_fields(projection, names):
+    """Attribute names of a projection expression, None to return whole items."""
+    if not projection:
+        return None
+    return [_name(field.strip(), names) for field in projection.split(',')]
+
+def project(item, fields):
+    if fields is None:
+        return dict(item)
+    return { field: item[field] for field in fields if field in item }
+
+class Table:
+    """DynamoDB table with sorted partitions and hash-only global secondary indexes."""
+
+    def __init__(self, name, hash_key, range_key=None, indexes=None):
+        self.name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.items = {}
+        self.sizes = {}
+        self.partitions = {}
+        self._unsorted = set()
+        # index name -> (hash attribute, {hash value: set of item keys})
+        self.indexes = { index: (attribute, {}) for index, attribute in (indexes or {}).items() }
+        self.lock = threading.RLock()
+
+    def key_of(self, item):
+        return (scalar(item.get(self.hash_key)), scalar(item.get(self.range_key)) if self.range_key else None)
+
+    def _index(self, key, item, add):
+        for attribute, entries in self.indexes.values():
+            if attribute in item:
+                keys = entries.setdefault(scalar(item[attribute]), set())
+                if add:
+                    keys.add(key)
+                else:
+                    keys.discard(key)
+
+    def put(self, item):
+        key = self.key_of(item)
+        with self.lock:
+            if key in self.items:
+                self._index(key, self.items[key], False)
+            else:
+                self.partitions.setdefault(key[0], []).append(key[1])
+                self._unsorted.add(key[0])
+            self.items[key] = item
+            self.sizes[key] = item_size(item)
+            self._index(key, item, True)
+
+    def load(self, items):
+        for item in items:
+            self.put(item)
+
+    def delete(self, key):
+        with self.lock:
+            item = self.items.pop(key, None)
+            if item is not None:
+                self.sizes.pop(key)
+                self._index(key, item, False)
+                self.partitions[key[0]].remove(key[1])
+            return item
+
+    def partition(self, hash_value):
+        with self.lock:
+            if hash_value in self._unsorted:
+                self.partitions[hash_value].sort()
+                self._unsorted.discard(hash_value)
+            return self.partitions.get(hash_value, [])
+
+class AppSyncStandIn:
+    """Answers AppSyncClient requests in process, echoing the mutation inputs back."""
+
+    def __init__(self, standin):
+        self.standin = standin
+
+    def install(self, appsync, api_id, url):
+        standin = self.standin
+        client = appsync.AppSyncClient(api_id, url, appsync_client=object())
+
+        def post(body, api_key, idempotent=True):
+            request = json.loads(body)
+            standin.record('appsync.GraphQL')
+            field = re.search(r'\{\s*(\w+)\s*\(', request['query']).group(1)
+            return 200, json.dumps({ 'data': { field: request['variables'].get('in') } })
+
+        client.get_api_key = lambda force_refresh=False: 'bench-api-key'
+        client._post = post
+        appsync._clients[(api_id, url)] = client
+        return client
+
+class AwsStandIn:
+    """
+    In-memory AWS. Every call sleeps latency_ms (or the per-operation override) before it is
+    answered, so handlers that make calls in parallel overlap their waits as they would in Lambda.
+    """
+
+    def __init__(self, latency_ms=0.0, operation_latency_ms=None):
+        self.latency_ms = latency_ms
+        self.operation_latency_ms = operation_latency_ms or {}
+        self.tables = {}
+        self.objects = {}
+        # SSM parameter name -> value, others read as the bench bucket name
+        self.parameters = {}
+        self.responses = {
+            'ec2.DescribeAddresses': lambda params: { 'Addresses': [{ 'PublicIp': ip, 'InstanceId': 'i-0bench' } for ip in params.get('PublicIps', [])] },
+            'ssm.SendCommand': lambda params: { 'Command': { 'CommandId': str(uuid.uuid4()), 'Status': 'Pending' } },
+            'ssm.GetParameter': lambda params: { 'Parameter': { 'Name': params['Name'], 'Type': 'String', 'Value': self.parameters.get(params['Name'], 'maps-bench-media') } },
+            'lambda.Invoke': lambda params: { 'StatusCode': 202, 'Payload': StreamingBody(io.BytesIO(b''), 0) },
+            'mediaconvert.CreateJob': lambda params: { 'Job': { 'Id': str(uuid.uuid4()), 'Status': 'SUBMITTED' } },
+            'cognito-identity-provider.AdminListGroupsForUser': lambda params: { 'Groups': [{ 'GroupName': 'editors' }] },
+            'cognito-identity-provider.ListGroups': lambda params: { 'Groups': [{ 'GroupName': group } for group in ('admin', 'editors')] }
+        }
+        self.calls = Counter()
+        self.call_seconds = 0.0
+        self._lock = threading.Lock()
+
+    # Setup
+
+    def create_table(self, name, hash_key, range_key=None, indexes=None):
+        self.tables[name] = Table(name, hash_key, range_key, indexes)
+        return self.tables[name]
+
+    def put_object(self, bucket, key, body=b'', metadata=None):
+        self.objects[(bucket, key)] = (body, metadata or {})
+
+    def install(self, session=None):
+        """Answer every call made by clients of the session, boto3's default session unless one is given."""
+        if session is None:
+            boto3.setup_default_session()
+            session = boto3.DEFAULT_SESSION
+        session.events.register('before-parameter-build', self._capture_params)
+        session.events.register('before-call', self._respond)
+        return self
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = Counter()
+            self.call_seconds = 0.0
+
+    def record(self, operation, seconds=None):
+        delay = self.operation_latency_ms.get(operation, self.latency_ms) / 1000.0
+        if delay > 0:
+            time.sleep(delay)
+        with self._lock:
+            self.calls[operation] += 1
+            self.call_seconds += delay if seconds is None else seconds + delay
+
+    # botocore hooks
+
+    def _capture_params(self, params, context, **kwargs):
+        context['standInParams'] = params
+
+    def _respond(self, model, context, **kwargs):
+        operation = '{}.{}'.format(model.service_model.service_id.hyphenize(), model.name)
+        start = time.perf_counter()
+        try:
+            handler = getattr(self, '_' + operation.replace('.', '_').replace('-', '_'), None)
+            if handler is not None:
+                parsed = handler(context.get('standInParams', {}))
+            elif operation in self.responses:
+                parsed = self.responses[operation](context.get('standInParams', {}))
+            else:
+                raise StandInError('NotImplemented', 'No stand-in for {}'.format(operation), 501)
+            status = 200
+        except StandInError as e:
+            status = e.status
+            parsed = { 'Error': { 'Code': e.code, 'Message': str(e) } }
+        self.record(operation, time.perf_counter() - start)
+
+        parsed.setdefault('ResponseMetadata', { 'HTTPStatusCode': status, 'RequestId': 'standin' })
+        return AWSResponse('https://standin.local/', status, {}, None), parsed
+
+    # DynamoDB
+
+    def _table(self, name):
+        if name not in self.tables:
+            raise StandInError('ResourceNotFoundException', 'Requested resource not found: Table: {} not found'.format(name))
+        return self.tables[name]
+
+    def _get(self, table, key):
+        return table.items.get(table.key_of(key))
+
+    def _dynamodb_GetItem(self, params):
+        table = self._table(params['TableName'])
+        item = self._get(table, params['Key'])
+        if item is None:
+            return {}
+        projection = params.get('ProjectionExpression') or ','.join(params.get('AttributesToGet', []))
+        return { 'Item': project(item, projection_fields(projection, params.get('ExpressionAttributeNames', {}))) }
+
+    def _check_condition(self, params, item):
+        if 'ConditionExpression' in params and not evaluate(params['ConditionExpression'], item or {},
+                params.get('ExpressionAttributeNames'), params.get('ExpressionAttributeValues')):
+            raise StandInError('ConditionalCheckFailedException', 'The conditional request failed')
+
+    def _dynamodb_PutItem(self, params):
+        table = self._table(params['TableName'])
+        if item_size(params['Item']) > ITEM_MAX_BYTES:
+            raise StandInError('ValidationException', 'Item size has exceeded the maximum allowed size')
+        with table.lock:
+            old = self._get(table, params['Item'])
+            self._check_condition(params, old)
+            table.put(dict(params['Item']))
+        return { 'Attributes': old } if old and params.get('ReturnValues') == 'ALL_OLD' else {}
+
+    def _dynamodb_DeleteItem(self, params):
+        table = self._table(params['TableName'])
+        with table.lock:
+            old = self._get(table, params['Key'])
+            self._check_condition(params, old)
+            table.delete(table.key_of(params['Key']))
+        return { 'Attributes': old } if old and params.get('ReturnValues') == 'ALL_OLD' else {}
+
+    def _dynamodb_UpdateItem(self, params):
+        table = self._table(params['TableName'])
+        names = params.get('ExpressionAttributeNames', {})
+        values = params.get('ExpressionAttributeValues', {})
+        with table.lock:
+            old = self._get(table, params['Key'])
+            self._check_condition(params, old)
+            item = dict(old or params['Key'])
+            apply_update(item, params.get('UpdateExpression', ''), names, values)
+            table.put(item)
+        if params.get('ReturnValues') == 'ALL_OLD':
+            return { 'Attributes': old or {} }
+        if params.get('ReturnValues') in ('ALL_NEW', 'UPDATED_NEW'):
+            return { 'Attributes': item }
+        return {}
+
+    def _dynamodb_BatchGetItem(self, params):
+        responses = {}
+        if sum(len(request['Keys']) for request in params['RequestItems'].values()) > BATCH_GET_LIMIT:
+            raise StandInError('ValidationException', 'Too many items requested for the BatchGetItem call')
+        for name, request in params['RequestItems'].items():
+            table = self._table(name)
+            fields = projection_fields(request.get('ProjectionExpression'), request.get('ExpressionAttributeNames', {}))
+            found = [self._get(table, key) for key in request['Keys']]
+            responses[name] = [project(item, fields) for item in found if item is not None]
+        return { 'Responses': responses, 'UnprocessedKeys': {} }
+
+    def _dynamodb_Query(self, params):
+        table = self._table(params['TableName'])
+        names = params.get('ExpressionAttributeNames', {})
+        values = params.get('ExpressionAttributeValues', {})
+
+        hashValue = None
+        rangeTerms = []
+        for term in _split(params['KeyConditionExpression'], 'AND'):
+            match = re.fullmatch(r'(\S+?)\s*=\s*(:\w+)', term)
+            if hashValue is None and match and _name(match.group(1), names) in (table.hash_key, *(a for a, _ in table.indexes.values())):
+                hashValue = scalar(values[match.group(2)])
+            else:
+                rangeTerms.append(term)
+
+        startKey = table.key_of(params['ExclusiveStartKey']) if 'ExclusiveStartKey' in params else None
+        prefix = None
+        with table.lock:
+            if 'IndexName' in params:
+                keys = sorted(table.indexes[params['IndexName']][1].get(hashValue, ()), key=str)
+                if startKey is not None:
+                    keys = keys[keys.index(startKey) + 1:]
+            else:
+                # Seek to the first candidate instead of walking the partition from the start
+                ranges = table.partition(hashValue)
+                start = 0
+                prefix = re.fullmatch(r'begins_with\(\s*\S+?\s*,\s*(:\w+)\s*\)', rangeTerms[0]) if rangeTerms else None
+                if prefix:
+                    start = bisect.bisect_left(ranges, scalar(values[prefix.group(1)]))
+                if startKey is not None:
+                    start = max(start, bisect.bisect_right(ranges, startKey[1]))
+                keys = ((hashValue, ranges[position]) for position in range(start, len(ranges)))
+
+            limit = params.get('Limit')
+            fields = projection_fields(params.get('ProjectionExpression'), names)
+            items = []
+            scanned = 0
+            pageBytes = 0
+            lastKey = None
+            more = False
+            for key in keys:
+                item = table.items[key]
+                if rangeTerms and not all(_term(term, item, names, values) for term in rangeTerms):
+                    if prefix:
+                        break
+                    continue
+                if pageBytes >= QUERY_PAGE_BYTES or (limit is not None and scanned >= limit):
+                    more = True
+                    break
+                scanned += 1
+                pageBytes += table.sizes[key]
+                lastKey = key
+                if 'FilterExpression' in params and not evaluate(params['FilterExpression'], item, names, values):
+                    continue
+                items.append(project(item, fields))
+
+        response = { 'Items': items, 'Count': len(items), 'ScannedCount': scanned }
+        if more:
+            item = table.items[lastKey]
+            response['LastEvaluatedKey'] = { attribute: item[attribute] for attribute in (table.hash_key, table.range_key) if attribute }
+        return response
+
+    # S3
+
+    def _object(self, params):
+        found = self.objects.get((params['Bucket'], params['Key']))
+        if found is None:
+            raise StandInError('NoSuchKey', 'The specified key does not exist.', 404)
+        return found
+
+    def _s3_GetObject(self, params):
+        body, metadata = self._object(params)
+        if 'Range' in params:
+            start, end = params['Range'][len('bytes='):].split('-')
+            body = body[int(start):int(end) + 1]
+        return { 'Body': StreamingBody(io.BytesIO(body), len(body)), 'ContentLength': len(body), 'Metadata': metadata }
+
+    def _s3_HeadObject(self, params):
+        try:
+            body, metadata = self._object(params)
+        except StandInError as e:
+            raise StandInError('404', 'Not Found', 404) from e
+        return { 'ContentLength': len(body), 'Metadata': metadata }
+
+    def _s3_GetObjectAcl(self, params):
+        self._object(params)
+        return { 'Grants': [] }
+
+def _split_top_level(text):
+    parts, depth, current = [], 0, ''
+    for char in text:
+        depth += char == '('
+        depth -= char == ')'
+        if char == ',' and depth == 0:
+            parts.append(current.strip())
+            current = ''
+        else:
+            current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+def apply_update(item, expression, names, values):
+    """Apply the SET, ADD and REMOVE clauses of an update expression to an item."""
+    clauses = re.split(r'\b(SET|ADD|REMOVE)\b', expression, flags=re.IGNORECASE)
+    for action, body in zip(clauses[1::2], clauses[2::2]):
+        action = action.upper()
+        for part in _split_top_level(body):
+            if action == 'REMOVE':
+                item.pop(_name(part, names), None)
+            elif action == 'ADD':
+                field, token = part.split()
+                field = _name(field, names)
+                current = float(item[field]['N']) if field in item else 0
+                item[field] = { 'N': _number(current + float(values[token]['N'])) }
+            else:
+                field, value = [side.strip() for side in part.split('=', 1)]
+                item[_name(field, names)] = _update_value(value, item, names, values)
+
+def _update_value(value, item, names, values):
+    match = re.fullmatch(r'if_not_exists\(\s*(\S+?)\s*,\s*(\S+?)\s*\)', value)
+    if match:
+        current = _operand(match.group(1), item, names, values)
+        return current if current is not None else values[match.group(2)]
+    match = re.fullmatch(r'list_append\(\s*(\S+?)\s*,\s*(\S+?)\s*\)', value)
+    if match:
+        first = _operand(match.group(1), item, names, values) or { 'L': [] }
+        second = _operand(match.group(2), item, names, values) or { 'L': [] }
+        return { 'L': first['L'] + second['L'] }
+    match = re.fullmatch(r'(\S+?)\s*([+-])\s*(\S+)', value)
+    if match:
+        left = float(_operand(match.group(1), item, names, values)['N'])
+        right = float(_operand(match.group(3), item, names, values)['N'])
+        return { 'N': _number(left + right if match.group(2) == '+' else left - right) }
+    return _operand(value, item, names, values)
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else str(value)
@@ -0,0 +1,348 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+# Offline benchmark suite for the MAPS handlers.
+#
+#   python3 benchmarks/suite.py [--size 1000 --size 10000] [--scenario list_root] [--latency-ms 1]
+#   python3 benchmarks/suite.py --update-baseline
+#
+# Every (scenario, size) pair runs in a fresh interpreter that loads a seeded synthetic dataset
+# into the in-memory AWS stand-in (standin.py), imports the handler and sends it one warm-up
+# request followed by --repeat timed requests. The report lists the median wall time, the AWS
+# calls per request and the peak memory allocated by one request. The run fails when a result
+# regresses against benchmarks/baseline.json. Needs boto3; no credentials or network are used.
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import statistics
+import subprocess
+import tracemalloc
+
+import datasets
+from cold_start import ENVIRONMENT, LAYER_DIR, USER
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+FUNCTION_DIR = os.path.join(ROOT, 'amplify', 'backend', 'function')
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+SIZES = [1000, 10000, 100000]
+
+# Request shapes, fixed across dataset sizes so only the data grows
+MOVE_KEYS = 50
+INGEST_MESSAGES = 10
+STATUS_LINES = 200
+RESOLVER_LOOKUPS = 100
+
+# Allowed growth over the baseline before a result counts as a regression. Wall time and
+# memory must also grow by more than the absolute slack, which keeps tiny results from flapping.
+TIME_TOLERANCE = 0.5
+TIME_SLACK_MS = 5.0
+MEMORY_TOLERANCE = 0.25
+MEMORY_SLACK_KB = 64
+
+# Most AWS calls a request may make at any dataset size, whatever the baseline holds. A resolver
+# lookup is answered from the folder snapshot, or with one GetItem when the bucket is too large to load.
+CALL_LIMITS = {
+    'resolver': RESOLVER_LOOKUPS
+}
+
+GQL_API_ID = 'benchapi'
+GQL_URL = 'https://bench.appsync-api.us-east-1.amazonaws.com/graphql'
+ASSET_TABLE = ENVIRONMENT['ACTIVE_DB_TABLE']
+PERMISSIONS_TABLE = ENVIRONMENT['PERMISSIONS_DB_TABLE']
+
+INGEST_ENVIRONMENT = {
+    'AWS_REGION': ENVIRONMENT['REGION'],
+    'MEDIA_CONVERT_ROLE': 'arn:aws:iam::111111111111:role/maps-bench-mediaconvert',
+    'OUTPUT_BUCKET': 'maps-bench-output',
+    'TRACKING_DB_TABLE': ASSET_TABLE,
+    'MEDIACONVERT_ENDPOINT': 'https://bench.mediaconvert.us-east-1.amazonaws.com',
+    'GQL_API_ID': GQL_API_ID,
+    'GQL_URL': GQL_URL
+}
+
+def api_context():
+    return {
+        'authorizer': { 'claims': { 'cognito:username': USER, 'cognito:groups': 'admin,editors' } },
+        'identity': { 'sourceIp': '203.0.113.10' }
+    }
+
+def load_tables(standin, data):
+    standin.create_table(PERMISSIONS_TABLE, 'bucket', 'folderKey', indexes={ 'byParent': 'bucketParent' }).load(data.folder_items())
+    standin.create_table(ASSET_TABLE, 'bucketObjKey', indexes={ 'byContentHash': 'contentHash' }).load(data.asset_items())
+    standin.create_table(ENVIRONMENT['MOVE_JOBS_DB_TABLE'], 'jobId')
+
+# Scenarios. Each takes the dataset, the stand-in and the number of requests that will be
+# sent, and returns a function that sends request i.
+
+def list_folders(prefixes):
+    def setup(data, standin, count):
+        load_tables(standin, data)
+        import s3_handler
+        return lambda i: s3_handler.get_s3_ddb_data(datasets.BUCKET, None, prefixes(data)[i % len(prefixes(data))], api_context())
+    return setup
+
+def setup_rename_move(data, standin, count):
+    load_tables(standin, data)
+    import ddb_handler
+    rng = data.rng
+
+    def request(i):
+        keys = [{ 'key': asset.key } for asset in rng.sample(data.assets, min(MOVE_KEYS, len(data.assets)))]
+        keys.append({ 'key': rng.choice(data.episodes) })
+        body = { 'bucketName': datasets.BUCKET, 'keys': keys, 'newPrefix': rng.choice(data.shows) }
+        return ddb_handler.handle_rename_move_req(body, api_context())
+    return request
+
+def setup_fsx_move(data, standin, count):
+    load_tables(standin, data)
+    import ddb_handler
+    rng = data.rng
+
+    def request(i):
+        keys = [{ 'key': asset.key } for asset in rng.sample(data.assets, min(MOVE_KEYS, len(data.assets)))]
+        body = { 'bucketName': datasets.BUCKET, 'keys': keys, 'moveType': 'fsx' }
+        return ddb_handler.handle_fsx_move_req(body, api_context(), None)
+    return request
+
+def s3_record(key, size, eTag, sequencer):
+    return {
+        'eventTime': '2024-01-01T00:00:00.000Z',
+        's3': {
+            'bucket': { 'name': datasets.BUCKET },
+            'object': { 'key': key, 'size': size, 'eTag': eTag, 'sequencer': sequencer }
+        }
+    }
+
+def setup_ingest_batch(data, standin, count):
+    load_tables(standin, data)
+    import lambda_function
+    from maps_common import appsync
+    rng = data.rng
+    standin.appsync.install(appsync, GQL_API_ID, GQL_URL)
+
+    # Per batch: new uploads, copies of transcoded content, re-uploads of existing assets and a new folder
+    def request(i):
+        sequencer = '{:X}'.format((1 << 64) + i * INGEST_MESSAGES)
+        records = []
+        for j in range(INGEST_MESSAGES):
+            episode = rng.choice(data.episodes)
+            if j == 0:
+                folder = '{}batch{:05d}/'.format(episode, i)
+                standin.put_object(datasets.BUCKET, folder, metadata={ 'owner': USER })
+                records.append(s3_record(folder, 0, '', sequencer + str(j)))
+            elif j < 4:
+                source = rng.choice(data.assets)
+                records.append(s3_record('{}copy{:05d}-{}.mov'.format(episode, i, j), source.size, source.eTag, sequencer + str(j)))
+            elif j < 5:
+                source = rng.choice(data.assets)
+                records.append(s3_record(source.key, source.size, data.hex(32), sequencer + str(j)))
+            else:
+                records.append(s3_record('{}upload{:05d}-{}.mov'.format(episode, i, j), rng.randint(50, 4000) * 1024 ** 2, data.hex(32), sequencer + str(j)))
+
+        event = { 'Records': [{ 'messageId': 'msg-{}-{}'.format(i, j), 'body': json.dumps({ 'Records': [record] }) } for j, record in enumerate(records)] }
+        return lambda_function.lambda_handler(event, None)
+    return request
+
+def setup_fsx_status(data, standin, count):
+    import lambda_function
+    from maps_common import appsync
+    rng = data.rng
+    standin.appsync.install(appsync, GQL_API_ID, GQL_URL)
+
+    # MoveMedia.ps1 output, alternating between moves to FSx, with aws s3 cp progress lines, and moves back
+    for i in range(count):
+        lines = []
+        for asset in rng.sample(data.assets, min(STATUS_LINES, len(data.assets))):
+            if i % 2 == 0:
+                lines.append('Completed {0} MiB/{0} MiB with 1 file(s) remaining'.format(asset.size >> 20))
+                lines.append('download: s3://{}/{} to .\\Media\\{}'.format(datasets.BUCKET, asset.key, asset.key.split('/')[-1]))
+            else:
+                lines.append('upload s3://{}/{}'.format(datasets.BUCKET, asset.key))
+        key = '{}/cmd-{:05d}/i-0bench/awsrunPowerShellScript/0.awsrunPowerShellScript/stdout'.format(ENVIRONMENT['SSM_OUTPUT_PREFIX'], i)
+        standin.put_object(ENVIRONMENT['SSM_OUTPUT_BUCKET'], key, '\n'.join(lines).encode('utf-8'))
+
+    def request(i):
+        event = {
+            'detail': { 'status': 'Success', 'command-id': 'cmd-{:05d}'.format(i) },
+            'resources': ['arn:aws:ec2:us-east-1:111111111111:instance/i-0bench']
+        }
+        return lambda_function.lambda_handler(event, None)
+    return request
+
+def setup_resolver(data, standin, count):
+    standin.create_table(PERMISSIONS_TABLE, 'bucket', 'folderKey', indexes={ 'byParent': 'bucketParent' }).load(data.folder_items())
+    import lambda_function
+    rng = data.rng
+
+    # One request is a burst of listings in random folders, as users browse the bucket
+    def request(i):
+        for _ in range(RESOLVER_LOOKUPS):
+            lambda_function.lambda_handler({
+                'identity': { 'claims': { 'cognito:groups': ['editors'] } },
+                'arguments': { 'filter': { 'bucketObjKey': { 'contains': datasets.BUCKET }, 'prefixLoc': { 'eq': rng.choice(data.folders) } } }
+            }, None)
+    return request
+
+# scenario -> (function directory, extra environment, setup)
+SCENARIOS = {
+    'list_root': ('MAPSRequestProcessing', {}, list_folders(lambda data: [datasets.ROOT_PREFIX])),
+    'list_show': ('MAPSRequestProcessing', {}, list_folders(lambda data: data.shows)),
+    'rename_move': ('MAPSRequestProcessing', {}, setup_rename_move),
+    'fsx_move': ('MAPSRequestProcessing', {}, setup_fsx_move),
+    'ingest_batch': ('mapsmediaconvertstartjob', INGEST_ENVIRONMENT, setup_ingest_batch),
+    'fsx_status': ('mapsfsxstatushandler', { 'GQL_API_ID': GQL_API_ID, 'GQL_URL': GQL_URL }, setup_fsx_status),
+    'resolver': ('MAPSLambdaResolver', {}, setup_resolver)
+}
+
+def run_child(scenario, size, repeat, latency_ms):
+    """Benchmark one scenario at one size in this interpreter and print the result as JSON."""
+    import standin as aws
+    function, _, setup = SCENARIOS[scenario]
+    standin = aws.AwsStandIn(latency_ms).install()
+    standin.appsync = aws.AppSyncStandIn(standin)
+    sys.path[:0] = [os.path.join(FUNCTION_DIR, function, 'src'), LAYER_DIR]
+    # The datasets carry every index attribute, as after scripts/maps_index_backfill.py
+    from maps_common import prefix_index
+    standin.parameters[prefix_index.ready_parameter()] = prefix_index.READY_VALUE
+
+    start = time.perf_counter()
+    data = datasets.Dataset(size)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        request = setup(data, standin, repeat + 2)
+    setup_s = time.perf_counter() - start
+
+    times = []
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        # The first request also pays for client creation and cache fills
+        request(0)
+        standin.reset_stats()
+        for i in range(1, repeat + 1):
+            start = time.perf_counter()
+            request(i)
+            times.append((time.perf_counter() - start) * 1000)
+        calls, call_seconds = dict(standin.calls), standin.call_seconds
+
+        tracemalloc.start()
+        request(repeat + 1)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    print(json.dumps({
+        'scenario': scenario,
+        'size': size,
+        'setupS': setup_s,
+        'wallMs': statistics.median(times),
+        'awsCalls': sum(calls.values()) / repeat,
+        'awsMs': call_seconds * 1000 / repeat,
+        'operations': { operation: count / repeat for operation, count in sorted(calls.items()) },
+        'peakKb': peak / 1024
+    }))
+
+def measure(scenario, size, repeat, latency_ms):
+    function, environment, _ = SCENARIOS[scenario]
+    env = dict(os.environ, **ENVIRONMENT, **environment)
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', scenario, '--size', str(size),
+        '--repeat', str(repeat), '--latency-ms', str(latency_ms)],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if proc.returncode != 0:
+        raise RuntimeError('{} at {} failed:\n{}'.format(scenario, size, proc.stderr))
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def regressions(result, baseline):
+    """Descriptions of every way result is worse than its baseline entry."""
+    found = []
+    if result['awsCalls'] > baseline['awsCalls'] + 0.01:
+        found.append('AWS calls {:.1f} -> {:.1f}'.format(baseline['awsCalls'], result['awsCalls']))
+    if result['wallMs'] > baseline['wallMs'] * (1 + TIME_TOLERANCE) + TIME_SLACK_MS:
+        found.append('wall time {:.1f} ms -> {:.1f} ms'.format(baseline['wallMs'], result['wallMs']))
+    if result['peakKb'] > baseline['peakKb'] * (1 + MEMORY_TOLERANCE) + MEMORY_SLACK_KB:
+        found.append('peak memory {:.0f} KiB -> {:.0f} KiB'.format(baseline['peakKb'], result['peakKb']))
+    return found
+
+def over_limit(result):
+    """Description of how result exceeds its scenario's call limit, or None."""
+    limit = CALL_LIMITS.get(result['scenario'])
+    if limit is not None and result['awsCalls'] > limit:
+        return 'AWS calls {:.1f} over the limit of {}'.format(result['awsCalls'], limit)
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the MAPS handlers against in-memory AWS and synthetic data')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='scenario to run, repeatable (default: all)')
+    parser.add_argument('--size', action='append', type=int, help='folders and assets in the dataset, repeatable (default: {})'.format(SIZES))
+    parser.add_argument('--repeat', type=int, default=5, help='timed requests per scenario, the median is reported')
+    parser.add_argument('--latency-ms', type=float, default=1.0, help='time each AWS call takes in the stand-in')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file to compare against')
+    parser.add_argument('--update-baseline', action='store_true', help='record these results as the new baseline')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.size[0], args.repeat, args.latency_ms)
+        return
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            recorded = json.load(f)
+        if recorded['latencyMs'] != args.latency_ms:
+            parser.error('the baseline was recorded with --latency-ms {}'.format(recorded['latencyMs']))
+        baseline = { (result['scenario'], result['size']): result for result in recorded['results'] }
+
+    print('{:<14} {:>7} {:>10} {:>10} {:>9} {:>10}  {}'.format('scenario', 'size', 'wall ms', 'aws calls', 'aws ms', 'peak KiB', 'vs baseline'))
+    results = []
+    failed = []
+    for scenario in args.scenario or SCENARIOS:
+        for size in args.size or SIZES:
+            result = measure(scenario, size, args.repeat, args.latency_ms)
+            results.append(result)
+
+            entry = baseline.get((scenario, size))
+            found = regressions(result, entry) if entry is not None else []
+            limit = over_limit(result)
+            if limit:
+                found.append(limit)
+            if found:
+                verdict = 'REGRESSED: ' + ', '.join(found)
+                failed.append((scenario, size))
+            elif entry is None:
+                verdict = 'new' if baseline else ''
+            else:
+                verdict = 'ok'
+            print('{:<14} {:>7} {:>10.1f} {:>10.1f} {:>9.1f} {:>10.0f}  {}'.format(scenario, size, result['wallMs'],
+                result['awsCalls'], result['awsMs'], result['peakKb'], verdict), flush=True)
+
+    output = { 'python': sys.version.split()[0], 'repeat': args.repeat, 'latencyMs': args.latency_ms, 'results': results }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(output, f, indent=2)
+    if args.update_baseline and not failed:
+        with open(args.baseline, 'w') as f:
+            json.dump(output, f, indent=2)
+            f.write('\n')
+
+    if failed:
+        print('{} of {} results regressed against {}'.format(len(failed), len(results), args.baseline))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+# Backfill MAPS asset and folder permission rows for objects that already exist in a bucket,
+# and queue a transcode for every asset through the MediaConvert start job queue.
+#
+#   python3 scripts/maps_backfill.py --bucket <bucket> --asset-table <MAPSAssetDetails table> \
+#       --permissions-table <MAPSFolderPermissions table> --queue-url <MAPS queue url>
+#
+# Progress is checkpointed per listing page, so an interrupted run resumes with the same command.
+# Pages are processed at least once; mapsmediaconvertstartjob drops repeated transcode events.
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from datetime import timezone
+from urllib.parse import quote_plus
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import boto3
+from botocore.config import Config
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'amplify', 'backend', 'function', 'MAPSCommonLayer', 'opt', 'python'))
+from maps_common import appsync, prefix_index
+
+BATCH_WRITE_LIMIT = 25
+BATCH_GET_LIMIT = 100
+SQS_BATCH_LIMIT = 10
+MAX_RETRIES = 8
+
+class RateLimiter:
+    """Token bucket shared by all shard workers."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, count):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= count:
+                    self.tokens -= count
+                    return
+                wait = (count - self.tokens) / self.rate
+            time.sleep(wait)
+
+class Checkpoint:
+    """Listing position and counters per shard, rewritten atomically after every page."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = { 'shards': None, 'progress': {}, 'counts': {} }
+        if os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+
+    def shard(self, prefix):
+        return self.state['progress'].setdefault(prefix, { 'token': None, 'done': False })
+
+    def advance(self, prefix, token, counts):
+        with self.lock:
+            progress = self.shard(prefix)
+            progress['token'] = token
+            progress['done'] = token is None
+            for name, value in counts.items():
+                self.state['counts'][name] = self.state['counts'].get(name, 0) + value
+            self._save()
+
+    def set_shards(self, shards):
+        with self.lock:
+            self.state['shards'] = shards
+            self._save()
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp, self.path)
+
+def discover_shards(s3_client, bucket, prefix, depth):
+    """
+    Split the bucket into listing shards along '/' boundaries. Objects directly under a
+    prefix form a 'flat' shard listed with a delimiter, everything deeper is listed recursively.
+    """
+    shards = [{ 'prefix': prefix, 'flat': True }]
+    folders = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+        folders.extend(cp['Prefix'] for cp in page.get('CommonPrefixes', []))
+
+    for folder in folders:
+        if depth > 1:
+            shards.extend(discover_shards(s3_client, bucket, folder, depth - 1))
+        else:
+            shards.append({ 'prefix': folder, 'flat': False })
+    return shards
+
+def shard_id(shard):
+    return ('flat:' if shard['flat'] else 'tree:') + shard['prefix']
+
+# Same attributes appsync_create and the createMAPSAssets resolver write
+def asset_item(bucket, obj, assetId):
+    key = obj['Key']
+    prefixLoc = appsync.get_prefix_loc(key)
+    modified = obj['LastModified'].astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    return {
+        'bucketObjKey': { 'S': '{}/{}'.format(bucket, key) },
+        'assetId': { 'S': assetId },
+        'creationDate': { 'S': modified },
+        'lastModifiedDate': { 'S': modified },
+        'fileSize': { 'N': str(obj['Size']) },
+        'fileStatus': { 'S': 'S3' },
+        'editUser': { 'S': '' },
+        'prefixLoc': { 'S': prefixLoc },
+        'objName': { 'S': key.rsplit('/', 1)[-1] },
+        'bucketPrefixLoc': { 'S': '{}:{}'.format(bucket, prefixLoc) }
+    }
+
+# Same attributes the folder branch of mapsmediaconvertstartjob writes
+def permission_item(bucket, folderKey, groups):
+    return {
+        'bucket': { 'S': bucket },
+        'folderKey': { 'S': folderKey },
+        'bucketParent': { 'S': prefix_index.parent_key(bucket, folderKey) },
+        'permissionGroups': { 'L': [{ 'S': group } for group in groups] }
+    }
+
+# S3 event notification body as mapsmediaconvertstartjob receives it from the queue
+def s3_event(bucket, obj):
+    return json.dumps({
+        'Records': [{
+            'eventSource': 'aws:s3',
+            'eventName': 'ObjectCreated:Backfill',
+            'eventTime': obj['LastModified'].astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z',
+            's3': {
+                'bucket': { 'name': bucket },
+                'object': { 'key': quote_plus(obj['Key'], safe='/'), 'size': obj['Size'], 'eTag': obj['ETag'].strip('"') }
+            }
+        }]
+    })
+
+def has_ingested(item):
+    return 'ingestETag' in item or item.get('proxyLoc', { 'S': '' }).get('S', '') != ''
+
+def folders_of(key):
+    parts = key.split('/')[:-1]
+    return ['/'.join(parts[:i]) + '/' for i in range(1, len(parts) + 1)]
+
+class Backfill:
+
+    def __init__(self, args):
+        config = Config(max_pool_connections=args.workers * 2, retries={ 'max_attempts': 10, 'mode': 'adaptive' })
+        session = boto3.session.Session(region_name=args.region)
+        self.s3_client = session.client('s3', config=config)
+        self.ddb_client = session.client('dynamodb', config=config)
+        self.sqs_client = session.client('sqs', config=config)
+        self.args = args
+        self.checkpoint = Checkpoint(args.checkpoint)
+        self.limiter = RateLimiter(args.rate)
+        self.folders_lock = threading.Lock()
+        self.known_folders = None
+
+    def load_known_folders(self):
+        # Existing permission rows are kept, folder owners may have edited them
+        folders = set()
+        paginator = self.ddb_client.get_paginator('query')
+        for page in paginator.paginate(
+                TableName=self.args.permissions_table,
+                KeyConditionExpression='#bucket = :bucket',
+                ExpressionAttributeNames={ '#bucket': 'bucket' },
+                ExpressionAttributeValues={ ':bucket': { 'S': self.args.bucket } },
+                ProjectionExpression='folderKey'):
+            folders.update(item['folderKey']['S'] for item in page['Items'])
+        self.known_folders = folders
+
+    def claim_folders(self, folderKeys):
+        with self.folders_lock:
+            new = sorted(set(folderKeys) - self.known_folders)
+            self.known_folders.update(new)
+        return new
+
+    def existing_assets(self, bucketObjKeys):
+        found = {}
+        for i in range(0, len(bucketObjKeys), BATCH_GET_LIMIT):
+            request = { self.args.asset_table: {
+                'Keys': [{ 'bucketObjKey': { 'S': k } } for k in bucketObjKeys[i:i + BATCH_GET_LIMIT]],
+                'ProjectionExpression': 'bucketObjKey, ingestETag, proxyLoc'
+            } }
+            for attempt in range(MAX_RETRIES):
+                resp = self.ddb_client.batch_get_item(RequestItems=request)
+                found.update((item['bucketObjKey']['S'], item) for item in resp['Responses'].get(self.args.asset_table, []))
+                request = resp.get('UnprocessedKeys')
+                if not request:
+                    break
+                time.sleep(min(2 ** attempt * 0.05, 5))
+            else:
+                raise RuntimeError('BatchGetItem left keys unprocessed after {} attempts'.format(MAX_RETRIES))
+        return found
+
+    def batch_write(self, table, items):
+        for i in range(0, len(items), BATCH_WRITE_LIMIT):
+            request = { table: [{ 'PutRequest': { 'Item': item } } for item in items[i:i + BATCH_WRITE_LIMIT]] }
+            for attempt in range(MAX_RETRIES):
+                resp = self.ddb_client.batch_write_item(RequestItems=request)
+                request = resp.get('UnprocessedItems')
+                if not request:
+                    break
+                time.sleep(min(2 ** attempt * 0.05, 5))
+            else:
+                raise RuntimeError('BatchWriteItem left items unprocessed after {} attempts'.format(MAX_RETRIES))
+
+    def queue_transcodes(self, objs):
+        attributes = { 'profile': { 'DataType': 'String', 'StringValue': self.args.profile } } if self.args.profile else {}
+        for i in range(0, len(objs), SQS_BATCH_LIMIT):
+            entries = [{
+                'Id': str(n),
+                'MessageBody': s3_event(self.args.bucket, obj),
+                'MessageAttributes': attributes
+            } for n, obj in enumerate(objs[i:i + SQS_BATCH_LIMIT])]
+            self.limiter.acquire(len(entries))
+
+            for attempt in range(MAX_RETRIES):
+                resp = self.sqs_client.send_message_batch(QueueUrl=self.args.queue_url, Entries=entries)
+                failed = { f['Id'] for f in resp.get('Failed', []) }
+                entries = [e for e in entries if e['Id'] in failed]
+                if not entries:
+                    break
+                time.sleep(min(2 ** attempt * 0.05, 5))
+            else:
+                raise RuntimeError('SendMessageBatch failed for {} messages'.format(len(entries)))
+
+    def process_page(self, objs):
+        bucket = self.args.bucket
+        folderKeys = [obj['Key'] for obj in objs if obj['Key'].endswith('/')]
+        files = [obj for obj in objs if not obj['Key'].endswith('/')]
+        for obj in files:
+            folderKeys.extend(folders_of(obj['Key']))
+
+        newFolders = self.claim_folders(folderKeys)
+        self.batch_write(self.args.permissions_table, [permission_item(bucket, f, self.args.groups) for f in newFolders])
+
+        existing = self.existing_assets(['{}/{}'.format(bucket, obj['Key']) for obj in files])
+        newFiles = [obj for obj in files if '{}/{}'.format(bucket, obj['Key']) not in existing]
+        self.batch_write(self.args.asset_table, [asset_item(bucket, obj, str(uuid.uuid4())) for obj in newFiles])
+
+        # Rows written by an interrupted run have neither an ingest claim nor outputs yet
+        pending = [obj for obj in files if not has_ingested(existing.get('{}/{}'.format(bucket, obj['Key']), {}))]
+        if self.args.queue_url:
+            self.queue_transcodes(pending)
+
+        return { 'objects': len(objs), 'folders': len(newFolders), 'assets': len(newFiles),
+            'existingAssets': len(existing), 'queued': len(pending) if self.args.queue_url else 0 }
+
+    def run_shard(self, shard):
+        sid = shard_id(shard)
+        progress = self.checkpoint.shard(sid)
+        if progress['done']:
+            return
+
+        kwargs = { 'Bucket': self.args.bucket, 'Prefix': shard['prefix'], 'MaxKeys': 1000 }
+        if shard['flat']:
+            kwargs['Delimiter'] = '/'
+        token = progress['token']
+        while True:
+            if token:
+                kwargs['ContinuationToken'] = token
+            page = self.s3_client.list_objects_v2(**kwargs)
+            counts = self.process_page(page.get('Contents', []))
+            token = page.get('NextContinuationToken') if page.get('IsTruncated') else None
+            self.checkpoint.advance(sid, token, counts)
+            if token is None:
+                return
+
+    def run(self):
+        shards = self.checkpoint.state['shards']
+        if shards is None:
+            shards = discover_shards(self.s3_client, self.args.bucket, self.args.prefix, self.args.shard_depth)
+            self.checkpoint.set_shards(shards)
+        self.load_known_folders()
+        print('Backfilling s3://{}/{} in {} shards'.format(self.args.bucket, self.args.prefix, len(shards)))
+
+        start = time.time()
+        failed = 0
+        with ThreadPoolExecutor(max_workers=self.args.workers) as executor:
+            futures = { executor.submit(self.run_shard, shard): shard_id(shard) for shard in shards }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    print('Shard {} failed, rerun to resume it: {}'.format(futures[future], e))
+
+        print(json.dumps({ 'elapsedSeconds': round(time.time() - start, 1), 'failedShards': failed,
+            **self.checkpoint.state['counts'] }))
+        return 1 if failed else 0
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Backfill MAPS rows and transcodes for existing S3 objects.')
+    parser.add_argument('--bucket', required=True)
+    parser.add_argument('--prefix', default='', help='only backfill keys under this prefix (ending in /)')
+    parser.add_argument('--asset-table', required=True, help='MAPSAssetDetails table name')
+    parser.add_argument('--permissions-table', required=True, help='MAPSFolderPermissions table name')
+    parser.add_argument('--queue-url', help='MediaConvert start job queue, transcodes are skipped when omitted')
+    parser.add_argument('--profile', help='MediaConvert profile sent as the profile message attribute')
+    parser.add_argument('--groups', nargs='+', default=['admin'], help='permission groups for new folders')
+    parser.add_argument('--rate', type=float, default=20, help='transcode messages queued per second, 0 for unlimited')
+    parser.add_argument('--workers', type=int, default=16, help='shards listed in parallel')
+    parser.add_argument('--shard-depth', type=int, default=2, help='folder levels used to split the listing')
+    parser.add_argument('--checkpoint', help='checkpoint file, defaults to .maps-backfill-<bucket>.json')
+    parser.add_argument('--region')
+    args = parser.parse_args(argv)
+    # The folder branch of mapsmediaconvertstartjob always grants admin
+    args.groups = ['admin'] + [group for group in args.groups if group != 'admin']
+    if args.checkpoint is None:
+        args.checkpoint = '.maps-backfill-{}.json'.format(args.bucket)
+    return args
+
+if __name__ == '__main__':
+    sys.exit(Backfill(parse_args(sys.argv[1:])).run())
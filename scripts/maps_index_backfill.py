@@ -0,0 +1,190 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+# Index asset and folder permission rows written before the byPrefixLoc and byParent indexes
+# existed, then mark the indexes ready.
+#
+#   python3 scripts/maps_index_backfill.py --asset-table <MAPSAssetDetails table> \
+#       --permissions-table <MAPSFolderPermissions table> --env <amplify env>
+#
+# The asset table is scanned in parallel segments, the permission table in one more. Each row without
+# its index attributes gets them with an UpdateItem that touches only those attributes, so concurrent
+# writers are not overwritten. Progress is checkpointed per scan page; rerun the same command to resume.
+# Once every segment has finished, the maps-prefix-index-<env> parameter is set and folder listings and
+# folder deletes switch to the indexes.
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'amplify', 'backend', 'function', 'MAPSCommonLayer', 'opt', 'python'))
+from maps_common import appsync, prefix_index
+from maps_backfill import Checkpoint, RateLimiter
+
+def index_attributes(item):
+    """bucketPrefixLoc and objName the create and update resolvers would write for the row."""
+    bucketObjKey = item['bucketObjKey']['S']
+    bucket, key = bucketObjKey.split('/', 1)
+    prefixLoc = item['prefixLoc']['S'] if 'prefixLoc' in item else appsync.get_prefix_loc(key)
+    return prefixLoc, prefix_index.index_key(bucket, prefixLoc), prefix_index.object_name(key)
+
+def is_indexed(item):
+    _, bucketPrefixLoc, objName = index_attributes(item)
+    return item.get('bucketPrefixLoc', {}).get('S') == bucketPrefixLoc and item.get('objName', {}).get('S') == objName
+
+def is_folder_indexed(item):
+    return item.get('bucketParent', {}).get('S') == prefix_index.parent_key(item['bucket']['S'], item['folderKey']['S'])
+
+# Checkpoint shard of the permission table scan, next to the asset table segments
+PERMISSIONS_SHARD = 'permissions'
+
+class IndexBackfill:
+
+    def __init__(self, args):
+        config = Config(max_pool_connections=args.segments * 2, retries={ 'max_attempts': 10, 'mode': 'adaptive' })
+        session = boto3.session.Session(region_name=args.region)
+        self.ddb_client = session.client('dynamodb', config=config)
+        self.ssm_client = session.client('ssm', config=config)
+        self.args = args
+        self.checkpoint = Checkpoint(args.checkpoint)
+        self.limiter = RateLimiter(args.rate)
+
+    def index_row(self, item):
+        prefixLoc, bucketPrefixLoc, objName = index_attributes(item)
+        self.limiter.acquire(1)
+        try:
+            self.ddb_client.update_item(
+                TableName=self.args.asset_table,
+                Key={ 'bucketObjKey': item['bucketObjKey'] },
+                UpdateExpression='SET bucketPrefixLoc = :loc, objName = :name, prefixLoc = if_not_exists(prefixLoc, :prefix)',
+                ConditionExpression='attribute_exists(bucketObjKey)',
+                ExpressionAttributeValues={
+                    ':loc': { 'S': bucketPrefixLoc },
+                    ':name': { 'S': objName },
+                    ':prefix': { 'S': prefixLoc }
+                }
+            )
+        except ClientError as e:
+            # The row was deleted since it was scanned
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise e
+            return False
+        return True
+
+    def index_folder(self, item):
+        self.limiter.acquire(1)
+        try:
+            self.ddb_client.update_item(
+                TableName=self.args.permissions_table,
+                Key={ 'bucket': item['bucket'], 'folderKey': item['folderKey'] },
+                UpdateExpression='SET bucketParent = :parent',
+                ConditionExpression='attribute_exists(folderKey)',
+                ExpressionAttributeValues={
+                    ':parent': { 'S': prefix_index.parent_key(item['bucket']['S'], item['folderKey']['S']) }
+                }
+            )
+        except ClientError as e:
+            # The folder was deleted since it was scanned
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise e
+            return False
+        return True
+
+    def run_segment(self, segment):
+        if segment == PERMISSIONS_SHARD:
+            self.scan(PERMISSIONS_SHARD, {
+                'TableName': self.args.permissions_table,
+                'ProjectionExpression': '#buck, folderKey, bucketParent',
+                'ExpressionAttributeNames': { '#buck': 'bucket' }
+            }, is_folder_indexed, self.index_folder, 'foldersIndexed')
+            return
+
+        self.scan('segment:{}'.format(segment), {
+            'TableName': self.args.asset_table,
+            'Segment': segment,
+            'TotalSegments': len([shard for shard in self.checkpoint.state['shards'] if shard != PERMISSIONS_SHARD]),
+            'ProjectionExpression': 'bucketObjKey, prefixLoc, bucketPrefixLoc, objName'
+        }, is_indexed, self.index_row, 'indexed')
+
+    def scan(self, sid, kwargs, indexed, index, counter):
+        progress = self.checkpoint.shard(sid)
+        if progress['done']:
+            return
+
+        token = progress['token']
+        while True:
+            if token:
+                kwargs['ExclusiveStartKey'] = token
+            page = self.ddb_client.scan(**kwargs)
+            pending = [item for item in page['Items'] if not indexed(item)]
+            updated = sum(1 for item in pending if index(item))
+            token = page.get('LastEvaluatedKey')
+            self.checkpoint.advance(sid, token, { 'scanned': len(page['Items']), counter: updated })
+            if token is None:
+                return
+
+    def run(self):
+        if self.checkpoint.state['shards'] is None:
+            self.checkpoint.set_shards(list(range(self.args.segments)) + [PERMISSIONS_SHARD])
+        elif PERMISSIONS_SHARD not in self.checkpoint.state['shards']:
+            # Checkpoints written before folder rows were indexed
+            self.checkpoint.set_shards(self.checkpoint.state['shards'] + [PERMISSIONS_SHARD])
+        segments = self.checkpoint.state['shards']
+        print('Indexing {} and {} in {} segments'.format(self.args.asset_table, self.args.permissions_table, len(segments)))
+
+        start = time.time()
+        failed = 0
+        with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+            futures = { executor.submit(self.run_segment, segment): segment for segment in segments }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    print('Segment {} failed, rerun to resume it: {}'.format(futures[future], e))
+
+        if not failed:
+            parameter = prefix_index.ready_parameter(self.args.env)
+            self.ssm_client.put_parameter(Name=parameter, Value=prefix_index.READY_VALUE, Type='String', Overwrite=True)
+            print('Every row is indexed, set {} to {}'.format(parameter, prefix_index.READY_VALUE))
+
+        print(json.dumps({ 'elapsedSeconds': round(time.time() - start, 1), 'failedSegments': failed,
+            **self.checkpoint.state['counts'] }))
+        return 1 if failed else 0
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Index existing MAPS asset and folder rows for folder listings.')
+    parser.add_argument('--asset-table', required=True, help='MAPSAssetDetails table name')
+    parser.add_argument('--permissions-table', required=True, help='MAPSFolderPermissions table name')
+    parser.add_argument('--env', required=True, help='Amplify environment name the functions run in')
+    parser.add_argument('--segments', type=int, default=8, help='parallel scan segments')
+    parser.add_argument('--rate', type=float, default=200, help='row updates per second, 0 for unlimited')
+    parser.add_argument('--checkpoint', help='checkpoint file, defaults to .maps-index-backfill-<table>.json')
+    parser.add_argument('--region')
+    args = parser.parse_args(argv)
+    if args.checkpoint is None:
+        args.checkpoint = '.maps-index-backfill-{}.json'.format(args.asset_table)
+    return args
+
+if __name__ == '__main__':
+    sys.exit(IndexBackfill(parse_args(sys.argv[1:])).run())
@@ -33,7 +33,7 @@ import ExpandMoreIcon from '@material-ui/icons/ExpandMore';
 import AudiotrackIcon from '@material-ui/icons/Audiotrack';
 import Tooltip from '@material-ui/core/Tooltip';
 
-import { GetObjectInfo } from '../Utilities/APIInterface';
+import { GetObjectInfo, GetAssetObjectUrls } from '../Utilities/APIInterface';
 import { getBucketKey, formattedDuration } from '../Utilities/FormatUtil';
 
 import moment from 'moment';
@@ -76,6 +76,7 @@ function CardAsset(props) {
     const [expanded, setExpanded] = useState(false);
     const [open, setOpen] = useState(false);
     const [videoUrl, setVideoUrl] = useState('');
+    const [proxyUrl, setProxyUrl] = useState(null);
     const [thumbnailUrl, setThumbnailUrl] = useState(
         sessionStorage.getItem(`${title}_jpg`) || react_logo
     );
@@ -89,7 +90,10 @@ function CardAsset(props) {
     };
 
     const handleMediaClick = (event) => {
-        if (details.hasOwnProperty('proxyLoc')) {
+        if (proxyUrl !== null) {
+            setOpen(true);
+            setVideoUrl(proxyUrl);
+        } else if (details.hasOwnProperty('proxyLoc')) {
             if (details.proxyLoc !== null) {
                 const { bucket, key } = getBucketKey(details.proxyLoc);
                 GetObjectInfo(bucket, key)
@@ -130,10 +134,16 @@ function CardAsset(props) {
         if (tempImgLoc === react_logo || expired) {
             if (details.hasOwnProperty('thumbnailLoc')) {
                 if (details.thumbnailLoc !== null) {
-                    const { bucket, key } = getBucketKey(details.thumbnailLoc);
-                    GetObjectInfo(bucket, key)
-                    .then((response) => {
-                        setThumbnailUrl(response.data.body.objUrl);
+                    // Signed together with the other cards on the page, proxy included
+                    const { bucket, key } = getBucketKey(details.bucketObjKey);
+                    GetAssetObjectUrls(bucket, key)
+                    .then((urls) => {
+                        if (urls.thumbnailLoc) {
+                            setThumbnailUrl(urls.thumbnailLoc);
+                        }
+                        if (urls.proxyLoc) {
+                            setProxyUrl(urls.proxyLoc);
+                        }
                     })
                     .catch((err) => {
                         console.log(err);
@@ -20,8 +20,7 @@ import AWS from 'aws-sdk';
 import { saveAs } from 'file-saver';
 import awsmobile from '../../aws-exports';
 
-import { deleteMAPSAssets, createMAPSAssets } from '../../graphql/mutations';
-import { getMAPSAssets } from '../../graphql/queries';
+import { deleteMAPSAssets } from '../../graphql/mutations';
 
 Amplify.configure(awsmobile);
 const apiName = "MAPSFrontEndAPI";
@@ -110,7 +109,7 @@ async function CheckOutObjectRequest(bucketName, key, readOnly, alertHandler) {
     });
 };
 
-async function UploadObjRequest(bucketName, key, version) {
+async function UploadObjRequest(bucketName, key, version, file, uploadId) {
     const auth = await Auth.currentSession();
     let queryParams = "";
     queryParams = {
@@ -118,7 +117,10 @@ async function UploadObjRequest(bucketName, key, version) {
             body: {
                 bucketName: bucketName,
                 key: key,
-                versionId: version
+                versionId: version,
+                fileSize: file.size,
+                contentType: file.type,
+                uploadId: uploadId
         },
         response: true
     };
@@ -126,9 +128,36 @@ async function UploadObjRequest(bucketName, key, version) {
   return API.post(apiName, "/upload", queryParams);
 };
 
-async function RenameMoveObjRequest(bucketName, keys, newPrefix, alertHandler) {
+async function GetUploadPartUrls(bucketName, key, uploadId, partNumbers) {
+    const auth = await Auth.currentSession();
+    return API.post(apiName, "/upload/parts", {
+        headers: {Authorization: auth.idToken.jwtToken},
+        body: {
+            bucketName: bucketName,
+            key: key,
+            uploadId: uploadId,
+            partNumbers: partNumbers
+        },
+        response: true
+    });
+};
+
+async function CompleteUploadRequest(bucketName, key, uploadId, partCount) {
+    const auth = await Auth.currentSession();
+    return API.post(apiName, "/upload/complete", {
+        headers: {Authorization: auth.idToken.jwtToken},
+        body: {
+            bucketName: bucketName,
+            key: key,
+            uploadId: uploadId,
+            partCount: partCount
+        },
+        response: true
+    });
+};
+
+async function RenameMoveObjRequest(bucketName, keys, newPrefix, alertHandler, refreshHandler) {
     const auth = await Auth.currentSession();
-    const credentials = await Auth.currentUserCredentials();
     let queryParams = "";
     queryParams = {
         headers: {Authorization: auth.idToken.jwtToken},
@@ -144,52 +173,16 @@ async function RenameMoveObjRequest(bucketName, keys, newPrefix, alertHandler) {
 
     apiPromise
     .then((response) => {
-        AWS.config.credentials = credentials;
-        AWS.config.region = awsmobile['aws_cognito_region'];
+        if (response.data.statusCode === 403) {
+            alertHandler("error", "Error", [`Unable to move/rename: ${response.data.body.reason}`]);
+            return;
+        }
+
         const moveObjs = response.data.body.objects;
         let alertText = [];
         for (const idx in moveObjs) {
             const obj = moveObjs[idx];
-            console.log(obj);
-            if (obj['allowMove']) {
-                var s3 = new AWS.S3();
-                var copyParams = {
-                    Bucket: bucketName,
-                    CopySource: `/${bucketName}/${obj['oldKey']}`,
-                    Key: obj['newKey']
-                };
-
-                var deleteParams = {
-                    Bucket: bucketName, 
-                    Key: obj['oldKey']
-                };
-
-                s3.copyObject(copyParams).promise()
-                .then((copyRes) => {
-                    s3.deleteObject(deleteParams);
-                    const oldObject = { 
-                        input: { 
-                            bucketObjKey: `${bucketName}/${obj['oldKey']}` 
-                        } 
-                    };
-
-                    API.graphql(graphqlOperation(getMAPSAssets, oldObject['input']))
-                    .then((getObjRes) => {
-                        let createObj = getObjRes.data.getMAPSAssets;
-                        createObj['bucketObjKey'] = `${bucketName}/${obj['newKey']}`;
-                        createObj['prefixLoc'] = newPrefix === '' ? '/' : newPrefix;
-
-                        API.graphql(graphqlOperation(createMAPSAssets, { input: createObj }));
-                        API.graphql(graphqlOperation(deleteMAPSAssets, oldObject));
-                    })
-                    .catch((getObjErr) => {
-                        console.log("Something bad happened in object get", getObjErr);
-                    });
-                })
-                .catch((copyErr) => {
-                    console.log('Copy failed: ', copyErr);
-                });
-            } else {
+            if (!obj['allowMove']) {
                 alertText.push(`Unable to move/rename ${obj['oldKey']}: ${obj['reason']}`)
             }
         };
@@ -197,12 +190,53 @@ async function RenameMoveObjRequest(bucketName, keys, newPrefix, alertHandler) {
         if (alertText.length > 0) {
             alertHandler("error", "Error", alertText);
         }
+
+        // The copy runs server side, poll the job until it finishes
+        const jobId = response.data.body.jobId;
+        if (jobId) {
+            WaitForMoveJob(jobId, alertHandler, refreshHandler);
+        }
     })
     .catch((error) => {
         alertHandler("error", "Error", ["An unexpected error occurred."]);
     });
 };
 
+const moveJobPollInterval = 5000;
+
+async function GetMoveJob(jobId) {
+    const auth = await Auth.currentSession();
+    return API.get(apiName, `/rename/${jobId}`, {
+        headers: {Authorization: auth.idToken.jwtToken},
+        response: true
+    });
+};
+
+// The job rewrites asset rows directly in DynamoDB, which publishes no subscription
+// events, so the view is reloaded once the job is done
+function WaitForMoveJob(jobId, alertHandler, refreshHandler) {
+    GetMoveJob(jobId)
+    .then((response) => {
+        const job = response.data.body;
+        if (job['status'] === 'PENDING' || job['status'] === 'RUNNING') {
+            setTimeout(() => WaitForMoveJob(jobId, alertHandler, refreshHandler), moveJobPollInterval);
+            return;
+        }
+
+        if (refreshHandler) {
+            refreshHandler();
+        }
+        if (job['status'] === 'COMPLETE_WITH_ERRORS') {
+            alertHandler("error", "Error", [`${job['objectsFailed']} file(s) could not be moved.`].concat(job['errors']));
+        } else if (job['status'] !== 'COMPLETE') {
+            alertHandler("error", "Error", [`Move failed: ${job['reason']}`]);
+        }
+    })
+    .catch((error) => {
+        console.log('Unable to get move job status: ', error);
+    });
+};
+
 async function MoveToFsxRequest(bucketName, keys, alertHandler, moveType) {
     const auth = await Auth.currentSession();
     const credentials = await Auth.currentUserCredentials();
@@ -292,6 +326,71 @@ async function GetObjectInfo(bucketName, key) {
   });
 };
 
+// Thumbnail and proxy URLs asked for within the same few milliseconds
+// are signed together by one /objects request
+const objectUrlBatchDelay = 20;
+// Must not exceed OBJECTS_BATCH_LIMIT in s3_handler.py, larger requests are refused
+const objectUrlBatchLimit = 500;
+let pendingObjectUrls = {};
+let objectUrlTimer = null;
+
+function GetAssetObjectUrls(bucketName, key) {
+  return new Promise((resolve, reject) => {
+    const pending = pendingObjectUrls[bucketName] = pendingObjectUrls[bucketName] || {};
+    (pending[key] = pending[key] || []).push({ resolve: resolve, reject: reject });
+    if (objectUrlTimer === null) {
+      objectUrlTimer = setTimeout(flushObjectUrlRequests, objectUrlBatchDelay);
+    }
+  });
+};
+
+async function flushObjectUrlRequests() {
+  const batches = pendingObjectUrls;
+  pendingObjectUrls = {};
+  objectUrlTimer = null;
+
+  const settle = (bucketName, keys, settler) => {
+    keys.forEach((key) => batches[bucketName][key].forEach(settler(key)));
+  };
+
+  let auth = null;
+  try {
+    auth = await Auth.currentSession();
+  } catch (error) {
+    for (const bucketName in batches) {
+      settle(bucketName, Object.keys(batches[bucketName]), () => (waiter) => waiter.reject(error));
+    }
+    return;
+  }
+
+  for (const bucketName in batches) {
+    const keys = Object.keys(batches[bucketName]);
+    for (let i = 0; i < keys.length; i += objectUrlBatchLimit) {
+      const chunk = keys.slice(i, i + objectUrlBatchLimit);
+      API.post(apiName, "/objects", {
+        headers: {Authorization: auth.idToken.jwtToken},
+        body: {
+          bucketName: bucketName,
+          keys: chunk
+        },
+        response: true
+      })
+      .then((response) => {
+        if (response.data.statusCode !== 200) {
+          const error = new Error(response.data.body.reason);
+          settle(bucketName, chunk, () => (waiter) => waiter.reject(error));
+          return;
+        }
+        const objects = response.data.body.objects;
+        settle(bucketName, chunk, (key) => (waiter) => waiter.resolve(objects[key] || {}));
+      })
+      .catch((error) => {
+        settle(bucketName, chunk, () => (waiter) => waiter.reject(error));
+      });
+    }
+  }
+};
+
 const ProcessAdminOperations = (bucketName, keys, operation) => {
   Auth.currentSession()
   .then((auth) => {
@@ -387,14 +486,18 @@ async function GetUserGroups() {
 
 export {
   UploadObjRequest,
+  GetUploadPartUrls,
+  CompleteUploadRequest,
   DeleteObjectRequest,
   GetBucketFolders,
   ValidateBucket,
   GetObjectInfo,
+  GetAssetObjectUrls,
   ProcessAdminOperations,
   CheckOutObjectRequest,
   CreateFolder,
   RenameMoveObjRequest,
+  GetMoveJob,
   MoveToFsxRequest,
   GetFolderPermissions,
   UpdateFolderPermissions,
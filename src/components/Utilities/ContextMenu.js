@@ -27,7 +27,7 @@ import { RenameMoveObjRequest, MoveToFsxRequest } from '../Utilities/APIInterfac
 function ContextMenu(props) {
     const bucketName = useSelector(state => state.mapsConfig.bucket);
     const [folderSelectOpen, setFolderSelectOpen] = useState(false);
-    const { menuState, closeHandler, selectedAssets, unselectAssetHandler, alertHandler } = props;
+    const { menuState, closeHandler, selectedAssets, unselectAssetHandler, alertHandler, refreshHandler } = props;
 
     const handleClose = () => {
         closeHandler();
@@ -49,7 +49,7 @@ function ContextMenu(props) {
     const moveFilesHandler = (newPrefix) => {
         console.log(selectedAssets);
         console.log("New Prefix: ", newPrefix);
-        RenameMoveObjRequest(bucketName, selectedAssets, newPrefix, alertHandler);
+        RenameMoveObjRequest(bucketName, selectedAssets, newPrefix, alertHandler, refreshHandler);
         handleFolderSelectClose();
     };
 
@@ -18,9 +18,6 @@
 import React, { useState } from 'react';
 import { useSelector } from 'react-redux';
 import clsx from 'clsx';
-import AWS from 'aws-sdk';
-import { Auth } from 'aws-amplify';
-import awsmobile from '../../aws-exports';
 
 import Fade from '@material-ui/core/Fade';
 import Dialog from '@material-ui/core/Dialog';
@@ -28,9 +25,13 @@ import DialogContent from '@material-ui/core/DialogContent';
 import Button from '@material-ui/core/Button'
 import { makeStyles } from '@material-ui/core/styles';
 
-import { UploadObjRequest } from './APIInterface';
+import { UploadObjRequest, GetUploadPartUrls, CompleteUploadRequest } from './APIInterface';
 import { LinearProgressWithLabel } from '../Custom/CustomComponents';
 
+// Parts uploaded at once, and attempts per part before the upload is given up
+const uploadConcurrency = 6;
+const partRetries = 3;
+
 const useStyles = makeStyles({
   createJobRoot: {
       display: 'inline',
@@ -162,58 +163,110 @@ function FilePicker(props) {
     }
   };
 
-  const uploadObject = () => {
-    Auth.currentUserCredentials()
-    .then((response) => {
-        AWS.config.credentials = response;
-        AWS.config.region = awsmobile['aws_cognito_region'];
-        var upload = new AWS.S3.ManagedUpload({
-            params: {
-                Bucket: bucketName,
-                Key: `${selectedPrefix}${fileName}`,
-                Body: newFile,
-                ContentDisposition: `attachment; filename=\"${fileName}\"`
-            }
-        });
+  const resetUpload = () => {
+    closeHandler();
+    setInProgress(false);
+    setFileLabel('No File Selected');
+    setFileName(null);
+    setNewFile(null);
+  };
+
+  // Uploads are remembered per file so a failed check-in resumes where it stopped
+  const resumeKey = (key) => `maps-upload:${bucketName}/${key}:${newFile.size}:${newFile.lastModified}`;
+
+  // Send the parts S3 does not have yet straight to S3 in parallel,
+  // then let the API complete the upload
+  const uploadObject = async (key, upload) => {
+    const { uploadId, partSize, partCount } = upload;
+    const partBytes = (partNumber) => Math.min(partSize, newFile.size - (partNumber - 1) * partSize);
+
+    let urls = {};
+    upload.parts.forEach((part) => { urls[part.partNumber] = part.url; });
+
+    let queue = [];
+    for (let partNumber = 1; partNumber <= partCount; partNumber++) {
+      if (!upload.uploadedParts.includes(partNumber)) {
+        queue.push(partNumber);
+      }
+    }
+
+    let uploadedBytes = upload.uploadedParts.reduce((total, partNumber) => total + partBytes(partNumber), 0);
+    const updateProgress = () => {
+      setUploadPercent(newFile.size > 0 ? uploadedBytes * 100 / newFile.size : 100);
+    };
+    updateProgress();
 
-        upload.on('httpUploadProgress', (event) => {
-            setUploadPercent(event.loaded * 100 / event.total);
-        });
+    const partUrl = async (partNumber) => {
+      if (!(partNumber in urls)) {
+        const response = await GetUploadPartUrls(bucketName, key, uploadId, [partNumber].concat(queue.slice(0, 99)));
+        response.data.body.parts.forEach((part) => { urls[part.partNumber] = part.url; });
+      }
+      const url = urls[partNumber];
+      delete urls[partNumber];
+      return url;
+    };
+
+    const uploadPart = async (partNumber) => {
+      const start = (partNumber - 1) * partSize;
+      for (let attempt = 0; ; attempt++) {
+        try {
+          const response = await fetch(await partUrl(partNumber), {
+            method: 'PUT',
+            body: newFile.slice(start, start + partSize)
+          });
+          if (!response.ok) {
+            throw new Error(`Part ${partNumber} failed with status ${response.status}`);
+          }
+          return;
+        } catch (partError) {
+          if (attempt >= partRetries) {
+            throw partError;
+          }
+        }
+      }
+    };
 
-        upload.promise()
-        .then((response) => {
-            closeHandler();
-            setInProgress(false);
-            setFileLabel('No File Selected');
-            setFileName(null);
-            setNewFile(null);
-        })
-        .catch((uploadError) => {
-            console.log('Upload error', uploadError);
-        });
-    })
-    .catch((err) => {
-        console.log('Auth error', err);
-    });
-  }
+    const worker = async () => {
+      while (queue.length > 0) {
+        const partNumber = queue.shift();
+        await uploadPart(partNumber);
+        uploadedBytes += partBytes(partNumber);
+        updateProgress();
+      }
+    };
+
+    await Promise.all(Array.from({ length: uploadConcurrency }, worker));
+
+    const response = await CompleteUploadRequest(bucketName, key, uploadId, partCount);
+    if (!response.data.body['complete']) {
+      throw new Error(response.data.body['reason'] || 'Upload is missing parts.');
+    }
+  };
 
   const handleUpload = () => {
     let fileName = newFile.name;
     let version = -1;
 
     fileName = selectedPrefix+fileName; 
+    const storageKey = resumeKey(fileName);
 
-    UploadObjRequest(bucketName, fileName, version)
+    UploadObjRequest(bucketName, fileName, version, newFile, localStorage.getItem(storageKey))
       .then((response) => {
           if (response.data.body['allowCheckIn']) {
-              uploadObject();
+              localStorage.setItem(storageKey, response.data.body['uploadId']);
+              uploadObject(fileName, response.data.body)
+                .then(() => {
+                    localStorage.removeItem(storageKey);
+                    resetUpload();
+                })
+                .catch((uploadError) => {
+                    console.log('Upload error', uploadError);
+                    alertHandler('error', 'Error', ['The upload was interrupted. Upload the same file again to resume it.']);
+                    resetUpload();
+                });
           } else {
             alertHandler('error', 'Error', [response.data.body['reason']]);
-            closeHandler();
-            setInProgress(false);
-            setFileLabel('No File Selected');
-            setFileName(null);
-            setNewFile(null);
+            resetUpload();
           }
       })
       .catch((error) => {
@@ -27,7 +27,8 @@ import { Alert, AlertTitle } from '@material-ui/lab';
 import Dialog from '@material-ui/core/Dialog';
 
 import { listMAPSAssets } from '../../graphql/queries';
-import { onCreateMAPSAssets, onUpdateMAPSAssets, onDeleteMAPSAssets } from '../../graphql/subscriptions';
+import { onCreateMAPSAssets, onUpdateMAPSAssets, onDeleteMAPSAssets,
+    onBatchCreateMAPSAssets, onBatchUpdateMAPSAssets, onBatchDeleteMAPSAssets } from '../../graphql/subscriptions';
 import { getBucketKey } from '../Utilities/FormatUtil';
 import { GetBucketFolders, GetUserGroups } from '../Utilities/APIInterface';
 import { stableSort, getComparator } from '../Utilities/TableSortUtil';
@@ -52,6 +53,7 @@ export default function MainAssetViewer(props) {
     const [filteredAssets, setFilteredAssets] = useState([]);
 
     const [bucketFolders, setBucketFolders] = useState([]);
+    const [refreshCount, setRefreshCount] = useState(0);
     const [contextMenuState, setContextMenuState] = useState({
         open: false,
         mouseX: null,
@@ -136,6 +138,10 @@ export default function MainAssetViewer(props) {
         setBucketFolders([...bucketFolders, folderObj]);
     };
 
+    const refreshHandler = () => {
+        setRefreshCount(count => count + 1);
+    };
+
     const deleteFolderHandler = (folderName) => {
         setBucketFolders(bucketFolders.filter((item)=>(item.objKey !== folderName)))
     };
@@ -262,7 +268,7 @@ export default function MainAssetViewer(props) {
             listBucketFolders();
             listMediaAssets();
         }
-    }, [bucketName, selectedPrefix]);
+    }, [bucketName, selectedPrefix, refreshCount]);
 
     useEffect(() => {
         async function paginateAssets() {
@@ -385,15 +391,36 @@ export default function MainAssetViewer(props) {
         });
     };
 
+    // Batch mutations publish every written asset in one event
+    function listenForBatchAssets(subscription, fieldName, actionType) {
+        return API.graphql(
+            graphqlOperation(subscription),
+        ).subscribe({
+            next: (((data) => {
+                console.log(data);
+                const assets = data.value.data[fieldName] || [];
+                assets.forEach((asset) => {
+                    dispatch({type: actionType, data: asset});
+                });
+            }))
+        });
+    };
+
     useEffect(() => {
         const updateSub = listenForUpdatedAssets();
         const newSub = listenForNewAssets();
         const delSub = listenForDeletedAssets();
+        const batchUpdateSub = listenForBatchAssets(onBatchUpdateMAPSAssets, 'onBatchUpdateMAPSAssets', 'UPDATE');
+        const batchNewSub = listenForBatchAssets(onBatchCreateMAPSAssets, 'onBatchCreateMAPSAssets', 'NEW');
+        const batchDelSub = listenForBatchAssets(onBatchDeleteMAPSAssets, 'onBatchDeleteMAPSAssets', 'DELETE');
 
         return () => { 
             updateSub.unsubscribe();
             newSub.unsubscribe();
             delSub.unsubscribe();
+            batchUpdateSub.unsubscribe();
+            batchNewSub.unsubscribe();
+            batchDelSub.unsubscribe();
         }
     }, []);
 
@@ -472,6 +499,7 @@ export default function MainAssetViewer(props) {
                 selectedAssets={selectedMediaAssets} 
                 unselectAssetHandler={unselectMediaAssetsHandler}
                 alertHandler={mainAlertHandler}
+                refreshHandler={refreshHandler}
             />
         </>
     );
@@ -82,3 +82,75 @@ export const deleteMAPSAssets = /* GraphQL */ `
     }
   }
 `;
+export const batchCreateMAPSAssets = /* GraphQL */ `
+  mutation BatchCreateMAPSAssets($input: [CreateMAPSAssetsInput!]!) {
+    batchCreateMAPSAssets(input: $input) {
+      bucketObjKey
+      prefixLoc
+      assetId
+      creationDate
+      lastModifiedDate
+      thumbnailLoc
+      proxyLoc
+      fileStatus
+      editUser
+      videoCodec
+      audioCodec
+      fileFormat
+      fileLength
+      frameRate
+      frameCount
+      numAudioTracks
+      numVideoTracks
+      fileSize
+    }
+  }
+`;
+export const batchUpdateMAPSAssets = /* GraphQL */ `
+  mutation BatchUpdateMAPSAssets($input: [UpdateMAPSAssetsInput!]!) {
+    batchUpdateMAPSAssets(input: $input) {
+      bucketObjKey
+      prefixLoc
+      assetId
+      creationDate
+      lastModifiedDate
+      thumbnailLoc
+      proxyLoc
+      fileStatus
+      editUser
+      videoCodec
+      audioCodec
+      fileFormat
+      fileLength
+      frameRate
+      frameCount
+      numAudioTracks
+      numVideoTracks
+      fileSize
+    }
+  }
+`;
+export const batchDeleteMAPSAssets = /* GraphQL */ `
+  mutation BatchDeleteMAPSAssets($input: [DeleteMAPSAssetsInput!]!) {
+    batchDeleteMAPSAssets(input: $input) {
+      bucketObjKey
+      prefixLoc
+      assetId
+      creationDate
+      lastModifiedDate
+      thumbnailLoc
+      proxyLoc
+      fileStatus
+      editUser
+      videoCodec
+      audioCodec
+      fileFormat
+      fileLength
+      frameRate
+      frameCount
+      numAudioTracks
+      numVideoTracks
+      fileSize
+    }
+  }
+`;
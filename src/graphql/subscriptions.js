@@ -73,3 +73,75 @@ export const onDeleteMAPSAssets = /* GraphQL */ `
     }
   }
 `;
+export const onBatchCreateMAPSAssets = /* GraphQL */ `
+  subscription OnBatchCreateMAPSAssets {
+    onBatchCreateMAPSAssets {
+      bucketObjKey
+      prefixLoc
+      assetId
+      creationDate
+      lastModifiedDate
+      thumbnailLoc
+      proxyLoc
+      fileStatus
+      editUser
+      videoCodec
+      audioCodec
+      fileFormat
+      fileLength
+      frameRate
+      frameCount
+      numAudioTracks
+      numVideoTracks
+      fileSize
+    }
+  }
+`;
+export const onBatchUpdateMAPSAssets = /* GraphQL */ `
+  subscription OnBatchUpdateMAPSAssets {
+    onBatchUpdateMAPSAssets {
+      bucketObjKey
+      prefixLoc
+      assetId
+      creationDate
+      lastModifiedDate
+      thumbnailLoc
+      proxyLoc
+      fileStatus
+      editUser
+      videoCodec
+      audioCodec
+      fileFormat
+      fileLength
+      frameRate
+      frameCount
+      numAudioTracks
+      numVideoTracks
+      fileSize
+    }
+  }
+`;
+export const onBatchDeleteMAPSAssets = /* GraphQL */ `
+  subscription OnBatchDeleteMAPSAssets {
+    onBatchDeleteMAPSAssets {
+      bucketObjKey
+      prefixLoc
+      assetId
+      creationDate
+      lastModifiedDate
+      thumbnailLoc
+      proxyLoc
+      fileStatus
+      editUser
+      videoCodec
+      audioCodec
+      fileFormat
+      fileLength
+      frameRate
+      frameCount
+      numAudioTracks
+      numVideoTracks
+      fileSize
+    }
+  }
+`;
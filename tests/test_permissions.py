@@ -0,0 +1,80 @@
+'''
+ * Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ * SPDX-License-Identifier: MIT-0
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ * software and associated documentation files (the "Software"), to deal in the Software
+ * without restriction, including without limitation the rights to use, copy, modify,
+ * merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ * permit persons to whom the Software is furnished to do so.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ * INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ * PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ * HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ * OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ * SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'amplify', 'backend', 'function', 'MAPSCommonLayer', 'opt', 'python'))
+
+from maps_common.permissions import FolderPermissionCache
+
+BUCKET = 'maps-media'
+
+# Permission table rows for one bucket, answering the calls FolderPermissionCache makes
+class PermissionTable:
+    def __init__(self):
+        self.rows = {}
+
+    def put(self, folderKey, groups):
+        self.rows[folderKey] = groups
+
+    def item(self, folderKey):
+        return {
+            'folderKey': { 'S': folderKey },
+            'permissionGroups': { 'L': [{ 'S': group } for group in self.rows[folderKey]] }
+        }
+
+    def query(self, **params):
+        return { 'Items': [self.item(folderKey) for folderKey in sorted(self.rows)] }
+
+    def get_item(self, TableName, Key, AttributesToGet):
+        folderKey = Key['folderKey']['S']
+        if folderKey not in self.rows:
+            return {}
+        return { 'Item': self.item(folderKey) }
+
+    def batch_get_item(self, RequestItems):
+        table, request = next(iter(RequestItems.items()))
+        keys = [key['folderKey']['S'] for key in request['Keys']]
+        return { 'Responses': { table: [self.item(folderKey) for folderKey in keys if folderKey in self.rows] } }
+
+class InvalidateTest(unittest.TestCase):
+    def setUp(self):
+        self.table = PermissionTable()
+        self.table.put('shows/', ['admin', 'editors'])
+        self.cache = FolderPermissionCache('permissions', ddb_client=self.table, snapshot_buckets=True)
+
+    def test_invalidated_folder_is_read_again(self):
+        self.assertIsNone(self.cache.get(BUCKET, 'shows/new/'))
+
+        self.table.put('shows/new/', ['admin'])
+        self.cache.invalidate(BUCKET, 'shows/new/')
+
+        self.assertEqual(self.cache.get(BUCKET, 'shows/new/'), ['admin'])
+
+    def test_invalidated_groups_are_replaced(self):
+        self.assertEqual(self.cache.get(BUCKET, 'shows/'), ['admin', 'editors'])
+
+        self.table.put('shows/', ['admin'])
+        self.cache.invalidate(BUCKET, 'shows/')
+
+        self.assertEqual(self.cache.get(BUCKET, 'shows/'), ['admin'])
+        self.assertEqual(self.cache.get_many(BUCKET, ['shows/']), { 'shows/': ['admin'] })
+
+if __name__ == '__main__':
+    unittest.main()